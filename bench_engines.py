@@ -0,0 +1,159 @@
+# bench_engines.py
+# Compiles a corpus of documents with every installed TeX engine and reports
+# wall time, peak memory and PDF size, to pick the fastest engine per workload.
+#
+#   python bench_engines.py                          # built-in corpus, all engines
+#   python bench_engines.py --engines pdflatex lualatex --repeat 5 paper.tex
+#   python bench_engines.py --json results.json
+#
+# The built-in corpus is the editors' default document, the quick TikZ
+# templates and sn01.tex when it is found (./, ./sn1/). Every run starts in
+# a fresh directory, without the compile cache or precompiled formats.
+# Peak memory comes from os.wait4 and is only reported on POSIX systems.
+
+import os, sys, json, time, shutil, argparse, tempfile, threading, subprocess, statistics
+from pathlib import Path
+
+from latex_compile import (ENGINES, MAX_PASSES, aux_digest, available_engines, get_engine,
+                           kill_process_tree, needs_rerun)
+from latex_templates import DEFAULT_DOCUMENT, TIKZ_TEMPLATES, make_tikz_document
+
+SN01_LOCATIONS = ("sn01.tex", "sn1/sn01.tex")
+
+def default_corpus():
+    """[(name, source text or Path)] of the built-in benchmark documents"""
+    corpus = [("default document", DEFAULT_DOCUMENT)]
+    for name, tikz in TIKZ_TEMPLATES.items():
+        corpus.append((f"tikz: {name}", make_tikz_document(tikz)))
+    here = Path(__file__).resolve().parent
+    for location in SN01_LOCATIONS:
+        for base in (Path.cwd(), here):
+            if (base / location).exists():
+                corpus.append(("sn01.tex", base / location))
+                return corpus
+    return corpus
+
+def _run_pass(args, cwd, timeout):
+    """One engine run; returns (returncode, seconds, peak RSS in bytes or None)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.STDOUT, start_new_session=(os.name == "posix"))
+    timer = threading.Timer(timeout, kill_process_tree, (proc,))
+    timer.daemon = True
+    timer.start()
+    try:
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                               else -os.WTERMSIG(status))
+            # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+            rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        else:
+            proc.wait()
+            rss = None
+    finally:
+        timer.cancel()
+    return proc.returncode, time.perf_counter() - start, rss
+
+def compile_once(engine, source, timeout=300):
+    """Compile source (text or a .tex Path) cold with engine, rerunning like run_latex"""
+    with tempfile.TemporaryDirectory(prefix="bench-") as out:
+        if isinstance(source, Path):
+            tex_file, cwd = source.resolve(), source.resolve().parent
+        else:
+            tex_file, cwd = Path(out) / "document.tex", out
+            tex_file.write_text(source, encoding="utf-8")
+        job = Path(out) / tex_file.stem
+        args = engine.command(tex_file, ["-interaction=nonstopmode"], outdir=out)
+
+        total, peak, runs = 0.0, None, 0
+        while True:
+            before = aux_digest(job.with_suffix(".aux"))
+            returncode, seconds, rss = _run_pass(args, cwd, timeout)
+            runs += 1
+            total += seconds
+            if rss is not None:
+                peak = max(peak or 0, rss)
+            if returncode != 0 or not engine.reruns or runs >= MAX_PASSES:
+                break
+            if not needs_rerun(job.with_suffix(".log"), before, aux_digest(job.with_suffix(".aux"))):
+                break
+        pdf = job.with_suffix(".pdf")
+        return {
+            "ok": returncode == 0 and pdf.exists(),
+            "seconds": total,
+            "passes": runs,
+            "peak_rss": peak,
+            "pdf_bytes": pdf.stat().st_size if pdf.exists() else None,
+        }
+
+def benchmark(engines, corpus, repeat=3, timeout=300):
+    """Results for every (document, engine): the median run of `repeat`"""
+    results = []
+    for doc_name, source in corpus:
+        for name in engines:
+            runs = [compile_once(get_engine(name), source, timeout) for _ in range(repeat)]
+            median = sorted(runs, key=lambda r: r["seconds"])[len(runs) // 2]
+            median.update(document=doc_name, engine=name,
+                          stdev=statistics.pstdev(r["seconds"] for r in runs))
+            results.append(median)
+            status = "ok" if median["ok"] else "FAILED"
+            print(f"  {doc_name:<32} {name:<14} {median['seconds']:7.2f} s  {status}", flush=True)
+    return results
+
+def _mb(value):
+    return f"{value / 2**20:.0f} MB" if value else "-"
+
+def _kb(value):
+    return f"{value / 1024:.1f} KB" if value else "-"
+
+def report(results):
+    print()
+    print(f"{'document':<32} {'engine':<14} {'time':>9} {'passes':>6} {'peak RSS':>9} {'PDF':>9}")
+    for r in results:
+        time_text = f"{r['seconds']:.2f} s" if r["ok"] else "failed"
+        print(f"{r['document']:<32} {r['engine']:<14} {time_text:>9} {r['passes']:>6} "
+              f"{_mb(r['peak_rss']):>9} {_kb(r['pdf_bytes']):>9}")
+
+    print("\nFastest engine per document:")
+    for document in dict.fromkeys(r["document"] for r in results):
+        ok = [r for r in results if r["document"] == document and r["ok"]]
+        if ok:
+            best = min(ok, key=lambda r: r["seconds"])
+            print(f"  {document:<32} {best['engine']} ({best['seconds']:.2f} s)")
+        else:
+            print(f"  {document:<32} no engine compiled it")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare TeX engines on a corpus of documents")
+    parser.add_argument("documents", nargs="*", type=Path,
+                        help=".tex files to benchmark instead of the built-in corpus")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES),
+                        help="engines to compare (default: all installed)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per document and engine")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per engine run")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    def installed(name):
+        # Timed locally: peak memory needs the engine to be a child of this process
+        return shutil.which(get_engine(name).binary) is not None
+
+    engines = args.engines or [name for name in available_engines() if installed(name)]
+    missing = [name for name in engines if not installed(name)]
+    if missing:
+        parser.error(f"not installed: {', '.join(missing)}")
+    if not engines:
+        parser.error("no TeX engine found on PATH")
+    corpus = [(str(p), p) for p in args.documents] or default_corpus()
+
+    print(f"Benchmarking {', '.join(engines)} on {len(corpus)} document(s), "
+          f"{args.repeat} run(s) each")
+    results = benchmark(engines, corpus, args.repeat, args.timeout)
+    report(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+# bench_pipeline.py
+# Regression benchmark of the compile pipeline: times each stage over a fixed
+# corpus and compares the medians with a stored baseline.
+#
+#   python bench_pipeline.py --save-baseline         # record bench_baseline.json
+#   python bench_pipeline.py                          # compare, exit 1 on regressions
+#   python bench_pipeline.py --only replace --repeat 20 --threshold 0.10
+#
+# Scenarios:
+#   compile/<doc>          compile_latex_to_pdf(), cold (a fresh cache key)
+#   compile-cached/<doc>   compile_latex_to_pdf() of the same source again
+#   replace/<n> pictures   safe_replace_tikz() on a synthetic document
+#   qt-compiler/<doc>      the TikZ GUI's Compiler (warm workers, pdftocairo)
+#   rasterize/<doc>        render_pages() of every page (pdf2image)
+#   first-page/<doc>       pdf_to_png() of the first page (pdftocairo)
+#
+# Runs headless: Qt uses the offscreen platform, Streamlit runs bare. A
+# scenario whose requirements are missing (TeX, PySide6, streamlit,
+# pdf2image) is skipped and reported, and never counts as a regression. A
+# scenario that fails, or one of the baseline that did not run and was not
+# skipped, does.
+# Compiles use a scratch cache directory and do not write profile traces.
+
+import os, sys, json, time, atexit, random, shutil, argparse, platform, tempfile, tracemalloc
+import statistics
+from pathlib import Path
+
+# Before the pipeline modules read them
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.setdefault("LATEX_PROFILE_TRACE", "0")
+os.environ["LATEX_EDITOR_CACHE"] = tempfile.mkdtemp(prefix="bench-pipeline-cache-")
+atexit.register(shutil.rmtree, os.environ["LATEX_EDITOR_CACHE"], True)
+
+from compile_profile import peak_rss_mb
+from latex_compile import DEFAULT_ENGINE, available_engines, pdf_to_png
+from latex_templates import DEFAULT_DOCUMENT, TIKZ_PREAMBLE, TIKZ_TEMPLATES, make_tikz_document
+
+BASELINE_FILE = Path("bench_baseline.json")
+THRESHOLD = 0.15        # a median this much slower than the baseline is a regression
+MIN_DELTA_MS = 5.0      # and by at least this much, so timer noise never fails a run
+
+class Skip(Exception):
+    """A scenario cannot run here"""
+
+# ---------------------------------------------------------------------------
+# Corpus
+# ---------------------------------------------------------------------------
+WORDS = ("diagram node edge layout graph vertex label anchor path style scope "
+         "matrix arrow circle shape fill draw coordinate").split()
+
+def synthetic_document(pictures, paragraphs=2, seed=1):
+    """Article with `pictures` tikzpictures between paragraphs; the same for a seed"""
+    rng = random.Random(seed)
+    parts = [TIKZ_PREAMBLE.replace("{standalone}", "{article}"), "\\begin{document}\n"]
+    for i in range(pictures):
+        if i % 5 == 0:
+            parts.append(f"\\section{{Part {i // 5 + 1}}}\n")
+        for _ in range(paragraphs):
+            parts.append(" ".join(rng.choice(WORDS) for _ in range(60)) + ".\n\n")
+        nodes = "\n".join(f"  \\node[draw] (n{j}) at ({j},{rng.randint(0, 3)}) {{{j}}};"
+                          for j in range(rng.randint(2, 6)))
+        parts.append(f"% figure {i}\n\\begin{{tikzpicture}}\n{nodes}\n"
+                     f"  \\draw[->] (n0) -- (n1);\n\\end{{tikzpicture}}\n\n")
+    parts.append("\\end{document}\n")
+    return "".join(parts)
+
+def corpus():
+    """[(name, source)] compiled by the compile, Qt and rasterize scenarios"""
+    documents = [("default document", DEFAULT_DOCUMENT)]
+    documents += [(f"tikz {name}", make_tikz_document(code))
+                  for name, code in TIKZ_TEMPLATES.items()]
+    documents.append(("synthetic 20 figures", synthetic_document(20)))
+    return documents
+
+# ---------------------------------------------------------------------------
+# Scenarios: each returns a callable that runs one timed iteration
+# ---------------------------------------------------------------------------
+def _engine():
+    if DEFAULT_ENGINE not in available_engines():
+        raise Skip(f"{DEFAULT_ENGINE} is not available")
+    return DEFAULT_ENGINE
+
+def _web_editor():
+    try:
+        import latex_web_editor
+    except ImportError as e:
+        raise Skip(f"latex_web_editor needs {e.name}")
+    return latex_web_editor
+
+def compile_scenario(source, cached=False):
+    engine = _engine()
+    editor = _web_editor()
+    counter = iter(range(10**9))
+
+    def run():
+        # A changed comment gives a new cache key but the same TeX work
+        text = source if cached else f"{source}\n% bench run {next(counter)}\n"
+        pdf_data, error = editor.compile_latex_to_pdf(text, engine=engine)
+        if not pdf_data:
+            raise RuntimeError(f"compile failed: {(error or '')[:200]}")
+    if cached:
+        run()                           # fill the cache
+    return run
+
+def replace_scenario(pictures):
+    editor = _web_editor()
+    document = synthetic_document(pictures, paragraphs=1)
+    new_picture = TIKZ_TEMPLATES[next(iter(TIKZ_TEMPLATES))]
+
+    def run():
+        # document's index stays in the process-wide cache after the first
+        # call, so this times copying it and splicing the picture in
+        result = editor.safe_replace_tikz(document, new_picture, pictures // 2)
+        if result == document:
+            raise RuntimeError("safe_replace_tikz changed nothing")
+    return run
+
+_compiler = None
+
+def qt_compiler_scenario(source, timeout=120):
+    global _compiler
+    engine = _engine()
+    try:
+        from PySide6.QtCore import QCoreApplication, QEventLoop, QTimer
+        import tikzEditor
+    except ImportError as e:
+        raise Skip(f"the TikZ GUI needs {e.name}")
+    QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    if _compiler is None:
+        _compiler = tikzEditor.Compiler()
+
+    def run():
+        loop = QEventLoop()
+        result = {}
+
+        def done(generation, pdf, png, log, synctex, profile):
+            if generation == wanted:
+                result["ok"], result["log"] = bool(png), log
+                loop.quit()
+
+        _compiler.done.connect(done)
+        wanted = _compiler.compile_async(source, engine)
+        QTimer.singleShot(int(timeout * 1000), loop.quit)
+        loop.exec()
+        _compiler.done.disconnect(done)
+        if not result.get("ok"):
+            raise RuntimeError(f"Compiler failed: {result.get('log', 'timed out')[:200]}")
+    return run
+
+_pdfs = {}
+
+def _pdf(source):
+    """PDF of a corpus document, compiled once for the rasterize scenarios"""
+    if source not in _pdfs:
+        from latex_compile import compile_document
+        pdf_data, log = compile_document(source, engine=_engine())
+        if not pdf_data:
+            raise RuntimeError(f"document does not compile: {log[-200:]}")
+        _pdfs[source] = pdf_data
+    return _pdfs[source]
+
+def rasterize_scenario(source, dpi=150):
+    try:
+        from pdf_preview import page_fingerprints, render_pages
+    except ImportError as e:
+        raise Skip(f"pdf_preview needs {e.name}")
+    pdf_data = _pdf(source)
+    indices = range(len(page_fingerprints(pdf_data)))
+
+    def run():
+        if len(list(render_pages(pdf_data, indices, dpi))) != len(indices):
+            raise RuntimeError("pages missing")
+    return run
+
+def first_page_scenario(source, dpi=150):
+    if shutil.which("pdftocairo") is None:
+        raise Skip("pdftocairo not found")
+    pdf_data = _pdf(source)
+
+    def run():
+        if not pdf_to_png(pdf_data, dpi):
+            raise RuntimeError("pdftocairo produced no PNG")
+    return run
+
+def scenarios():
+    """[(name, factory)]; a factory returns the timed callable or raises Skip"""
+    items = []
+    for name, source in corpus():
+        items.append((f"compile/{name}", lambda s=source: compile_scenario(s)))
+        items.append((f"compile-cached/{name}", lambda s=source: compile_scenario(s, cached=True)))
+    for pictures in (50, 500):
+        items.append((f"replace/{pictures} pictures", lambda n=pictures: replace_scenario(n)))
+    for name, source in corpus():
+        if name.startswith("tikz "):
+            items.append((f"qt-compiler/{name}", lambda s=source: qt_compiler_scenario(s)))
+    for name, source in corpus():
+        if name.startswith("synthetic") or name == "default document":
+            items.append((f"rasterize/{name}", lambda s=source: rasterize_scenario(s)))
+            items.append((f"first-page/{name}", lambda s=source: first_page_scenario(s)))
+    return items
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def measure(run, repeat=5, warmup=1):
+    """Timing distribution (ms) of run() and the Python memory of one more call"""
+    for _ in range(warmup):
+        run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - start) * 1000)
+    # Traced apart from the timed runs, tracemalloc slows allocation down
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss, child_rss = peak_rss_mb()
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(times), 2),
+        "mean_ms": round(statistics.mean(times), 2),
+        "min_ms": round(min(times), 2),
+        "p90_ms": round(_percentile(times, 0.9), 2),
+        "stdev_ms": round(statistics.pstdev(times), 2),
+        "py_peak_kb": round(peak / 1024, 1),
+        "peak_rss_mb": rss,
+        "child_peak_rss_mb": child_rss,
+    }
+
+def selected(name, only):
+    return not only or any(pattern in name for pattern in only)
+
+def run_benchmarks(only=None, repeat=5, warmup=1):
+    """(results, skipped, failed); the last two map scenario names to the reason"""
+    results, skipped, failed = {}, {}, {}
+    for name, factory in scenarios():
+        if not selected(name, only):
+            continue
+        try:
+            run = factory()
+            results[name] = measure(run, repeat, warmup)
+        except Skip as e:
+            skipped[name] = str(e)
+            print(f"  {name:<44} skipped: {e}", flush=True)
+            continue
+        except Exception as e:
+            failed[name] = f"{type(e).__name__}: {e}"
+            print(f"  {name:<44} FAILED: {e}", flush=True)
+            continue
+        r = results[name]
+        print(f"  {name:<44} {r['median_ms']:9.1f} ms median  (p90 {r['p90_ms']:.1f}, "
+              f"±{r['stdev_ms']:.1f})", flush=True)
+    return results, skipped, failed
+
+# ---------------------------------------------------------------------------
+# Baseline
+# ---------------------------------------------------------------------------
+def machine():
+    return {"platform": platform.platform(), "python": platform.python_version(),
+            "cpus": os.cpu_count(), "engine": DEFAULT_ENGINE}
+
+def save_baseline(path, results):
+    path.write_text(json.dumps({"machine": machine(), "time": round(time.time()),
+                                "results": results}, indent=1), encoding="utf-8")
+    print(f"\nBaseline of {len(results)} scenario(s) written to {path}")
+
+def compare(results, baseline, threshold=THRESHOLD, min_delta_ms=MIN_DELTA_MS):
+    """[(name, baseline ms, now ms, ratio, verdict)] for scenarios in both"""
+    rows = []
+    for name, result in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            rows.append((name, None, result["median_ms"], None, "new"))
+            continue
+        ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+        delta = result["median_ms"] - old["median_ms"]
+        if ratio > 1 + threshold and delta > min_delta_ms:
+            verdict = "REGRESSION"
+        elif ratio < 1 - threshold and -delta > min_delta_ms:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        rows.append((name, old["median_ms"], result["median_ms"], ratio, verdict))
+    return rows
+
+def report(rows):
+    print(f"\n{'scenario':<44} {'baseline':>10} {'now':>10} {'change':>8}  verdict")
+    for name, old, new, ratio, verdict in rows:
+        old_text = f"{old:.1f}" if old is not None else "-"
+        change = f"{(ratio - 1):+.0%}" if ratio is not None else "-"
+        print(f"{name:<44} {old_text:>10} {new:>10.1f} {change:>8}  {verdict}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Regression benchmark of the compile pipeline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE,
+                        help=f"baseline file (default {BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="write the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"relative slowdown of the median that fails (default {THRESHOLD})")
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS,
+                        help=f"smaller slowdowns never fail (default {MIN_DELTA_MS} ms)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per scenario")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per scenario")
+    parser.add_argument("--only", nargs="+", help="only scenarios whose name contains one of these")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+
+    print(f"Benchmarking the compile pipeline, {args.repeat} run(s) per scenario")
+    results, skipped, failed = run_benchmarks(args.only, args.repeat, args.warmup)
+    if args.json:
+        args.json.write_text(json.dumps({"machine": machine(), "results": results,
+                                         "skipped": skipped, "failed": failed}, indent=1),
+                             encoding="utf-8")
+    if not results and not failed:
+        sys.exit("No scenario could run here")
+    if args.save_baseline:
+        # A baseline without the failed scenarios would never notice them again
+        if failed:
+            sys.exit(f"\n{len(failed)} scenario(s) failed, baseline not written")
+        save_baseline(args.baseline, results)
+        return
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+        if failed:
+            sys.exit(f"{len(failed)} scenario(s) failed")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    if baseline.get("machine") != machine():
+        print(f"\nWarning: baseline recorded on {baseline.get('machine')}, timings may differ")
+    rows = compare(results, baseline, args.threshold, args.min_delta_ms)
+    report(rows)
+    regressions = [row[0] for row in rows if row[4] == "REGRESSION"]
+    if failed:
+        print(f"\nFailed: {', '.join(sorted(failed))}")
+    # Skipped for a missing requirement is fine, gone without a reason is not
+    missing = sorted(name for name in baseline["results"] if selected(name, args.only)
+                     and name not in results and name not in skipped and name not in failed)
+    if missing:
+        print(f"\nIn the baseline but not run: {', '.join(missing)}")
+    if regressions or failed or missing:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}, "
+              f"{len(failed)} failed, {len(missing)} missing")
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
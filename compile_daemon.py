@@ -0,0 +1,263 @@
+# compile_daemon.py
+# Local compile service shared by tikzEditor.py, tikzEditorv0.py and
+# latex_web_editor.py, so every front end uses the same caches and the
+# machine never runs more TeX jobs than it has cores.
+#
+# Start it with:
+#   python compile_daemon.py                       # http://127.0.0.1:8765
+#   python compile_daemon.py --socket /tmp/latex-compile.sock
+# and point the editors at it:
+#   export LATEX_COMPILE_DAEMON=http://127.0.0.1:8765
+#   export LATEX_COMPILE_DAEMON=unix:///tmp/latex-compile.sock
+#
+# API: POST /compile with a JSON body
+#   {"source": "...", "passes": "auto", "precompile_preamble": false,
+#    "png": false, "dpi": 150, "timeout": 30, "engine": null, "externalize": false}
+# returns {"ok", "pdf", "png" (base64 or null), "log", "queue_ms", "compile_ms"};
+# "timeout" (at most 120 s) bounds the whole job, not each TeX run.
+# GET /status reports the queue. A full queue answers 503, a malformed job
+# 400 and a job that fails outside TeX 500, each with {"error"}.
+
+import os, json, time, base64, socket, argparse, subprocess
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlparse
+
+from latex_compile import (COMPILE_CACHE, CompileAdmission, QueueFull, available_engines,
+                           cache_key, compile_document, document_engine, get_engine, pdf_to_png)
+from tikz_external import compile_externalized
+
+DEFAULT_PORT = 8765
+
+class DaemonError(OSError):
+    """The daemon could not be reached or refused the job"""
+
+# ---------------------------------------------------------------------------
+# Client side
+# ---------------------------------------------------------------------------
+def daemon_address():
+    """Configured daemon address (LATEX_COMPILE_DAEMON), or None"""
+    return os.environ.get("LATEX_COMPILE_DAEMON") or None
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+def _connect(address, timeout):
+    url = urlparse(address)
+    if url.scheme == "unix":
+        return _UnixHTTPConnection(url.path, timeout)
+    return http.client.HTTPConnection(url.hostname or "127.0.0.1", url.port or DEFAULT_PORT,
+                                      timeout=timeout)
+
+def daemon_compile(source, passes="auto", precompile_preamble=False, png=False, dpi=150,
+                   timeout=30, engine=None, externalize=False, address=None):
+    """Compile source on the daemon.
+
+    Returns {"pdf": bytes or None, "png": bytes or None, "log": str, ...}.
+    Raises DaemonError if the daemon is unreachable or overloaded.
+    """
+    address = address or daemon_address()
+    body = json.dumps({
+        "source": source, "passes": passes, "precompile_preamble": precompile_preamble,
+        "png": png, "dpi": dpi, "timeout": timeout, "engine": engine,
+        "externalize": externalize,
+    })
+    # The daemon may queue the job, so allow more than the TeX timeout
+    conn = _connect(address, timeout * 4 + 30)
+    try:
+        conn.request("POST", "/compile", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        data = response.read()
+    except (OSError, http.client.HTTPException) as e:
+        raise DaemonError(f"{address}: {e}") from e
+    finally:
+        conn.close()
+    if response.status != 200:
+        raise DaemonError(f"{address}: HTTP {response.status} {data[:200]!r}")
+    result = json.loads(data)
+    for name in ("pdf", "png"):
+        result[name] = base64.b64decode(result[name]) if result.get(name) else None
+    return result
+
+# ---------------------------------------------------------------------------
+# Server side
+# ---------------------------------------------------------------------------
+class CompileService:
+    """Bounded job queue in front of at most `workers` concurrent compiles.
+
+    Identical jobs submitted while one is running share its result.
+    """
+
+    def __init__(self, workers=None, max_queue=32, max_timeout=120):
+        self.admission = CompileAdmission(workers, max_waiting=max_queue)
+        self.workers = self.admission.slots
+        self.max_queue = max_queue
+        self.max_timeout = max_timeout
+
+    def status(self):
+        status = self.admission.summary()
+        status["max_queue"] = self.max_queue
+        status["engines"] = available_engines()
+        return status
+
+    def compile(self, job):
+        """Run one job dict; returns the response dict, or None if the queue is full"""
+        job["engine"] = document_engine(job["source"], job.get("engine"))
+        key = cache_key(job["source"], job.get("passes", "auto"),
+                        bool(job.get("precompile_preamble")), bool(job.get("png")),
+                        job.get("dpi", 150), job["engine"], bool(job.get("externalize")))
+        queued = time.perf_counter()
+        try:
+            return self.admission.run(
+                key, lambda: self._run(job, (time.perf_counter() - queued) * 1000))
+        except QueueFull:
+            return None
+
+    def _run(self, job, queue_ms):
+        source = job["source"]
+        timeout = min(float(job.get("timeout", 30)), self.max_timeout)
+        start = time.perf_counter()
+        # timeout is for the whole job: every pass, and every picture of an
+        # externalized document
+        options = dict(passes=job.get("passes", "auto"), timeout=timeout, engine=job["engine"],
+                       precompile_preamble=bool(job.get("precompile_preamble")),
+                       deadline=time.monotonic() + timeout)
+        try:
+            if job.get("externalize"):
+                pdf_data, log, _ = compile_externalized(source, **options)
+            else:
+                pdf_data, log = compile_document(source, **options)
+        except subprocess.TimeoutExpired:
+            pdf_data, log = None, f"Compilation timed out (>{timeout:.0f} s)"
+        png_data = None
+        if pdf_data and job.get("png"):
+            dpi = int(job.get("dpi", 150))
+            # PNGs are cached next to the PDF they came from
+            key = cache_key(source, "png", dpi, job["engine"])
+            cached = COMPILE_CACHE.get(key)
+            png_data = cached.get("page.png") if cached else None
+            if png_data is None:
+                png_data = pdf_to_png(pdf_data, dpi)
+                if png_data:
+                    COMPILE_CACHE.put(key, {"page.png": png_data})
+        return {
+            "ok": pdf_data is not None,
+            "pdf": base64.b64encode(pdf_data).decode() if pdf_data else None,
+            "png": base64.b64encode(png_data).decode() if png_data else None,
+            "log": log,
+            "queue_ms": round(queue_ms, 1),
+            "compile_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+def check_job(job):
+    """Normalize the options of a job dict in place; ValueError if one is unusable"""
+    if not isinstance(job, dict) or not isinstance(job.get("source"), str):
+        raise ValueError("expected a JSON body with a 'source' field")
+    try:
+        job["timeout"] = float(job.get("timeout", 30))
+        job["dpi"] = int(job.get("dpi", 150))
+        if job.get("passes", "auto") != "auto":
+            job["passes"] = int(job["passes"])
+    except (ValueError, TypeError):
+        raise ValueError("'timeout', 'dpi' and 'passes' must be numbers "
+                         "('passes' may also be \"auto\")") from None
+    passes = job.get("passes", "auto")
+    if not job["timeout"] > 0 or not 0 < job["dpi"] <= 2400 or passes != "auto" and passes < 1:
+        raise ValueError("'timeout', 'dpi' and 'passes' must be positive, 'dpi' at most 2400")
+    get_engine(job.get("engine"))       # ValueError for an unknown engine
+
+class Handler(BaseHTTPRequestHandler):
+    service = None                      # set by serve()
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self._reply(200, self.service.status())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/compile":
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400, {"error": "expected a JSON body with a 'source' field"})
+            return
+        try:
+            check_job(job)
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        try:
+            result = self.service.compile(job)
+        except Exception as e:          # engine failed to start, cache unwritable...
+            print(f"[compile_daemon] job failed: {type(e).__name__}: {e}")
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        if result is None:
+            self._reply(503, {"error": "compile queue is full, try again later"})
+        else:
+            self._reply(200, result)
+
+    def log_message(self, format, *args):
+        print(f"[compile_daemon] {format % args}")
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("unix", 0)    # BaseHTTPRequestHandler expects (host, port)
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, workers=None, max_queue=32):
+    Handler.service = CompileService(workers, max_queue)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = ThreadingUnixHTTPServer(socket_path, Handler)
+        where = f"unix://{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), Handler)
+        where = f"http://{host}:{port}"
+    print(f"Compile daemon listening on {where} with {Handler.service.workers} workers")
+    print(f"Use it from the editors with: export LATEX_COMPILE_DAEMON={where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared LaTeX compile daemon")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="concurrent compiles (default: number of CPU cores)")
+    parser.add_argument("--queue", type=int, default=32, help="maximum waiting jobs")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.socket, args.workers, args.queue)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# compile_profile.py
+# Where the time of a compile goes: per-stage timings and peak memory.
+#
+#   profile = Profile("web compile", engine="pdflatex")
+#   with profile:                       # stages below go to this profile
+#       with stage("setup"): ...        # anywhere in the same thread
+#   profile.finish()                    # appends a line to the trace file
+#
+# stage() is a no-op outside a profile, so library code (latex_compile) can
+# mark its stages unconditionally, and report the peak memory of each TeX
+# process it waited for with add_tex_rss(). Finished profiles are appended to a JSONL
+# trace shared by all sessions and both editors; aggregate it with
+#
+#   python compile_profile.py [trace.jsonl] [--kind "qt compile"] [--last 500]
+#
+# LATEX_PROFILE_TRACE - trace file (default <cache>/profile.jsonl), 0 disables it
+
+import os, sys, json, time, argparse, threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource                     # not on Windows
+except ImportError:
+    resource = None
+
+_trace = os.environ.get("LATEX_PROFILE_TRACE", "")
+TRACE_FILE = None if _trace == "0" else Path(_trace) if _trace else Path(
+    os.environ.get("LATEX_EDITOR_CACHE", Path.home() / ".cache" / "latex_editor")) / "profile.jsonl"
+TRACE_MAX_BYTES = 20 * 1024 * 1024      # then the trace is rotated to .1
+
+_local = threading.local()
+_trace_lock = threading.Lock()
+
+def peak_rss_mb():
+    """(peak RSS of this process, of its largest finished child) in MB, or (None, None).
+
+    Both are peaks over the whole life of the process, so in the editors
+    they only grow; the memory of one compile is its tex_peak_rss_mb.
+    """
+    if resource is None:
+        return None, None
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit
+    return round(own, 1), round(children, 1)
+
+def current():
+    """Innermost active Profile of this thread, or None"""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+def add_tex_rss(mb):
+    """Record the peak RSS (MB) of a finished TeX process in the current profile"""
+    profile = current()
+    if profile is not None and mb is not None:
+        profile.tex_peak_rss_mb = max(profile.tex_peak_rss_mb or 0, mb)
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as a stage of the current profile, if any"""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+class Profile:
+    """Stage timings of one compile or preview update.
+
+    Entering the profile makes it current for stage() in this thread; it
+    can be left and its stage() used from another thread (the Qt editor
+    times the repaint in the GUI thread), and finish() records it.
+    """
+
+    def __init__(self, kind, **info):
+        self.kind = kind
+        self.info = info
+        self.stages = []                # [name, ms], in order
+        self.total_ms = None
+        self.finished = None            # wall-clock time of finish()
+        self.peak_rss_mb = self.child_peak_rss_mb = None     # lifetime of the process
+        self.tex_peak_rss_mb = None     # largest TeX process of this profile
+        self._start = time.perf_counter()
+
+    def __enter__(self):
+        if not hasattr(_local, "stack"):
+            _local.stack = []
+        _local.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _local.stack.remove(self)
+        return False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name, ms):
+        self.stages.append([name, round(ms, 1)])
+
+    def finish(self, **info):
+        """Close the profile and append it to the trace; returns its record"""
+        if self.total_ms is None:
+            self.total_ms = round((time.perf_counter() - self._start) * 1000, 1)
+            self.finished = round(time.time(), 3)
+            self.peak_rss_mb, self.child_peak_rss_mb = peak_rss_mb()
+            self.info.update(info)
+            write_trace(self.record())
+        return self.record()
+
+    def record(self):
+        return {
+            "time": self.finished,
+            "pid": os.getpid(),
+            "kind": self.kind,
+            "total_ms": self.total_ms,
+            "stages": self.stages,
+            "tex_peak_rss_mb": self.tex_peak_rss_mb,
+            "peak_rss_mb": self.peak_rss_mb,
+            "child_peak_rss_mb": self.child_peak_rss_mb,
+            **self.info,
+        }
+
+    def summary(self):
+        return format_record(self.record())
+
+def format_record(record):
+    """Text table of a profile record: stages, time outside them, peak memory"""
+    lines = [f"{name:<24} {ms:9.1f} ms" for name, ms in record["stages"]]
+    if record["total_ms"] is not None:
+        other = record["total_ms"] - sum(ms for _, ms in record["stages"])
+        lines.append(f"{'(other)':<24} {other:9.1f} ms")
+        lines.append(f"{'total':<24} {record['total_ms']:9.1f} ms")
+    if record.get("tex_peak_rss_mb") is not None:
+        lines.append(f"TeX peak RSS {record['tex_peak_rss_mb']:.0f} MB")
+    if record.get("peak_rss_mb") is not None:
+        lines.append(f"since the process started: peak RSS {record['peak_rss_mb']:.0f} MB, "
+                     f"largest child {record['child_peak_rss_mb']:.0f} MB")
+    return "\n".join(lines)
+
+# ---------------------------------------------------------------------------
+# Trace file
+# ---------------------------------------------------------------------------
+def write_trace(record, path=None):
+    path = path or TRACE_FILE
+    if path is None:
+        return
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _trace_lock:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists() and path.stat().st_size > TRACE_MAX_BYTES:
+                path.replace(path.with_suffix(path.suffix + ".1"))
+            # One write per line, so processes appending at once do not interleave
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            print(f"Cannot write profile trace {path}: {e}")
+
+def read_trace(path=None, last=None, kind=None):
+    """Records of the trace file, oldest first; the last `last` ones if given"""
+    path = path or TRACE_FILE
+    records = []
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue            # partly written line
+                if kind is None or record.get("kind") == kind:
+                    records.append(record)
+    except (OSError, TypeError):
+        return []
+    return records[-last:] if last else records
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+def aggregate(records):
+    """{kind: {"count", "total": stats, "stages": {name: stats}}}; stats in ms.
+
+    stats are count, mean, p50, p95 and share (of the kind's total time).
+    """
+    by_kind = {}
+    for record in records:
+        by_kind.setdefault(record.get("kind", "?"), []).append(record)
+    result = {}
+    for kind, group in by_kind.items():
+        totals = [r["total_ms"] for r in group if r.get("total_ms") is not None]
+        stages = {}
+        for record in group:
+            for name, ms in record.get("stages", ()):
+                stages.setdefault(name, []).append(ms)
+        grand = sum(totals) or 1.0
+
+        def stats(values):
+            return {"count": len(values), "mean": round(sum(values) / len(values), 1),
+                    "p50": round(_percentile(values, 0.5), 1),
+                    "p95": round(_percentile(values, 0.95), 1),
+                    "share": round(sum(values) / grand, 3)}
+
+        rss = [r["tex_peak_rss_mb"] for r in group if r.get("tex_peak_rss_mb") is not None]
+        result[kind] = {
+            "count": len(group),
+            "total": stats(totals) if totals else None,
+            "stages": {name: stats(values) for name, values in
+                       sorted(stages.items(), key=lambda item: -sum(item[1]))},
+            "tex_peak_rss_mb": max(rss) if rss else None,
+        }
+    return result
+
+def format_aggregate(summary):
+    """Plain-text table of aggregate()"""
+    lines = []
+    for kind, data in summary.items():
+        lines.append(f"{kind}: {data['count']} run(s)"
+                     + (f", TeX peak RSS {data['tex_peak_rss_mb']:.0f} MB"
+                        if data["tex_peak_rss_mb"] else ""))
+        lines.append(f"  {'stage':<24} {'n':>5} {'mean':>9} {'p50':>9} {'p95':>9} {'share':>6}")
+        rows = list(data["stages"].items())
+        if data["total"]:
+            rows.append(("total", data["total"]))
+        for name, s in rows:
+            lines.append(f"  {name:<24} {s['count']:5d} {s['mean']:9.1f} {s['p50']:9.1f} "
+                         f"{s['p95']:9.1f} {s['share']:6.1%}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate compile profiles from the trace file")
+    parser.add_argument("trace", nargs="?", type=Path, default=TRACE_FILE)
+    parser.add_argument("--kind", help="only this kind, e.g. 'web compile' or 'qt compile'")
+    parser.add_argument("--last", type=int, help="only the most recent N records")
+    parser.add_argument("--json", action="store_true", help="print the aggregate as JSON")
+    args = parser.parse_args()
+    if args.trace is None:
+        parser.error("profile tracing is disabled (LATEX_PROFILE_TRACE=0); name a trace file")
+    records = read_trace(args.trace, args.last, args.kind)
+    if not records:
+        sys.exit(f"No profiles in {args.trace}")
+    summary = aggregate(records)
+    print(json.dumps(summary, indent=1) if args.json else format_aggregate(summary))
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,10 @@
 
 # Script to compile sn01.tex into PDF with bibliography processing
 # Run this script from the sn1 directory
+#
+# Uses latex_build.py when available, which only reruns pdflatex/bibtex for
+# what changed since the last build. Extra arguments (e.g. --force) are
+# passed on to it.
 
 # Ensure the script is run from the correct directory
 if [ ! -f "sn01.tex" ]; then
@@ -9,6 +13,12 @@ if [ ! -f "sn01.tex" ]; then
     exit 1
 fi
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+if command -v python3 >/dev/null 2>&1 && [ -f "$SCRIPT_DIR/latex_build.py" ]; then
+    exec python3 "$SCRIPT_DIR/latex_build.py" sn01.tex --bst-dir bst "$@"
+fi
+
+# Fallback: full compilation sequence
 # Copy the bibliography style file to the current directory if not already present
 if [ ! -f "sn-mathphys-num.bst" ]; then
     cp bst/sn-mathphys-num.bst .
@@ -28,4 +38,4 @@ pdflatex sn01.tex
 echo "Running pdflatex again to finalize references..."
 pdflatex sn01.tex
 
-echo "Compilation complete. Output file: sn01.pdf"
\ No newline at end of file
+echo "Compilation complete. Output file: sn01.pdf"
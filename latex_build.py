@@ -0,0 +1,231 @@
+# latex_build.py
+# Incremental build of a LaTeX document with a bibliography: only the steps
+# whose inputs changed since the last build are run.
+#
+#   python latex_build.py sn01.tex --bst-dir bst
+#   python latex_build.py paper.tex --engine lualatex --force
+#
+# The build state (.<job>.build.json next to the document) records a hash of
+# every project file the last LaTeX run read (from the -recorder .fls file:
+# chapters, images, local .sty, the .bbl) and of the BibTeX inputs (the
+# citation lines of the .aux, the .bib files and the .bst). A LaTeX pass runs
+# when one of its inputs changed or the PDF is missing, BibTeX runs when the
+# citations or the databases changed, and further passes run only while the
+# .aux cross-references still move or the log asks for a rerun.
+
+import os, re, sys, json, time, hashlib, argparse, subprocess
+from pathlib import Path
+
+from latex_compile import (MAX_PASSES, aux_digest, get_engine, needs_rerun, run_latex,
+                           spawn_tex)
+from latex_log import parse_log_file
+
+BIB_AUX_RE = re.compile(rb"^\\(citation|bibdata|bibstyle|abx@aux@\w+)\b.*$", re.M)
+
+def file_hash(path: Path):
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+class Build:
+    """Build state and steps for one document"""
+
+    def __init__(self, tex_file, engine=None, max_passes=MAX_PASSES + 2, bst_dir=None,
+                 timeout=300, force=False):
+        self.tex_file = Path(tex_file).resolve()
+        self.dir = self.tex_file.parent
+        self.job = self.tex_file.stem
+        self.engine = get_engine(engine)
+        self.max_passes = max_passes
+        self.bst_dir = Path(bst_dir).resolve() if bst_dir else None
+        self.timeout = timeout
+        self.state_file = self.dir / f".{self.job}.build.json"
+        self.state = {} if force else self._load_state()
+        self.steps = []                 # (step, ran, reason, seconds)
+        self.passes = 0
+
+    def path(self, suffix: str) -> Path:
+        return self.dir / (self.job + suffix)
+
+    # -- state -----------------------------------------------------------------
+    def _load_state(self):
+        try:
+            return json.loads(self.state_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        self.state_file.write_text(json.dumps(self.state, indent=1), encoding="utf-8")
+
+    def recorded_inputs(self):
+        """Project files read by the last LaTeX run, from the .fls recorder file"""
+        inputs, outputs = {self.tex_file}, set()
+        try:
+            lines = self.path(".fls").read_text(encoding="utf-8", errors="replace").splitlines()
+        except OSError:
+            return inputs
+        pwd = self.dir
+        for line in lines:
+            kind, _, name = line.partition(" ")
+            if kind == "PWD":
+                pwd = Path(name)
+            elif kind in ("INPUT", "OUTPUT"):
+                path = (pwd / name).resolve()
+                # TeX distribution files only change with a TeX upgrade
+                if self.dir in path.parents or path.parent == self.dir:
+                    (inputs if kind == "INPUT" else outputs).add(path)
+        # Files the run writes itself (.aux, .toc, ...) converge through the pass loop
+        return inputs - outputs
+
+    def _input_hashes(self, paths):
+        return {str(p.relative_to(self.dir)): file_hash(p) for p in sorted(paths)}
+
+    def latex_inputs_changed(self):
+        """Reason to run LaTeX, or None when nothing it reads has changed"""
+        if not self.path(".pdf").exists():
+            return "no PDF yet"
+        recorded = self.state.get("latex_inputs")
+        if not recorded:
+            return "no earlier build"
+        for name, digest in recorded.items():
+            if file_hash(self.dir / name) != digest:
+                return f"{name} changed"
+        return None
+
+    def bib_inputs(self):
+        """Hash of everything BibTeX/Biber reads, or None if there is no bibliography"""
+        try:
+            aux = self.path(".aux").read_bytes()
+        except OSError:
+            return None
+        lines = [m.group(0) for m in BIB_AUX_RE.finditer(aux)]
+        bcf = self.path(".bcf")
+        if not lines and not bcf.exists():
+            return None
+        h = hashlib.sha256(b"\n".join(lines))
+        if bcf.exists():
+            h.update(bcf.read_bytes())
+        for kind, names in re.findall(rb"^\\(bibdata|bibstyle)\{([^}]*)\}", aux, re.M):
+            suffix = ".bib" if kind == b"bibdata" else ".bst"
+            for name in names.decode("utf-8", "replace").split(","):
+                path = self._find(name.strip() + suffix)
+                h.update(name.encode() + (file_hash(path) or "").encode() if path else b"")
+        for name in re.findall(r"\\addbibresource(?:\[[^\]]*\])?\{([^}]*)\}",
+                               self.tex_file.read_text(encoding="utf-8", errors="replace")):
+            h.update((file_hash(self.dir / name) or name).encode())
+        return h.hexdigest()
+
+    def _find(self, name):
+        for base in (self.dir, self.bst_dir):
+            if base and (base / name).exists():
+                return base / name
+        return None
+
+    # -- steps -----------------------------------------------------------------
+    def _record(self, step, ran, reason, seconds=0.0):
+        self.steps.append((step, ran, reason, seconds))
+        mark = "run " if ran else "skip"
+        timing = f" ({seconds:.1f} s)" if ran else ""
+        print(f"[{mark}] {step}: {reason}{timing}", flush=True)
+
+    def latex_pass(self, reason):
+        start = time.perf_counter()
+        before = aux_digest(self.path(".aux"))
+        result, _ = run_latex(self.tex_file, self.dir, passes=1, timeout=self.timeout,
+                              engine=self.engine.name, options=["-recorder"])
+        self.passes += 1
+        self._record(f"{self.engine.name} pass {self.passes}", True, reason,
+                     time.perf_counter() - start)
+        if result.returncode != 0:
+            report = parse_log_file(self.path(".log")) if self.path(".log").exists() else None
+            error = report.first_error if report else None
+            raise BuildError(f"{self.engine.name} failed: {error or result.stdout[-500:]}")
+        return before
+
+    def bibliography(self):
+        """Run BibTeX or Biber if its inputs changed; True if the .bbl changed"""
+        digest = self.bib_inputs()
+        if digest is None:
+            return False
+        tool = "biber" if self.path(".bcf").exists() else "bibtex"
+        if digest == self.state.get("bib_inputs") and self.path(".bbl").exists():
+            self._record(tool, False, "citations and databases unchanged")
+            return False
+        old_bbl = file_hash(self.path(".bbl"))
+        env = dict(os.environ)
+        if self.bst_dir:
+            # Lets BibTeX find the style in place instead of copying it
+            env["BSTINPUTS"] = f"{self.bst_dir}{os.pathsep}{env.get('BSTINPUTS', '')}"
+        start = time.perf_counter()
+        proc = spawn_tex([tool, self.job], self.dir, env=env)
+        output, _ = proc.communicate(timeout=self.timeout)
+        self._record(tool, True, "citations or databases changed", time.perf_counter() - start)
+        # BibTeX exits 1 for warnings only, 2 or more for errors
+        succeeded = proc.returncode == 0 or tool == "bibtex" and proc.returncode == 1
+        if not succeeded:
+            message = f"{tool} failed:\n{output.decode('utf-8', 'replace')[-1000:]}"
+            if not self.path(".bbl").exists():
+                raise BuildError(message)
+            # Keep going with the old .bbl, but run it again next time
+            print(f"Warning: {message}")
+            self.state.pop("bib_inputs", None)
+        else:
+            self.state["bib_inputs"] = digest
+        return file_hash(self.path(".bbl")) != old_bbl
+
+    def run(self):
+        """Bring the PDF up to date; returns the number of LaTeX passes run"""
+        reason = self.latex_inputs_changed()
+        if reason is None:
+            self._record(self.engine.name, False, "inputs unchanged")
+            rerun = False
+        else:
+            before = self.latex_pass(reason)
+            rerun = needs_rerun(self.path(".log"), before, aux_digest(self.path(".aux")))
+            reason = "cross-references changed"
+        if self.bibliography():
+            rerun, reason = True, "bibliography changed"
+        while rerun:
+            if self.passes >= self.max_passes:
+                print(f"Warning: output still changing after {self.passes} passes")
+                break
+            before = self.latex_pass(reason)
+            rerun = needs_rerun(self.path(".log"), before, aux_digest(self.path(".aux")))
+            reason = "cross-references changed"
+            if not rerun and self.bibliography():
+                rerun, reason = True, "bibliography changed"
+        if self.passes:
+            self.state["latex_inputs"] = self._input_hashes(self.recorded_inputs())
+        self._save_state()
+        return self.passes
+
+class BuildError(Exception):
+    pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental LaTeX + BibTeX build")
+    parser.add_argument("tex_file", type=Path)
+    parser.add_argument("--engine", default=None, help="TeX engine (default: pdflatex)")
+    parser.add_argument("--bst-dir", type=Path, help="extra directory searched for .bst files")
+    parser.add_argument("--max-passes", type=int, default=MAX_PASSES + 2)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per step")
+    parser.add_argument("--force", action="store_true", help="ignore the recorded build state")
+    args = parser.parse_args()
+    if not args.tex_file.exists():
+        parser.error(f"{args.tex_file} not found")
+
+    build = Build(args.tex_file, args.engine, args.max_passes, args.bst_dir, args.timeout,
+                  args.force)
+    start = time.perf_counter()
+    try:
+        build.run()
+    except (BuildError, subprocess.TimeoutExpired) as e:
+        print(f"Build failed: {e}")
+        sys.exit(1)
+    ran = sum(1 for _, r, _, _ in build.steps if r)
+    print(f"{build.path('.pdf').name} up to date: {ran} step(s) run, "
+          f"{len(build.steps) - ran} skipped, {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,840 @@
+# latex_compile.py
+# Shared, UI-independent helpers for the LaTeX/TikZ editors
+# (latex_web_editor.py, tikzEditor.py).
+# Requires: Python 3.8+
+
+import os, re, sys, time, signal, shutil, hashlib, tempfile, threading, subprocess, uuid
+from collections import deque
+from pathlib import Path
+
+from latex_log import LogParser
+from texlive_session import TexLiveSession
+from compile_profile import add_tex_rss, stage
+
+CACHE_ROOT = Path(os.environ.get("LATEX_EDITOR_CACHE",
+                                 Path.home() / ".cache" / "latex_editor"))
+
+def cache_key(source: str, *options) -> str:
+    """Content hash of a LaTeX source plus the options that affect its output"""
+    h = hashlib.sha256(source.encode("utf-8"))
+    for opt in options:
+        h.update(b"\0")
+        h.update(str(opt).encode("utf-8"))
+    return h.hexdigest()
+
+class CompileCache:
+    """On-disk, content-addressed store of compile artifacts (PDF, log, ...).
+
+    Every entry is a directory named after its key holding one file per
+    artifact. Entries are written to a scratch directory and renamed into
+    place, so several Streamlit sessions or processes can share the same
+    cache safely. The directory mtime is bumped on every hit and the least
+    recently used entries are evicted once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = Path(root) if root else CACHE_ROOT / "compile"
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("LATEX_EDITOR_CACHE_MB", "256")) * 1024 * 1024
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str):
+        """Return {artifact name: bytes} for key, or None on a miss"""
+        entry = self._entry(key)
+        try:
+            files = {p.name: p.read_bytes() for p in entry.iterdir() if p.is_file()}
+            os.utime(entry)             # mark as recently used
+        except OSError:                 # missing, or evicted under our feet
+            return None
+        return files or None
+
+    def put(self, key: str, files: dict):
+        """Store {artifact name: bytes} under key and evict old entries"""
+        entry = self._entry(key)
+        scratch = self.root / ".tmp" / uuid.uuid4().hex
+        try:
+            scratch.mkdir(parents=True)
+            for name, data in files.items():
+                (scratch / name).write_bytes(data)
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.rename(scratch, entry)
+            except OSError:             # another process stored it first
+                shutil.rmtree(scratch, ignore_errors=True)
+                os.utime(entry)
+        except OSError as e:
+            print(f"Compile cache write failed: {e}")
+            shutil.rmtree(scratch, ignore_errors=True)
+            return
+        self._evict()
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for bucket in self.root.glob("[0-9a-f][0-9a-f]"):
+                for entry in bucket.iterdir():
+                    try:
+                        size = sum(f.stat().st_size for f in entry.iterdir())
+                        entries.append((entry.stat().st_mtime, size, entry))
+                    except OSError:
+                        continue
+                    total += size
+            if total <= self.max_bytes:
+                return
+            entries.sort()              # oldest first
+            for _, size, entry in entries:
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+# Process-wide instance; every Streamlit session imports the same module
+COMPILE_CACHE = CompileCache()
+
+# TeX Live container used when TeX is not installed here; its TEXMFVAR
+# (font and map caches) persists next to the compile cache
+TEXLIVE_SESSION = TexLiveSession(mounts=[CACHE_ROOT], var_dir=CACHE_ROOT / "texmf-var")
+
+# ---------------------------------------------------------------------------
+# Engines
+# ---------------------------------------------------------------------------
+class Engine:
+    """How to run one TeX engine.
+
+    formats: can start from a mylatexformat format (FORMAT_CACHE)
+    warm:    can wait on a terminal \\read for the body (TexWorker)
+    reruns:  run_latex() decides on extra passes (tectonic reruns itself)
+    """
+
+    def __init__(self, name, binary=None, formats=False, warm=True, reruns=True):
+        self.name = name
+        self.binary = binary or name
+        self.formats = formats
+        self.warm = warm
+        self.reruns = reruns
+
+    @property
+    def available(self):
+        return shutil.which(self.binary) is not None or TEXLIVE_SESSION.provides(self.binary)
+
+    def command(self, tex_file, options=(), outdir=None, fmt=None):
+        """Command line typesetting tex_file; options are web2c-style flags"""
+        if self.name == "tectonic":
+            args = [self.binary, "--keep-logs"]
+            if "-shell-escape" in options:
+                args += ["-Z", "shell-escape"]
+            if "-synctex=1" in options:
+                args += ["--synctex"]
+            if outdir:
+                args += ["--outdir", str(outdir)]
+            return args + [str(tex_file)]
+        args = [self.binary, *([f"-fmt={fmt}"] if fmt else []), *options]
+        if outdir:
+            args += ["-output-directory", str(outdir)]
+        return args + [str(tex_file)]
+
+    def __repr__(self):
+        return f"Engine({self.name!r})"
+
+# Known engines, in the order they are offered. The -dev variants run the
+# LaTeX pre-release and are only listed when TeX Live has them installed.
+ENGINES = {engine.name: engine for engine in (
+    Engine("pdflatex", formats=True),
+    Engine("xelatex", formats=True),
+    Engine("lualatex"),
+    Engine("tectonic", warm=False, reruns=False),
+    Engine("pdflatex-dev", formats=True),
+    Engine("xelatex-dev", formats=True),
+    Engine("lualatex-dev"),
+)}
+DEFAULT_ENGINE = os.environ.get("LATEX_ENGINE", "pdflatex")
+
+# "% !TEX program = xelatex" (TeXShop/TeXstudio convention) at the top of a
+# document picks its engine
+MAGIC_PROGRAM_RE = re.compile(r"^\s*%\s*!\s*TEX\s+(?:TS-)?program\s*=\s*(\S+)", re.I | re.M)
+
+def get_engine(name=None) -> Engine:
+    """Engine called name (default DEFAULT_ENGINE); raises ValueError if unknown"""
+    name = name or DEFAULT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown TeX engine {name!r}, expected one of {', '.join(ENGINES)}")
+    return ENGINES[name]
+
+def available_engines():
+    """Names of the engines installed on this machine"""
+    return [name for name, engine in ENGINES.items() if engine.available]
+
+def document_engine(source: str, default=None) -> str:
+    """Engine named by a "% !TEX program" line in the first lines of source"""
+    match = MAGIC_PROGRAM_RE.search(source[:2000])
+    if match and match.group(1).lower() in ENGINES:
+        return match.group(1).lower()
+    return default or DEFAULT_ENGINE
+
+# ---------------------------------------------------------------------------
+# Streaming TeX output
+# ---------------------------------------------------------------------------
+# Errors TeX may report before a run is stopped (LATEX_ERROR_BUDGET)
+ERROR_BUDGET = max(1, int(os.environ.get("LATEX_ERROR_BUDGET", "1")))
+
+# Lines after which TeX gives up on its own, whatever the budget
+FATAL_MARKERS = ("==> Fatal error occurred", "! Emergency stop", "*** (job aborted")
+
+def kill_process_tree(proc):
+    """Kill proc and, on POSIX, the children of its session (-shell-escape)"""
+    if proc is None or proc.poll() is not None:
+        return
+    if not isinstance(proc, subprocess.Popen):
+        proc.kill()                     # SessionProcess kills its own group
+        return
+    try:
+        if os.name == "posix":
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except OSError:
+        pass
+
+def spawn_tex(args, cwd, env=None, stdin=False):
+    """Start a TeX program with its output on stdout (stdin=True: writable stdin).
+
+    Programs missing from PATH run in the TeX Live container session
+    (TEXLIVE_SESSION) when docker is available. Either way the program gets
+    its own process group, so kill_process_tree() takes -shell-escape
+    children with it.
+    """
+    if shutil.which(args[0]) is None and TEXLIVE_SESSION.provides(args[0]):
+        return TEXLIVE_SESSION.popen(args, cwd, env, stdin)
+    return subprocess.Popen(
+        args,
+        cwd=cwd,
+        stdin=subprocess.PIPE if stdin else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+        start_new_session=(os.name == "posix")
+    )
+
+def wait_tex(proc):
+    """proc.wait(); returns the peak RSS of a local TeX process in MB, or None.
+
+    The memory comes from os.wait4 (POSIX), which measures this one process
+    rather than the lifetime peak of every child of the editor.
+    """
+    if not isinstance(proc, subprocess.Popen) or not hasattr(os, "wait4"):
+        proc.wait()
+        return None
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:           # already reaped by a poll() elsewhere
+        proc.wait()
+        return None
+    proc.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                       else -os.WTERMSIG(status))
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / unit, 1)
+
+def stream_tex(proc, stdin=b"", timeout=30, error_budget=ERROR_BUDGET, kill=None):
+    """Read TeX output line by line while it runs, stopping at the first errors.
+
+    Each line goes through a LogParser; once error_budget errors (or a fatal
+    one) have been printed the process is killed instead of left to work
+    through the rest of the document. proc must have been started with
+    stdout=PIPE (and stdin=PIPE to send stdin); kill defaults to
+    kill_process_tree(proc).
+    Returns (returncode, output bytes, LogReport, aborted).
+    Raises subprocess.TimeoutExpired if TeX does not finish in time.
+    """
+    kill = kill or (lambda: kill_process_tree(proc))
+    expired = threading.Event()
+
+    def on_timeout():
+        expired.set()
+        kill()
+
+    timer = threading.Timer(timeout, on_timeout)
+    timer.daemon = True
+    timer.start()
+    parser = LogParser()
+    chunks = []
+    errors = 0
+    aborted = False
+    try:
+        if proc.stdin:
+            try:
+                proc.stdin.write(stdin)
+                proc.stdin.close()
+            except OSError:
+                pass                    # TeX already exited
+        for raw in proc.stdout:
+            chunks.append(raw)
+            if aborted:
+                continue
+            line = raw.decode("utf-8", "replace")
+            if parser.feed(line) is not None:
+                errors += 1
+            if errors >= error_budget or any(m in line for m in FATAL_MARKERS):
+                aborted = True
+                kill()
+        add_tex_rss(wait_tex(proc))
+    finally:
+        timer.cancel()
+    output = b"".join(chunks)
+    if expired.is_set():
+        raise subprocess.TimeoutExpired(proc.args, timeout, output=output)
+    return proc.returncode, output, parser.close(), aborted
+
+# ---------------------------------------------------------------------------
+# Pass control
+# ---------------------------------------------------------------------------
+MAX_PASSES = 3
+
+# Log messages after which another run changes the output
+RERUN_MARKERS = (
+    b"Rerun to get",                    # cross-references, outlines, longtable
+    b"Label(s) may have changed",
+    b"Rerun LaTeX",
+    b"Please rerun LaTeX",
+)
+# Auxiliary files that are only read back on the next run
+NO_FILE_RE = re.compile(rb"^No file .*\.(toc|lof|lot|nav|snm)\.$", re.M)
+# .aux lines that feed back into the typeset output
+AUX_XREF_RE = re.compile(rb"^\\(newlabel|bibcite|@writefile|citation|bibdata)\b.*$", re.M)
+
+def aux_digest(aux_path) -> str:
+    """Hash of the cross-reference lines of an .aux file (empty if absent)"""
+    try:
+        data = Path(aux_path).read_bytes()
+    except OSError:
+        data = b""
+    lines = [m.group(0) for m in AUX_XREF_RE.finditer(data)]
+    return hashlib.sha256(b"\n".join(lines)).hexdigest()
+
+def needs_rerun(log_path, aux_before: str, aux_after: str) -> bool:
+    """Decide from the .log and the .aux change whether another pass is needed"""
+    if aux_before != aux_after:
+        return True
+    try:
+        log = Path(log_path).read_bytes()
+    except OSError:
+        return False
+    return any(m in log for m in RERUN_MARKERS) or bool(NO_FILE_RE.search(log))
+
+def time_left(args, timeout, deadline=None):
+    """timeout, cut to what is left before deadline (a time.monotonic() value).
+
+    Raises subprocess.TimeoutExpired for args once the deadline has passed.
+    """
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise subprocess.TimeoutExpired(args, timeout)
+    return min(timeout, left)
+
+def run_latex(tex_file, workdir, passes="auto", max_passes=MAX_PASSES, timeout=30,
+              fmt=None, error_budget=ERROR_BUDGET, engine=None, options=(), deadline=None):
+    """Run a TeX engine (default DEFAULT_ENGINE) on tex_file until the output is stable.
+
+    passes="auto" starts with one run and only reruns while needs_rerun()
+    says so, up to max_passes; an integer forces that many runs.
+    fmt names a precompiled preamble from FORMAT_CACHE to start from.
+    A run is killed once it has printed error_budget errors. options are
+    extra engine flags such as -recorder.
+    timeout bounds each run, deadline (time.monotonic()) all of them.
+    Returns (last CompletedProcess, number of runs).
+    """
+    engine = get_engine(engine)
+    tex_file = Path(tex_file)
+    job = Path(workdir) / tex_file.stem
+    aux_file, log_file = job.with_suffix(".aux"), job.with_suffix(".log")
+    fixed = passes != "auto"
+    limit = int(passes) if fixed else max_passes
+    if not engine.reruns:
+        limit = 1
+
+    runs = 0
+    while True:
+        before = aux_digest(aux_file)
+        args = engine.command(tex_file, ['-interaction=nonstopmode', *options],
+                              outdir=workdir, fmt=fmt)
+        with stage(f"{engine.name} pass {runs + 1}"):
+            pass_timeout = time_left(args, timeout, deadline)
+            proc = spawn_tex(args, workdir, env=FORMAT_CACHE.env() if fmt else None)
+            # Stops TeX as soon as error_budget errors were printed
+            returncode, output, _, _ = stream_tex(proc, timeout=pass_timeout,
+                                                  error_budget=error_budget)
+        result = subprocess.CompletedProcess(
+            args, returncode, stdout=output.decode("utf-8", "replace"), stderr=None)
+        if fmt and format_failed(result.stdout):
+            # Stale or broken format: drop it and redo this pass normally
+            FORMAT_CACHE.discard(fmt)
+            fmt = None
+            continue
+        runs += 1
+        if runs >= limit or result.returncode != 0:
+            break
+        if not fixed and not needs_rerun(log_file, before, aux_digest(aux_file)):
+            break
+    return result, runs
+
+def compile_document(source: str, passes="auto", precompile_preamble=False, timeout=30,
+                     engine=None, files=None, deadline=None):
+    """Compile a LaTeX source to PDF in a scratch directory, via COMPILE_CACHE.
+
+    engine defaults to the document's "% !TEX program" line, then
+    DEFAULT_ENGINE. files maps names to the bytes of extra input files
+    written next to the document; their names must change with their
+    content. timeout bounds each TeX run, deadline (time.monotonic()) the
+    whole compile. Returns (pdf_data, log); pdf_data is None when compilation
+    failed, in which case log holds the engine's output. The engine runs
+    with SyncTeX, whose data synctex_for(pdf_data) returns.
+    """
+    engine = get_engine(engine or document_engine(source))
+    files = files or {}
+    key = cache_key(source, engine.name, passes, *sorted(files))
+    with stage("cache lookup"):
+        cached = COMPILE_CACHE.get(key)
+    if cached and "document.pdf" in cached:
+        return cached["document.pdf"], cached.get("document.log", b"").decode("utf-8", "replace")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with stage("setup"):
+            tex_file = Path(temp_dir) / "document.tex"
+            pdf_file = Path(temp_dir) / "document.pdf"
+            tex_file.write_text(source, encoding="utf-8")
+            for name, data in files.items():
+                (Path(temp_dir) / name).write_bytes(data)
+
+        fmt = None
+        if precompile_preamble and engine.formats:
+            preamble, _ = split_preamble(source)
+            if preamble:
+                with stage("preamble format"):
+                    fmt = FORMAT_CACHE.ensure(preamble, engine.binary)
+
+        # Extra runs only while references are unresolved
+        result, _ = run_latex(tex_file, temp_dir, passes=passes, fmt=fmt, timeout=timeout,
+                              engine=engine.name, options=["-synctex=1"], deadline=deadline)
+        log = result.stdout or ""
+
+        if result.returncode == 0 and pdf_file.exists():
+            with stage("cache store"):
+                pdf_data = pdf_file.read_bytes()
+                # Only successful compiles are cached, so a fixed TeX
+                # installation is picked up on the next attempt
+                COMPILE_CACHE.put(key, {
+                    "document.pdf": pdf_data,
+                    "document.log": log.encode("utf-8"),
+                })
+                synctex_file = Path(temp_dir) / "document.synctex.gz"
+                if synctex_file.exists():
+                    store_synctex(pdf_data, synctex_file.read_bytes())
+            return pdf_data, log
+        return None, result.stderr or log
+
+def _synctex_key(pdf_data: bytes) -> str:
+    return cache_key(hashlib.sha256(pdf_data).hexdigest(), "synctex")
+
+def store_synctex(pdf_data: bytes, synctex_data: bytes):
+    """Keep the SyncTeX data of a PDF in COMPILE_CACHE, keyed by the PDF itself"""
+    COMPILE_CACHE.put(_synctex_key(pdf_data), {"document.synctex.gz": synctex_data})
+
+def synctex_for(pdf_data: bytes):
+    """SyncTeX data (gzipped, for document.tex) of a PDF compile_document() made, or None"""
+    files = COMPILE_CACHE.get(_synctex_key(pdf_data))
+    return files.get("document.synctex.gz") if files else None
+
+def pdf_to_png(pdf_data: bytes, dpi=150):
+    """First page of a PDF as PNG bytes via pdftocairo, or None on failure"""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "page.pdf"
+        pdf.write_bytes(pdf_data)
+        subprocess.run(
+            ["pdftocairo", "-singlefile", "-png", "-r", str(dpi), pdf.name, "page"],
+            cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60
+        )
+        png = Path(tmp) / "page.png"
+        return png.read_bytes() if png.exists() else None
+
+def pdf_to_svg(pdf_data: bytes):
+    """First page of a PDF as SVG bytes via pdftocairo, or None on failure"""
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "page.pdf"
+        pdf.write_bytes(pdf_data)
+        subprocess.run(
+            ["pdftocairo", "-svg", "-f", "1", "-l", "1", pdf.name, "page.svg"],
+            cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60
+        )
+        svg = Path(tmp) / "page.svg"
+        return svg.read_bytes() if svg.exists() else None
+
+# ---------------------------------------------------------------------------
+# Precompiled preambles
+# ---------------------------------------------------------------------------
+BEGIN_DOCUMENT = "\\begin{document}"
+# Log lines that mean the format itself is unusable, not the document
+FORMAT_FAILURE_MARKERS = ("I can't find the format file", "Fatal format file error")
+
+def split_preamble(document: str):
+    """Split a document at \\begin{document} into (preamble, rest).
+
+    Returns (None, document) if there is no \\begin{document}.
+    """
+    pos = document.find(BEGIN_DOCUMENT)
+    if pos == -1:
+        return None, document
+    return document[:pos], document[pos:]
+
+class FormatCache:
+    """Builds and caches one .fmt per distinct preamble via mylatexformat.
+
+    A document compiled with -fmt=<name> skips its own preamble up to
+    \\begin{document} and starts from the dumped state instead, so packages
+    such as tikz are loaded once per preamble rather than once per compile.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root) if root else CACHE_ROOT / "formats"
+        self._lock = threading.Lock()
+        self._failed = set()            # preambles that cannot be dumped
+
+    def _name(self, preamble: str, engine: str) -> str:
+        binary = shutil.which(engine) or engine
+        try:
+            stamp = os.path.getmtime(binary)    # rebuild after a TeX upgrade
+        except OSError:
+            stamp = 0
+        return "pre-" + cache_key(preamble, engine, stamp)[:16]
+
+    def env(self):
+        """Environment that lets TeX find the cached formats"""
+        env = dict(os.environ)
+        # The trailing separator appends the default format search path
+        env["TEXFORMATS"] = f"{self.root}{os.pathsep}{env.get('TEXFORMATS', '')}"
+        return env
+
+    def ensure(self, preamble: str, engine="pdflatex", timeout=120):
+        """Return the format name for preamble, building it if needed.
+
+        Returns None if the preamble cannot be dumped; callers then compile
+        the document the ordinary way.
+        """
+        name = self._name(preamble, engine)
+        if (self.root / f"{name}.fmt").exists():
+            return name
+        if name in self._failed:
+            return None
+
+        with self._lock:
+            if (self.root / f"{name}.fmt").exists():
+                return name
+            build = Path(tempfile.mkdtemp(prefix="fmt-"))
+            try:
+                (build / "preamble.tex").write_text(
+                    preamble + BEGIN_DOCUMENT + "\n\\end{document}\n", encoding="utf-8")
+                print(f"Building format {name} for the current preamble")
+                proc = spawn_tex(
+                    [engine, "-ini", "-interaction=nonstopmode", f"-jobname={name}",
+                     f"&{engine}", "mylatexformat.ltx", "preamble.tex"],
+                    build
+                )
+                try:
+                    proc.communicate(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    kill_process_tree(proc)
+                    raise
+                fmt = build / f"{name}.fmt"
+                if not fmt.exists():
+                    print(f"Format build failed, see {build / (name + '.log')}")
+                    self._failed.add(name)
+                    return None
+                self.root.mkdir(parents=True, exist_ok=True)
+                scratch = self.root / f".{name}.{uuid.uuid4().hex}"
+                shutil.copyfile(fmt, scratch)
+                os.replace(scratch, self.root / f"{name}.fmt")
+                return name
+            except (OSError, subprocess.SubprocessError) as e:
+                print(f"Format build failed: {e}")
+                self._failed.add(name)
+                return None
+            finally:
+                if name not in self._failed:
+                    shutil.rmtree(build, ignore_errors=True)
+
+    def discard(self, name: str):
+        """Forget a format TeX refused to load, so it is not used again"""
+        try:
+            (self.root / f"{name}.fmt").unlink()
+        except OSError:
+            pass
+        self._failed.add(name)
+
+def format_failed(log_text: str) -> bool:
+    return any(m in log_text for m in FORMAT_FAILURE_MARKERS)
+
+FORMAT_CACHE = FormatCache()
+
+# ---------------------------------------------------------------------------
+# Pre-spawned TeX workers
+# ---------------------------------------------------------------------------
+# Driver run by a warm worker: load the preamble, then block on a terminal
+# \read until the name of the file holding the document body arrives.
+# A mylatexformat format skips the preamble up to the literal \endofdump
+# token, so it must not be built with \csname; the first line defines it
+# (without naming it) for workers started without a format.
+WORKER_DRIVER = r"""\scrollmode \expandafter\providecommand\csname endofdump\endcsname{}
+%s
+\endofdump
+\endlinechar=-1 \read-1 to\workerjob \endlinechar=13 \nonstopmode
+\input{\workerjob}
+"""
+
+class TexWorker:
+    """One TeX process in its own directory, started before it is needed.
+
+    With a preamble the process is spawned immediately and loads it (from
+    FORMAT_CACHE if a format is available) while the user is still typing;
+    run() then only has to typeset the body. Without a preamble, or with an
+    engine that cannot wait for it, the process starts cold in run().
+    kill() cancels either state from another thread.
+    """
+
+    ARGS = ["-file-line-error", "-shell-escape", "-synctex=1", "-jobname=figure"]
+
+    def __init__(self, preamble=None, fmt=None, error_budget=ERROR_BUDGET, engine=None):
+        self.engine = get_engine(engine)
+        if not self.engine.warm:
+            preamble = fmt = None
+        self.preamble = preamble
+        self.fmt = fmt
+        self.error_budget = error_budget
+        self.dir = Path(tempfile.mkdtemp(prefix="texworker-"))
+        self.proc = None
+        self.killed = False
+        self.report = None              # LogReport of the last run()
+        self.aborted = False            # last run() was stopped at an error
+        if preamble is not None:
+            (self.dir / "driver.tex").write_text(WORKER_DRIVER % preamble, encoding="utf-8")
+            self.proc = self._spawn([], "driver.tex", fmt)
+
+    def _spawn(self, options, tex_file, fmt=None):
+        # With a budget of one error TeX can stop by itself
+        halt_args = ["-halt-on-error"] if self.error_budget <= 1 else []
+        return spawn_tex(
+            self.engine.command(tex_file, [*halt_args, *self.ARGS, *options], fmt=fmt),
+            self.dir, env=FORMAT_CACHE.env() if fmt else None, stdin=True)
+
+    def run(self, document: str, timeout=120):
+        """Typeset document; returns (returncode, output bytes).
+
+        The output is parsed while TeX runs (see self.report) and TeX is
+        killed once it has printed error_budget errors (self.aborted).
+        Raises subprocess.TimeoutExpired if TeX does not finish in time.
+        """
+        if self.preamble is not None:
+            _, body = split_preamble(document)
+            (self.dir / "body.tex").write_bytes(body.encode("utf-8"))
+            line = b"body.tex\n"
+        else:
+            (self.dir / "figure.tex").write_bytes(document.encode("utf-8"))
+            self.proc = self._spawn(["-interaction=nonstopmode"], "figure.tex")
+            line = b""
+        if self.killed:
+            self._terminate()
+        returncode, out, self.report, self.aborted = stream_tex(
+            self.proc, line, timeout, self.error_budget, kill=self._terminate)
+        return returncode, out
+
+    def output(self, name: str) -> Path:
+        return self.dir / name
+
+    def kill(self):
+        self.killed = True
+        self._terminate()
+
+    def _terminate(self):
+        kill_process_tree(self.proc)
+
+    def close(self):
+        self.kill()
+        if self.proc:
+            try:
+                self.proc.communicate(timeout=5)
+            except (subprocess.SubprocessError, ValueError):
+                pass
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+class WorkerPool:
+    """Keeps a few warm TexWorkers for the most recently used preamble and engine"""
+
+    def __init__(self, size=2):
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def acquire(self, document: str, engine=None) -> TexWorker:
+        """Take a worker for document and top the pool back up"""
+        engine = get_engine(engine)
+        preamble, _ = split_preamble(document)
+        if preamble is None or not engine.warm:
+            return TexWorker(engine=engine.name)
+        fmt = FORMAT_CACHE.ensure(preamble, engine.binary) if engine.formats else None
+        with self._lock:
+            usable = [w for w in self._idle
+                      if w.preamble == preamble and w.engine is engine and w.proc.poll() is None]
+            stale = [w for w in self._idle if w not in usable]
+            self._idle = usable
+            worker = self._idle.pop(0) if self._idle else TexWorker(preamble, fmt, engine=engine.name)
+            while len(self._idle) < self.size - 1:
+                self._idle.append(TexWorker(preamble, fmt, engine=engine.name))
+        for w in stale:
+            w.close()
+        return worker
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for w in idle:
+            w.close()
+
+# ---------------------------------------------------------------------------
+# Admission control
+# ---------------------------------------------------------------------------
+class _Flight:
+    """A compile in progress that identical requests can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class QueueFull(Exception):
+    """CompileAdmission.run() refused a job: max_waiting jobs already wait"""
+
+class CompileAdmission:
+    """Limits concurrent compiles across all sessions of a process.
+
+    At most `slots` jobs (default: CPU cores) run at once and the rest wait
+    in FIFO order, reporting their position through on_wait. With
+    max_waiting, a job that would make the queue longer raises QueueFull.
+    A job whose key is already being compiled does not queue at all; it
+    waits for that compile and shares its result. Queue wait and compile
+    time of recent jobs are kept for summary().
+    """
+
+    def __init__(self, slots=None, history=500, max_waiting=None):
+        self.slots = slots or os.cpu_count() or 2
+        self.max_waiting = max_waiting
+        self._cond = threading.Condition()
+        self._queue = deque()           # tickets of waiting jobs, oldest first
+        self._running = 0
+        self._inflight = {}             # key -> _Flight
+        self._metrics = deque(maxlen=history)   # (wait_ms, compile_ms, coalesced)
+
+    @property
+    def waiting(self):
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def running(self):
+        with self._cond:
+            return self._running
+
+    def run(self, key, fn, on_wait=None):
+        """Run fn() once a slot is free and return its result.
+
+        on_wait(position, running) is called from the caller's thread about
+        twice a second while the job is queued; position 1 is next in line.
+        """
+        queued = time.perf_counter()
+        ticket = object()
+        with self._cond:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                # Checked and queued under one lock, so the limit holds
+                if self.max_waiting is not None and len(self._queue) >= self.max_waiting:
+                    raise QueueFull(f"{len(self._queue)} compiles are waiting already")
+                flight = self._inflight[key] = _Flight()
+                self._queue.append(ticket)
+
+        if not leader:
+            # Same document already compiling for someone else: share it
+            while not flight.done.wait(0.5):
+                if on_wait:
+                    on_wait(0, self.running)
+            self._record(queued, time.perf_counter(), True)
+            if flight.error:
+                raise flight.error
+            return flight.result
+
+        started = None
+        try:
+            while True:
+                with self._cond:
+                    if self._queue[0] is ticket and self._running < self.slots:
+                        self._queue.popleft()
+                        self._running += 1
+                        break
+                    position, running = self._queue.index(ticket) + 1, self._running
+                    self._cond.wait(0.5)
+                if on_wait:
+                    on_wait(position, running)
+            started = time.perf_counter()
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._cond:
+                if started is None:
+                    self._queue.remove(ticket)
+                else:
+                    self._running -= 1
+                del self._inflight[key]
+                self._cond.notify_all()
+            flight.done.set()
+            if started is not None:
+                self._record(queued, started, False)
+
+    def _record(self, queued, started, coalesced):
+        now = time.perf_counter()
+        with self._cond:
+            self._metrics.append(((started - queued) * 1000, (now - started) * 1000, coalesced))
+
+    def summary(self):
+        """Counts and mean/p95 of queue wait and compile time in ms"""
+        with self._cond:
+            metrics = list(self._metrics)
+            state = {"running": self._running, "waiting": len(self._queue), "slots": self.slots}
+
+        def stats(values):
+            if not values:
+                return {"mean": 0.0, "p95": 0.0}
+            values = sorted(values)
+            return {"mean": round(sum(values) / len(values), 1),
+                    "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 1)}
+
+        compiled = [m for m in metrics if not m[2]]
+        state.update({
+            "jobs": len(metrics),
+            "coalesced": len(metrics) - len(compiled),
+            "wait_ms": stats([m[0] for m in metrics]),
+            "compile_ms": stats([m[1] for m in compiled]),
+        })
+        return state
+
+# Shared by every Streamlit session (and the compile daemon) in this process
+ADMISSION = CompileAdmission()
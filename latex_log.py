@@ -0,0 +1,203 @@
+# latex_log.py
+# Single-pass parser turning pdflatex output or .log files into structured
+# diagnostics (errors, warnings, over/underfull boxes) for the editors.
+
+import re
+
+MAX_LINE = 79           # TeX wraps log lines at max_print_line characters
+
+ERROR_RE = re.compile(r"^! (.*)")
+FILE_LINE_ERROR_RE = re.compile(r"^(\S.*?):(\d+): (.*)")
+CONTEXT_LINE_RE = re.compile(r"^l\.(\d+) ?(.*)")
+WARNING_RE = re.compile(
+    r"^(?:LaTeX|LaTeX Font|Package (\S+)|Class (\S+)|pdfTeX) [Ww]arning:? (.*)")
+INPUT_LINE_RE = re.compile(r"on input line (\d+)")
+BOX_RE = re.compile(
+    r"^((?:Over|Under)full \\[hv]box \([^)]*\))"
+    r"(?:.*? at lines? (\d+)(?:--\d+)?)?")
+FILE_PAREN_RE = re.compile(r"\(([^\s()]*)|\)")
+PACKAGE_PREFIX_RE = re.compile(r"\s*\(\S+\)\s{2,}|\s+")
+
+def _squash(text):
+    """Collapse whitespace and the "(package)   " prefixes of continued warnings"""
+    return PACKAGE_PREFIX_RE.sub(" ", text).strip()
+
+class Diagnostic:
+    """One error, warning or box message"""
+    __slots__ = ("level", "file", "line", "message", "context")
+
+    def __init__(self, level, file, line, message, context=""):
+        self.level = level              # "error", "warning" or "box"
+        self.file = file
+        self.line = line
+        self.message = message
+        self.context = context
+
+    def location(self):
+        if self.file and self.line:
+            return f"{self.file}:{self.line}"
+        return self.file or (f"line {self.line}" if self.line else "")
+
+    def __str__(self):
+        where = self.location()
+        text = f"{where}: {self.message}" if where else self.message
+        return f"{text}\n  {self.context}" if self.context else text
+
+    def __repr__(self):
+        return f"Diagnostic({self.level!r}, {self.file!r}, {self.line!r}, {self.message!r})"
+
+class LogReport:
+    """Diagnostics extracted from one log"""
+    __slots__ = ("errors", "warnings", "boxes", "lines")
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+        self.boxes = []
+        self.lines = 0
+
+    @property
+    def first_error(self):
+        return self.errors[0] if self.errors else None
+
+    def summary(self):
+        return (f"{len(self.errors)} error(s), {len(self.warnings)} warning(s), "
+                f"{len(self.boxes)} over/underfull box(es)")
+
+class LogParser:
+    """Incremental log parser: feed() lines as they arrive, then close().
+
+    feed() returns the Diagnostic of an error as soon as its location is
+    known, so a caller streaming TeX output can react to the first error
+    without waiting for the run to end.
+    """
+
+    def __init__(self):
+        self.report = LogReport()
+        self._files = []                # open-file stack built from "(" and ")"
+        self._wrapped = ""              # start of a line TeX wrapped at MAX_LINE
+        self._error = None              # error still waiting for its l.N line
+        self._error_lines = 0
+        self._continued = None          # diagnostic whose next line may continue it
+
+    @property
+    def current_file(self):
+        for name in reversed(self._files):
+            if name:
+                return name
+        return None
+
+    def feed(self, line: str):
+        line = line.rstrip("\r\n")
+        if len(line) == MAX_LINE:
+            self._wrapped += line
+            return None
+        line, self._wrapped = self._wrapped + line, ""
+        self.report.lines += 1
+        return self._handle(line)
+
+    def close(self) -> LogReport:
+        if self._wrapped:
+            line, self._wrapped = self._wrapped, ""
+            self._handle(line)
+        self._finish_error()
+        return self.report
+
+    # -- internals -----------------------------------------------------------
+    def _handle(self, line):
+        continued, self._continued = self._continued, None
+        if continued is not None and line.strip() and not line.startswith(("!", "l.")):
+            if continued.level == "error":
+                # The rest of the offending line, printed below "l.N ..."
+                continued.context += " " + line.strip()
+                return None
+            if line.startswith(("(", " ")):
+                # Package warnings continue on lines prefixed with "(package)"
+                continued.message = _squash(continued.message + " " + line)
+                self._continued = continued
+                self._fill_line(continued)
+                return None
+
+        if self._error is not None:
+            match = CONTEXT_LINE_RE.match(line)
+            if match:
+                error = self._error
+                error.line = error.line or int(match.group(1))
+                error.context = match.group(2).strip()
+                self._error = None
+                self._continued = error
+                return error
+            self._error_lines += 1
+            if not ERROR_RE.match(line) and not FILE_LINE_ERROR_RE.match(line) \
+                    and self._error_lines < 8:
+                return None
+            emitted = self._finish_error()
+            new = self._handle(line)
+            return emitted or new
+
+        match = ERROR_RE.match(line)
+        if match:
+            self._start_error(self.current_file, None, match.group(1))
+            return None
+        match = FILE_LINE_ERROR_RE.match(line)
+        if match and not line.startswith(("(", " ")):
+            self._start_error(match.group(1), int(match.group(2)), match.group(3))
+            return None
+
+        match = WARNING_RE.match(line)
+        if match:
+            warning = Diagnostic("warning", self.current_file, None, _squash(match.group(3)))
+            warning.context = line[:match.start(3)].rstrip(": ")    # e.g. "Package tikz Warning"
+            self._fill_line(warning)
+            self.report.warnings.append(warning)
+            self._continued = warning
+            return None
+
+        match = BOX_RE.match(line)
+        if match:
+            line_no = int(match.group(2)) if match.group(2) else None
+            self.report.boxes.append(Diagnostic("box", self.current_file, line_no, line.strip()))
+            return None
+
+        self._track_files(line)
+        return None
+
+    def _start_error(self, file, line, message):
+        self._finish_error()
+        self._error = Diagnostic("error", file, line, message)
+        self._error_lines = 0
+        self.report.errors.append(self._error)
+
+    def _finish_error(self):
+        """Close an error that never got an l.N line; returns it"""
+        error, self._error = self._error, None
+        return error
+
+    def _fill_line(self, diagnostic):
+        if diagnostic.line is None:
+            match = INPUT_LINE_RE.search(diagnostic.message)
+            if match:
+                diagnostic.line = int(match.group(1))
+
+    def _track_files(self, line):
+        for match in FILE_PAREN_RE.finditer(line):
+            if match.group(0) == ")":
+                if self._files:
+                    self._files.pop()
+            else:
+                name = match.group(1)
+                self._files.append(name if ("." in name or "/" in name) else None)
+
+def parse_log(lines) -> LogReport:
+    """Parse an iterable of log lines (or one string) in a single pass"""
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    parser = LogParser()
+    for line in lines:
+        parser.feed(line)
+    return parser.close()
+
+def parse_log_file(path) -> LogReport:
+    """Parse a .log file, streaming it line by line"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return parse_log(f)
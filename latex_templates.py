@@ -0,0 +1,85 @@
+# latex_templates.py
+# Default documents and TikZ templates of the editors, also used as the
+# corpus of bench_engines.py.
+
+# Preamble of the standalone documents used by the TikZ test paths
+TIKZ_PREAMBLE = (
+    "\\documentclass{standalone}\n"
+    "\\usepackage{tikz}\n"
+    "\\usetikzlibrary{positioning,shapes,arrows,decorations.markings,patterns,calc}\n"
+)
+
+def make_tikz_document(tikz_code):
+    """Wrap TikZ code in a standalone LaTeX document"""
+    return TIKZ_PREAMBLE + "\\begin{document}\n" + tikz_code + "\n\\end{document}"
+
+DEFAULT_DOCUMENT = r"""\documentclass[12pt]{article}
+\usepackage[utf8]{inputenc}
+\usepackage{amsmath}
+\usepackage{amsfonts}
+\usepackage{geometry}
+\usepackage{tikz}
+\usetikzlibrary{positioning,shapes,arrows,decorations.markings}
+
+\geometry{a4paper, margin=2.5cm}
+
+\title{My LaTeX Document}
+\author{Author Name}
+\date{\today}
+
+\begin{document}
+
+\maketitle
+
+\section{Introduction}
+This is a sample LaTeX document created with LaTeX editor, supporting TikZ graphics.
+
+\section{Math Examples}
+Einstein's mass-energy equation:
+\begin{equation}
+E = mc^2
+\end{equation}
+
+\section{TikZ Graphics Example}
+\begin{tikzpicture}
+  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
+  \node[rectangle,draw,fill=green!20] (B) at (2,1.5) {B};
+  \draw[->,thick] (A) -- (B) node[midway,above] {arrow};
+\end{tikzpicture}
+
+\end{document}"""
+
+DEFAULT_TIKZ = r"""\begin{tikzpicture}
+  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
+  \node[rectangle,draw,fill=green!20] (B) at (2,1.5) {B};
+  \draw[->,thick] (A) -- (B) node[midway,above] {arrow};
+\end{tikzpicture}"""
+
+# Quick TikZ templates offered in the web editor
+TIKZ_TEMPLATES = {
+    "Basic Nodes": r"""\begin{tikzpicture}
+  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
+  \node[rectangle,draw,fill=red!20] (B) at (2,0) {B};
+  \draw[->] (A) -- (B);
+\end{tikzpicture}""",
+    "Flowchart (positioning)": r"""\begin{tikzpicture}
+  \node[draw,rounded corners] (start) {Start};
+  \node[draw,below=of start] (process) {Process};
+  \node[draw,diamond,below=of process] (decision) {Decision?};
+  \node[draw,rounded corners,below=of decision] (end) {End};
+  \draw[->] (start) -- (process);
+  \draw[->] (process) -- (decision);
+  \draw[->] (decision) -- (end);
+\end{tikzpicture}""",
+    "Math Function": r"""\begin{tikzpicture}
+  \draw[->] (-2,0) -- (2,0) node[right] {$x$};
+  \draw[->] (0,-1) -- (0,2) node[above] {$y$};
+  \draw[domain=-1.5:1.5,blue,thick] plot (\x,{\x*\x});
+  \node at (1,1.5) {$y=x^2$};
+\end{tikzpicture}""",
+    "Your Example": r"""\begin{tikzpicture}
+  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
+  \node[rectangle,draw,fill=green!20] (B) at (2,1.5) {B};
+  \draw[->,thick] (A) -- (B) node[midway,above] {arrow};
+\end{tikzpicture}"""
+}
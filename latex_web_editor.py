@@ -1,82 +1,413 @@
 import streamlit as st
-import subprocess
-import tempfile
-import os
-from PIL import Image
-import pdf2image
+from PIL import Image, ImageDraw
+import io
 import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from latex_compile import (ADMISSION, DEFAULT_ENGINE, available_engines, cache_key,
+                           compile_document, document_engine, split_preamble, synctex_for)
+from compile_daemon import DaemonError, daemon_address, daemon_compile
+from latex_log import LogParser
+from pdf_preview import BLOBS, get_preview
+from compile_profile import (TRACE_FILE, Profile, aggregate, format_aggregate, format_record,
+                             read_trace)
+from synctex_index import SyncTexIndex
+from tikz_external import compile_externalized, picture_document
+from tikz_index import TikzIndex
+from latex_templates import DEFAULT_DOCUMENT, DEFAULT_TIKZ, TIKZ_TEMPLATES, make_tikz_document
 
-def compile_latex_to_pdf(latex_code):
-    """Compile LaTeX code to PDF"""
+def compile_latex_to_pdf(latex_code, passes="auto", precompile_preamble=False, on_wait=None,
+                         engine=None, externalize=False):
+    """Compile LaTeX code to PDF (results are cached by content hash).
+
+    The engine is the document's "% !TEX program" line if it has one, else
+    engine, else the one selected in the sidebar.
+    passes="auto" only reruns the engine when the .aux/.log ask for it;
+    pass an integer to force a fixed number of runs. With
+    precompile_preamble the preamble is dumped to a cached format once and
+    later compiles with the same preamble start from it. With externalize
+    every tikzpicture is compiled once on its own and then included as a
+    PDF until it or the preamble changes. When LATEX_COMPILE_DAEMON is set
+    the job is sent to the shared compile daemon.
+    
+    Local compiles go through ADMISSION, which is shared by all sessions:
+    on_wait(position, running) is called while the job waits for a slot.
+    The stages of the compile are profiled (see show_profile_panel).
+    """
+    profile = Profile("web compile", chars=len(latex_code), externalize=externalize)
+    pdf_data, error = None, None
     try:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            tex_file = os.path.join(temp_dir, "document.tex")
-            pdf_file = os.path.join(temp_dir, "document.pdf")
+        with profile:
+            engine = document_engine(latex_code, engine or st.session_state.get("tex_engine"))
+            profile.info["engine"] = engine
+            if daemon_address():
+                try:
+                    with profile.stage("compile daemon"):
+                        result = daemon_compile(latex_code, passes=passes,
+                                                precompile_preamble=precompile_preamble,
+                                                engine=engine, externalize=externalize)
+                    pdf_data, error = result["pdf"], (None if result["pdf"] else result["log"])
+                    return pdf_data, error
+                except DaemonError as e:
+                    print(f"Compile daemon unavailable, compiling locally: {e}")
             
-            # Write LaTeX file
-            with open(tex_file, 'w', encoding='utf-8') as f:
-                f.write(latex_code)
+            queued = time.perf_counter()
             
-            # Compile LaTeX (run twice to ensure references are correct)
-            for i in range(2):
-                result = subprocess.run(
-                    ['pdflatex', '-interaction=nonstopmode', 
-                     '-output-directory', temp_dir, tex_file],
-                    capture_output=True,
-                    text=True,
-                    cwd=temp_dir,
-                    timeout=30
-                )
+            def compile_job():
+                profile.add("queue wait", (time.perf_counter() - queued) * 1000)
+                if not externalize:
+                    return compile_document(latex_code, passes=passes,
+                                            precompile_preamble=precompile_preamble, engine=engine)
+                pdf_data, log, stats = compile_externalized(
+                    latex_code, passes=passes, precompile_preamble=precompile_preamble,
+                    engine=engine)
+                print(f"TikZ pictures: {stats['externalized']} externalized, "
+                      f"{stats['inline']} compiled inline")
+                return pdf_data, log
             
-            if result.returncode == 0 and os.path.exists(pdf_file):
-                with open(pdf_file, 'rb') as f:
-                    return f.read(), None
-            else:
-                return None, result.stderr or result.stdout
-                
+            pdf_data, log = ADMISSION.run(cache_key(latex_code, engine, passes, externalize),
+                                          compile_job, on_wait=on_wait)
+            error = None if pdf_data else log
+            return pdf_data, error
     except Exception as e:
-        return None, str(e)
+        error = str(e)
+        return None, error
+    finally:
+        st.session_state.last_compile_profile = profile.finish(ok=bool(pdf_data))
+
+def queue_feedback():
+    """on_wait callback for compile_latex_to_pdf that shows the queue position"""
+    placeholder = st.empty()
+    
+    def on_wait(position, running):
+        if position:
+            placeholder.info(f"⏳ Waiting for a free compile slot: position {position} in queue "
+                             f"({running} compile(s) running)")
+        else:
+            placeholder.info("⏳ Another user is compiling the same document, sharing the result")
+    
+    return on_wait
+
+def show_queue_metrics():
+    """Sidebar panel with compile queue state and wait vs. compile times"""
+    summary = ADMISSION.summary()
+    with st.sidebar:
+        st.markdown("### 📊 Compile Queue")
+        col_m1, col_m2 = st.columns(2)
+        col_m1.metric("Running", f"{summary['running']}/{summary['slots']}")
+        col_m2.metric("Waiting", summary["waiting"])
+        col_m1.metric("Avg wait", f"{summary['wait_ms']['mean']:.0f} ms")
+        col_m2.metric("Avg compile", f"{summary['compile_ms']['mean']:.0f} ms")
+        st.caption(f"Last {summary['jobs']} jobs, {summary['coalesced']} shared with an identical "
+                   f"compile; p95 wait {summary['wait_ms']['p95']:.0f} ms, "
+                   f"p95 compile {summary['compile_ms']['p95']:.0f} ms")
+
+def show_engine_selector():
+    """Sidebar choice of the TeX engine used when a document does not name one"""
+    engines = available_engines() or [DEFAULT_ENGINE]
+    default = DEFAULT_ENGINE if DEFAULT_ENGINE in engines else engines[0]
+    with st.sidebar:
+        st.markdown("### ⚙️ TeX Engine")
+        st.selectbox("Engine", engines, index=engines.index(default), key="tex_engine",
+                     help="A '% !TEX program = xelatex' line in a document overrides this. "
+                          "Run bench_engines.py to compare engines on your documents.")
+
+PREVIEW_PAGES = 2  # default number of pages shown at a time in each preview
+THUMBNAIL_DPI = 48  # resolution of the quick first pass when thumbnails are on
+
+# A widget inside a fragment only reruns the fragment (Streamlit 1.33+), so
+# paging through a preview does not redraw the editors and error panes
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) \
+    or (lambda fn: fn)
+
+def store_pdf(pdf_data):
+    """Keep pdf_data in the shared BLOBS store; session state holds the returned hash"""
+    return BLOBS.add(pdf_data)
 
-def safe_replace_tikz(latex_content, new_tikz_content):
-    """Safely replace TikZ content to avoid regex errors"""
+@fragment
+def show_pdf_preview(pdf_ref, key, dpi=150, caption="PDF Preview"):
+    """Show the visible pages of a stored PDF, rasterizing only pages that changed"""
+    profile = Profile("web preview", dpi=dpi)
     try:
-        # Find tikzpicture start and end positions
-        start_pattern = r'\\begin\{tikzpicture\}'
-        end_pattern = r'\\end\{tikzpicture\}'
-        
-        start_match = re.search(start_pattern, latex_content)
-        if start_match:
-            # Search for corresponding end tag from first match
-            start_pos = start_match.start()
-            remaining_content = latex_content[start_pos:]
-            
-            end_match = re.search(end_pattern, remaining_content)
-            if end_match:
-                end_pos = start_pos + end_match.end()
-                
-                # Build new content
-                before = latex_content[:start_pos]
-                after = latex_content[end_pos:]
-                new_content = before + new_tikz_content + after
-                
-                return new_content
-        
-        # If no existing tikzpicture found, add to end of document
-        insert_pos = latex_content.rfind("\\end{document}")
-        if insert_pos != -1:
-            new_content = (latex_content[:insert_pos] + 
-                         "\n\\section{New Figure}\n" + 
-                         new_tikz_content + "\n\n" + 
-                         latex_content[insert_pos:])
+        pdf_data = BLOBS.get(pdf_ref)
+        if pdf_data is None:
+            st.info("🕰️ This PDF was dropped from the shared cache, compile again to see it")
+            return
+        with profile.stage("page fingerprints"):
+            preview = get_preview(pdf_data, dpi, ref=pdf_ref)
+        total = len(preview)
+        
+        # Remember the fingerprints of the previously shown PDF in this slot
+        history_key = f"{key}_history"
+        history = st.session_state.get(history_key)
+        if history is None or history["current"] != preview.fingerprints:
+            previous = history["current"] if history else None
+            history = {"current": preview.fingerprints, "previous": previous}
+            st.session_state[history_key] = history
+        changed = set(preview.changed_since(history["previous"]))
+        if history["previous"] is not None:
+            st.caption(f"{len(changed)} of {total} page(s) changed since the last compile")
+        
+        pages_shown = st.session_state.get("preview_pages", PREVIEW_PAGES)
+        first_page = 1
+        if total > pages_shown:
+            page_key = f"{key}_page"
+            # A shorter new document must not leave the selector out of range
+            if st.session_state.get(page_key, 1) > total:
+                st.session_state[page_key] = total
+            first_page = st.number_input(
+                f"First page shown (of {total})",
+                min_value=1, max_value=total, value=1, step=1, key=page_key
+            )
+        
+        indices = range(first_page - 1, min(total, first_page - 1 + pages_shown))
+        # One slot per page, filled as pages arrive from the parallel renderer
+        slots = {index: st.empty() for index in indices}
+        thumbnail_dpi = THUMBNAIL_DPI if st.session_state.get("preview_thumbnails", True) else None
+        rendered = 0
+        with profile.stage("rasterize and show"):
+            for index, image, final, render_ms in preview.pages(indices,
+                                                                thumbnail_dpi=thumbnail_dpi):
+                status = "changed" if index in changed else "unchanged"
+                if not final:
+                    status += ", quick preview, refining..."
+                elif render_ms is not None:
+                    status += f", ready after {render_ms:.0f} ms"
+                    rendered += 1
+                else:
+                    status += ", from cache"
+                slots[index].image(image, caption=f"{caption} (page {index + 1}/{total}, {status})",
+                                   use_column_width=True)
+        # Reruns that only showed cached pages are not worth a trace line
+        if rendered:
+            st.session_state.last_preview_profile = profile.finish(
+                pages=rendered, thumbnails=bool(thumbnail_dpi))
+    except Exception as e:
+        st.warning(f"⚠️ Cannot display preview: {e}")
+
+@lru_cache(maxsize=16)
+def synctex_index(pdf_ref):
+    """SyncTexIndex of a stored PDF, parsed once per process; None without SyncTeX data"""
+    pdf_data = BLOBS.get(pdf_ref)
+    data = synctex_for(pdf_data) if pdf_data else None
+    if not data:
+        return None
+    try:
+        return SyncTexIndex(data)
+    except Exception as e:
+        print(f"Cannot read SyncTeX data: {e}")
+        return None
+
+def source_snippet(latex_content, line, context=2):
+    """Lines around line (1-based) of latex_content, the line itself marked"""
+    lines = latex_content.splitlines()
+    first = max(1, line - context)
+    return "\n".join(f"{'>' if n == line else ' '}{n:5d}  {lines[n - 1]}"
+                     for n in range(first, min(len(lines), line + context) + 1))
+
+@fragment
+def show_click_to_source(pdf_ref, latex_content, dpi=150):
+    """Find the source line of a point on the page, and the page area of a line"""
+    index = synctex_index(pdf_ref)
+    pdf_data = BLOBS.get(pdf_ref)
+    if index is None or pdf_data is None:
+        return
+    with st.expander("🎯 Click-to-source", expanded=False):
+        preview = get_preview(pdf_data, dpi, ref=pdf_ref)
+        page = 1
+        if len(preview) > 1:
+            page = st.number_input(f"Page (of {len(preview)})", min_value=1,
+                                   max_value=len(preview), value=1, step=1, key="synctex_page")
+        image = Image.open(io.BytesIO(preview.page(page - 1)))
+        points_per_pixel = 72 / dpi
+        
+        try:  # optional: pip install streamlit-image-coordinates
+            from streamlit_image_coordinates import streamlit_image_coordinates
+        except ImportError:
+            streamlit_image_coordinates = None
+        point = None
+        if streamlit_image_coordinates:
+            st.caption("Click on the page to find its source line")
+            value = streamlit_image_coordinates(image, key="synctex_click")
+            if value:
+                # The image may be shown scaled down to the column width
+                scale = image.width / (value.get("width") or image.width)
+                point = (value["x"] * scale * points_per_pixel,
+                         value["y"] * scale * points_per_pixel)
         else:
-            new_content = latex_content + "\n\n" + new_tikz_content
-            
-        return new_content
+            st.caption("Position on the page (install streamlit-image-coordinates to click instead)")
+            col_x, col_y = st.columns(2)
+            x = col_x.slider("Across (%)", 0, 100, 50, key="synctex_x")
+            y = col_y.slider("Down (%)", 0, 100, 10, key="synctex_y")
+            point = (image.width * x / 100 * points_per_pixel,
+                     image.height * y / 100 * points_per_pixel)
+        if point:
+            line = index.edit(page, *point)
+            if line is None:
+                st.info("ℹ️ Nothing on the page there comes from the main document")
+            else:
+                st.markdown(f"📍 **Line {line}**")
+                st.code(source_snippet(latex_content, line), language="latex")
+        
+        st.markdown("🔎 **Show a line in the PDF**")
+        total_lines = max(1, latex_content.count("\n") + 1)
+        line = st.number_input("Source line", min_value=1, max_value=total_lines, value=1,
+                               step=1, key="synctex_line")
+        found = index.view(line)
+        if found is None:
+            st.info("ℹ️ This line put nothing on the pages")
+            return
+        found_page, (left, top, right, bottom) = found
+        image = Image.open(io.BytesIO(preview.page(found_page - 1))).convert("RGB")
+        pixels = dpi / 72
+        ImageDraw.Draw(image).rectangle(
+            [left * pixels - 3, top * pixels - 3, right * pixels + 3, bottom * pixels + 3],
+            outline=(255, 80, 0), width=3)
+        st.image(image, caption=f"Line {line} on page {found_page}", use_column_width=True)
+        st.caption("Line numbers refer to the last compiled version of the document")
+
+def show_preview_settings():
+    """Sidebar options of the PDF previews"""
+    with st.sidebar:
+        st.markdown("### 🖼️ Preview")
+        st.number_input("Pages shown at a time", min_value=1, max_value=100,
+                        value=PREVIEW_PAGES, step=1, key="preview_pages",
+                        help="Pages are rasterized in parallel, the first one first")
+        st.checkbox("⚡ Low-resolution pages first", value=True, key="preview_thumbnails",
+                    help=f"Show every new page at {THUMBNAIL_DPI} DPI at once, "
+                         "then replace it with the full-resolution page")
+
+def show_profile_panel():
+    """Sidebar panel with the stage timings of the last compile and preview"""
+    with st.sidebar:
+        with st.expander("⏱️ Profiling", expanded=False):
+            for label, key in (("Last compile", "last_compile_profile"),
+                               ("Last preview", "last_preview_profile")):
+                record = st.session_state.get(key)
+                if record:
+                    engine = f" ({record['engine']})" if record.get("engine") else ""
+                    st.markdown(f"**{label}**{engine}")
+                    st.code(format_record(record), language=None)
+            if TRACE_FILE is None:
+                st.caption("Tracing is off (LATEX_PROFILE_TRACE=0)")
+                return
+            if st.checkbox("📈 All sessions (trace file)", key="profile_aggregate"):
+                records = read_trace(last=500)
+                if records:
+                    st.code(format_aggregate(aggregate(records)), language=None)
+                st.caption(f"Last {len(records)} profiles in {TRACE_FILE}; "
+                           f"python compile_profile.py aggregates the whole file")
+
+# TikzIndex per document hash, shared by all sessions like BLOBS, so session
+# state does not hold another copy of the document
+_tikz_indexes = OrderedDict()
+_tikz_indexes_lock = threading.Lock()
+
+def _keep_tikz_index(pictures):
+    key = hashlib.sha256(pictures.text.encode("utf-8")).hexdigest()
+    with _tikz_indexes_lock:
+        _tikz_indexes[key] = pictures
+        _tikz_indexes.move_to_end(key)
+        while len(_tikz_indexes) > 32:
+            _tikz_indexes.popitem(last=False)
+
+def tikz_index(latex_content):
+    """TikzIndex of latex_content, built once per document text in this process.
+
+    Other sessions may hold the same index: read it, edit a copy().
+    """
+    key = hashlib.sha256(latex_content.encode("utf-8")).hexdigest()
+    with _tikz_indexes_lock:
+        pictures = _tikz_indexes.get(key)
+        if pictures is not None:
+            _tikz_indexes.move_to_end(key)
+            return pictures
+    pictures = TikzIndex(latex_content)
+    _keep_tikz_index(pictures)
+    return pictures
+
+def safe_replace_tikz(latex_content, new_tikz_content, index=0):
+    """Replace the index-th tikzpicture, or add a new figure if there is no such picture"""
+    try:
+        pictures = tikz_index(latex_content).copy()
+        if index < len(pictures):
+            pictures.replace(index, new_tikz_content)
+        else:
+            pictures.append(new_tikz_content)
+        # The copy describes the new text, so the next call reuses it
+        _keep_tikz_index(pictures)
+        return pictures.text
         
     except Exception as e:
         st.error(f"Error replacing TikZ content: {e}")
         return latex_content
 
+# Session state key of each error, its title and the button that copies it
+ERROR_PANES = (
+    ("main_latex_error", "Main File", "Copy Main File Error"),
+    ("tikz_error", "TikZ", "Copy TikZ Error"),
+    ("one_click_error", "One-Click", "Copy One-Click Error"),
+    ("quick_test_error", "Quick Test", "Copy Quick Test Error"),
+)
+
+@lru_cache(maxsize=64)
+def summarize_error(error_message, head_lines=100):
+    """Parse an error log once into diagnostics plus the first lines shown in the UI.
+
+    Memoized for the whole process: reruns and sessions showing the same log
+    share one summary, which callers must not modify.
+    """
+    parser = LogParser()
+    head = []
+    count = 0
+    for count, line in enumerate(error_message.splitlines(), 1):
+        if count <= head_lines:
+            head.append(line)
+        parser.feed(line)
+    return {"text": error_message, "report": parser.close(), "head": "\n".join(head),
+            "lines": count}
+
+def error_details(key):
+    """summarize_error() of st.session_state[key]"""
+    return summarize_error(st.session_state[key])
+
+def escape_markdown(text):
+    """Escape characters that st.markdown would interpret (TeX messages contain many)"""
+    return re.sub(r"([\\`*_$\[\]<>#|~])", r"\\\1", text)
+
+def show_error_pane(key, label, copy_label):
+    """Show the stored error for key, first error on top; returns False if there is none"""
+    error_message = st.session_state[key]
+    if not error_message or error_message.isspace():
+        return False
+    details = error_details(key)
+    report = details["report"]
+    first = report.first_error
+    
+    st.error(f"❌ **{label} Compilation Error**")
+    if first:
+        where = f"`{first.location()}` " if first.location() else ""
+        st.markdown(f"**First error:** {where}{escape_markdown(first.message)}")
+        if first.context:
+            st.code(first.context, language="latex")
+    if report.errors or report.warnings or report.boxes:
+        st.caption(report.summary())
+    
+    with st.expander(f"🔍 View {label} Error Details", expanded=first is None):
+        for diagnostic in report.errors[1:20]:
+            st.markdown(f"- ❌ `{diagnostic.location()}` {escape_markdown(diagnostic.message)}")
+        for diagnostic in report.warnings[:20]:
+            st.markdown(f"- ⚠️ `{diagnostic.location()}` {escape_markdown(diagnostic.message)}")
+        # Show first 100 lines to avoid overwhelming display
+        st.code(details["head"], language="text")
+        if details["lines"] > 100:
+            st.info(f"Showing first 100 lines of {details['lines']} total lines. "
+                    f"Use '{copy_label}' button to get full error.")
+    return True
+
 def copy_error_to_clipboard(error_message, lines=30):
     """Copy first N lines of error message to clipboard"""
     try:
@@ -113,7 +444,8 @@ def one_click_paste_and_compile():
         
         # Update main LaTeX code
         current_latex = st.session_state.latex_content
-        new_latex = safe_replace_tikz(current_latex, clipboard_content)
+        new_latex = safe_replace_tikz(current_latex, clipboard_content,
+                                      st.session_state.get("target_picture", 0))
         st.session_state.latex_content = new_latex
         
         return clipboard_content
@@ -135,50 +467,16 @@ def main():
     st.title("📝 LaTeX Editor with PDF Preview & TikZ Graphics")
     st.markdown("---")
     
+    show_queue_metrics()
+    show_engine_selector()
+    show_preview_settings()
+    
     # Initialize session state
     if 'latex_content' not in st.session_state:
-        st.session_state.latex_content = r"""\documentclass[12pt]{article}
-\usepackage[utf8]{inputenc}
-\usepackage{amsmath}
-\usepackage{amsfonts}
-\usepackage{geometry}
-\usepackage{tikz}
-\usetikzlibrary{positioning,shapes,arrows,decorations.markings}
-
-\geometry{a4paper, margin=2.5cm}
-
-\title{My LaTeX Document}
-\author{Author Name}
-\date{\today}
-
-\begin{document}
-
-\maketitle
-
-\section{Introduction}
-This is a sample LaTeX document created with LaTeX editor, supporting TikZ graphics.
-
-\section{Math Examples}
-Einstein's mass-energy equation:
-\begin{equation}
-E = mc^2
-\end{equation}
-
-\section{TikZ Graphics Example}
-\begin{tikzpicture}
-  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
-  \node[rectangle,draw,fill=green!20] (B) at (2,1.5) {B};
-  \draw[->,thick] (A) -- (B) node[midway,above] {arrow};
-\end{tikzpicture}
-
-\end{document}"""
+        st.session_state.latex_content = DEFAULT_DOCUMENT
 
     if 'tikz_content' not in st.session_state:
-        st.session_state.tikz_content = r"""\begin{tikzpicture}
-  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
-  \node[rectangle,draw,fill=green!20] (B) at (2,1.5) {B};
-  \draw[->,thick] (A) -- (B) node[midway,above] {arrow};
-\end{tikzpicture}"""
+        st.session_state.tikz_content = DEFAULT_TIKZ
 
     # Error message states
     if 'main_latex_error' not in st.session_state:
@@ -196,6 +494,17 @@ E = mc^2
     if 'quick_test_error' not in st.session_state:
         st.session_state.quick_test_error = ""
     
+    # Last successful PDFs, kept so previews survive reruns. Only the BLOBS
+    # hash is kept per session; see store_pdf()
+    if 'main_pdf' not in st.session_state:
+        st.session_state.main_pdf = None
+    
+    if 'tikz_pdf' not in st.session_state:
+        st.session_state.tikz_pdf = None
+    
+    if 'quick_result' not in st.session_state:
+        st.session_state.quick_result = None
+    
     # 🚀 Quick operations area
     st.markdown("### 🚀 Quick Operations")
     col_quick1, col_quick2, col_quick3 = st.columns([1, 1, 2])
@@ -252,54 +561,9 @@ E = mc^2
     
     error_displayed = False
     
-    # Main LaTeX Error Display
-    if st.session_state.main_latex_error.strip():
-        st.error("❌ **Main File Compilation Error**")
-        with st.expander("🔍 View Main File Error Details", expanded=True):
-            # Show first 100 lines to avoid overwhelming display
-            error_lines = st.session_state.main_latex_error.splitlines()
-            if len(error_lines) > 100:
-                st.code('\n'.join(error_lines[:100]), language="text")
-                st.info(f"Showing first 100 lines of {len(error_lines)} total lines. Use 'Copy Main File Error' button to get full error.")
-            else:
-                st.code(st.session_state.main_latex_error, language="text")
-        error_displayed = True
-    
-    # TikZ Error Display
-    if st.session_state.tikz_error.strip():
-        st.error("❌ **TikZ Compilation Error**")
-        with st.expander("🔍 View TikZ Error Details", expanded=True):
-            error_lines = st.session_state.tikz_error.splitlines()
-            if len(error_lines) > 100:
-                st.code('\n'.join(error_lines[:100]), language="text")
-                st.info(f"Showing first 100 lines of {len(error_lines)} total lines. Use 'Copy TikZ Error' button to get full error.")
-            else:
-                st.code(st.session_state.tikz_error, language="text")
-        error_displayed = True
-    
-    # One-Click Error Display
-    if st.session_state.one_click_error.strip():
-        st.error("❌ **One-Click Compilation Error**")
-        with st.expander("🔍 View One-Click Error Details", expanded=True):
-            error_lines = st.session_state.one_click_error.splitlines()
-            if len(error_lines) > 100:
-                st.code('\n'.join(error_lines[:100]), language="text")
-                st.info(f"Showing first 100 lines of {len(error_lines)} total lines. Use 'Copy One-Click Error' button to get full error.")
-            else:
-                st.code(st.session_state.one_click_error, language="text")
-        error_displayed = True
-    
-    # Quick Test Error Display
-    if st.session_state.quick_test_error.strip():
-        st.error("❌ **Quick Test Compilation Error**")
-        with st.expander("🔍 View Quick Test Error Details", expanded=True):
-            error_lines = st.session_state.quick_test_error.splitlines()
-            if len(error_lines) > 100:
-                st.code('\n'.join(error_lines[:100]), language="text")
-                st.info(f"Showing first 100 lines of {len(error_lines)} total lines. Use 'Copy Quick Test Error' button to get full error.")
-            else:
-                st.code(st.session_state.quick_test_error, language="text")
-        error_displayed = True
+    for key, label, copy_label in ERROR_PANES:
+        if show_error_pane(key, label, copy_label):
+            error_displayed = True
     
     if not error_displayed:
         st.success("✅ No compilation errors")
@@ -321,48 +585,19 @@ E = mc^2
             
             if clipboard_content:
                 # Create standalone LaTeX document
-                tikz_latex = "\\documentclass{standalone}\n"
-                tikz_latex += "\\usepackage{tikz}\n"
-                tikz_latex += "\\usetikzlibrary{positioning,shapes,arrows,decorations.markings,patterns,calc}\n"
-                tikz_latex += "\\begin{document}\n"
-                tikz_latex += clipboard_content + "\n"
-                tikz_latex += "\\end{document}"
+                tikz_latex = make_tikz_document(clipboard_content)
                 
-                pdf_data, error = compile_latex_to_pdf(tikz_latex)
+                pdf_data, error = compile_latex_to_pdf(tikz_latex, precompile_preamble=True,
+                                                       on_wait=queue_feedback())
                 
                 if pdf_data:
                     st.success("✅ One-click operation completed!")
                     st.session_state.one_click_error = ""  # Clear previous errors
-                    
-                    col_result1, col_result2 = st.columns([1, 1])
-                    
-                    with col_result1:
-                        st.markdown("**🖼️ TikZ Graphics Preview**")
-                        try:
-                            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                                tmp.write(pdf_data)
-                                tmp_path = tmp.name
-                            
-                            images = pdf2image.convert_from_path(tmp_path, dpi=200)
-                            if images:
-                                st.image(images, caption="TikZ Graphics", use_column_width=True)
-                            
-                            os.unlink(tmp_path)
-                            
-                        except Exception as e:
-                            st.warning(f"⚠️ Cannot display preview: {e}")
-                    
-                    with col_result2:
-                        st.markdown("**📄 Pasted Code**")
-                        st.code(clipboard_content, language="latex")
-                        
-                        st.download_button(
-                            label="📥 Download TikZ Figure",
-                            data=pdf_data,
-                            file_name="tikz_figure.pdf",
-                            mime="application/pdf",
-                            type="secondary"
-                        )
+                    st.session_state.quick_result = {
+                        "caption": "TikZ Graphics",
+                        "pdf": store_pdf(pdf_data),
+                        "code": clipboard_content,
+                    }
                     
                     st.rerun()  # Reload to clear error display
                 
@@ -377,32 +612,19 @@ E = mc^2
             current_tikz = st.session_state.tikz_content
             if current_tikz.strip():
                 # Create standalone LaTeX document
-                tikz_latex = "\\documentclass{standalone}\n"
-                tikz_latex += "\\usepackage{tikz}\n"
-                tikz_latex += "\\usetikzlibrary{positioning,shapes,arrows,decorations.markings,patterns,calc}\n"
-                tikz_latex += "\\begin{document}\n"
-                tikz_latex += current_tikz + "\n"
-                tikz_latex += "\\end{document}"
+                tikz_latex = make_tikz_document(current_tikz)
                 
-                pdf_data, error = compile_latex_to_pdf(tikz_latex)
+                pdf_data, error = compile_latex_to_pdf(tikz_latex, precompile_preamble=True,
+                                                       on_wait=queue_feedback())
                 
                 if pdf_data:
                     st.success("✅ Quick test completed!")
                     st.session_state.quick_test_error = ""  # Clear previous errors
-                    
-                    try:
-                        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                            tmp.write(pdf_data)
-                            tmp_path = tmp.name
-                        
-                        images = pdf2image.convert_from_path(tmp_path, dpi=200)
-                        if images:
-                            st.image(images, caption="Quick TikZ Test Result", use_column_width=True)
-                        
-                        os.unlink(tmp_path)
-                        
-                    except Exception as e:
-                        st.warning(f"⚠️ Cannot display preview: {e}")
+                    st.session_state.quick_result = {
+                        "caption": "Quick TikZ Test Result",
+                        "pdf": store_pdf(pdf_data),
+                        "code": None,
+                    }
                     
                     st.rerun()  # Reload to clear error display
                 else:
@@ -412,6 +634,30 @@ E = mc^2
             else:
                 st.warning("⚠️ TikZ editor is empty")
     
+    # Latest One-Click / Quick Test result
+    if st.session_state.quick_result:
+        quick_result = st.session_state.quick_result
+        col_result1, col_result2 = st.columns([1, 1])
+        
+        with col_result1:
+            st.markdown("**🖼️ TikZ Graphics Preview**")
+            show_pdf_preview(quick_result["pdf"], key="quick_preview", dpi=200,
+                             caption=quick_result["caption"])
+        
+        with col_result2:
+            if quick_result["code"]:
+                st.markdown("**📄 Pasted Code**")
+                st.code(quick_result["code"], language="latex")
+            
+            st.download_button(
+                label="📥 Download TikZ Figure",
+                data=BLOBS.get(quick_result["pdf"]) or b"",
+                file_name="tikz_figure.pdf",
+                mime="application/pdf",
+                type="secondary",
+                key="download_quick"
+            )
+    
     st.markdown("---")
     
     # Create three-column layout
@@ -437,11 +683,15 @@ E = mc^2
         
         with col1_1:
             compile_button = st.button("🔄 Compile PDF", type="primary", key="compile_main")
+            externalize_pictures = st.checkbox(
+                "🧩 Cache TikZ pictures", value=True, key="externalize_tikz",
+                help="Compile each tikzpicture once and reuse it until it or the preamble changes")
         
         with col1_2:
             if st.button("🗑️ Clear Main File", key="clear_main"):
                 st.session_state.latex_content = ""
                 st.session_state.main_latex_error = ""
+                st.session_state.main_pdf = None
                 st.rerun()
         
         # Second row: error copy buttons
@@ -481,35 +731,13 @@ E = mc^2
                 st.warning("⚠️ Please enter LaTeX code")
             else:
                 with st.spinner("🔄 Compiling main file..."):
-                    pdf_data, error = compile_latex_to_pdf(latex_code)
+                    pdf_data, error = compile_latex_to_pdf(latex_code, on_wait=queue_feedback(),
+                                                           externalize=externalize_pictures)
                     
                     if pdf_data:
                         st.success("✅ Compilation successful!")
                         st.session_state.main_latex_error = ""
-                        
-                        # Provide download button
-                        st.download_button(
-                            label="📥 Download Complete PDF",
-                            data=pdf_data,
-                            file_name="document.pdf",
-                            mime="application/pdf",
-                            type="secondary"
-                        )
-                        
-                        # Display PDF preview
-                        try:
-                            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                                tmp.write(pdf_data)
-                                tmp_path = tmp.name
-                            
-                            images = pdf2image.convert_from_path(tmp_path, dpi=150)
-                            if images:
-                                st.image(images, caption="Main File PDF Preview", use_column_width=True)
-                            
-                            os.unlink(tmp_path)
-                            
-                        except Exception as e:
-                            st.warning(f"⚠️ Cannot display preview: {e}")
+                        st.session_state.main_pdf = store_pdf(pdf_data)
                         
                         st.rerun()  # Reload to update error display
                             
@@ -522,6 +750,20 @@ E = mc^2
                         
                         # Only reload on error to update error display
                         st.rerun()
+        
+        # Last successful main file PDF
+        if st.session_state.main_pdf:
+            st.download_button(
+                label="📥 Download Complete PDF",
+                data=BLOBS.get(st.session_state.main_pdf) or b"",
+                file_name="document.pdf",
+                mime="application/pdf",
+                type="secondary",
+                key="download_main"
+            )
+            show_pdf_preview(st.session_state.main_pdf, key="main_preview", dpi=150,
+                             caption="Main File PDF Preview")
+            show_click_to_source(st.session_state.main_pdf, latex_code)
     
     with col2:
         st.header("🖼️ TikZ Graphics Test Area")
@@ -548,6 +790,7 @@ E = mc^2
             if st.button("🗑️ Clear TikZ", key="clear_tikz"):
                 st.session_state.tikz_content = ""
                 st.session_state.tikz_error = ""
+                st.session_state.tikz_pdf = None
                 st.rerun()
         
         # TikZ error copy button
@@ -586,43 +829,16 @@ E = mc^2
                 st.warning("⚠️ Please enter TikZ code")
             else:
                 with st.spinner("🔄 Compiling TikZ graphics..."):
-                    # Create standalone TikZ file
-                    tikz_latex = "\\documentclass{standalone}\n"
-                    tikz_latex += "\\usepackage{tikz}\n"
-                    tikz_latex += "\\usetikzlibrary{positioning,shapes,arrows,decorations.markings,patterns,calc}\n"
-                    tikz_latex += "\\begin{document}\n"
-                    tikz_latex += tikz_code + "\n"
-                    tikz_latex += "\\end{document}"
+                    # Create standalone LaTeX document
+                    tikz_latex = make_tikz_document(tikz_code)
                     
-                    pdf_data, error = compile_latex_to_pdf(tikz_latex)
+                    pdf_data, error = compile_latex_to_pdf(tikz_latex, precompile_preamble=True,
+                                                           on_wait=queue_feedback())
                     
                     if pdf_data:
                         st.success("✅ TikZ graphics compilation successful!")
                         st.session_state.tikz_error = ""
-                        
-                        # Provide download button
-                        st.download_button(
-                            label="📥 Download TikZ Figure",
-                            data=pdf_data,
-                            file_name="tikz_figure.pdf",
-                            mime="application/pdf",
-                            type="secondary"
-                        )
-                        
-                        # Display TikZ preview
-                        try:
-                            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-                                tmp.write(pdf_data)
-                                tmp_path = tmp.name
-                            
-                            images = pdf2image.convert_from_path(tmp_path, dpi=200)
-                            if images:
-                                st.image(images, caption="TikZ Graphics Preview", use_column_width=True)
-                            
-                            os.unlink(tmp_path)
-                            
-                        except Exception as e:
-                            st.warning(f"⚠️ Cannot display TikZ preview: {e}")
+                        st.session_state.tikz_pdf = store_pdf(pdf_data)
                         
                         st.rerun()  # Reload to update error display
                             
@@ -636,6 +852,19 @@ E = mc^2
                         # Only reload on error
                         st.rerun()
         
+        # Last successful TikZ PDF
+        if st.session_state.tikz_pdf:
+            st.download_button(
+                label="📥 Download TikZ Figure",
+                data=BLOBS.get(st.session_state.tikz_pdf) or b"",
+                file_name="tikz_figure.pdf",
+                mime="application/pdf",
+                type="secondary",
+                key="download_tikz"
+            )
+            show_pdf_preview(st.session_state.tikz_pdf, key="tikz_preview", dpi=200,
+                             caption="TikZ Graphics Preview")
+        
         # TikZ examples
         with st.expander("💡 TikZ Code Examples"):
             st.code("""
@@ -668,6 +897,49 @@ E = mc^2
         
         st.markdown("**Manual Operation Mode**")
         
+        # Which picture of the main file Apply / One-Click replace
+        pictures = tikz_index(st.session_state.latex_content)
+        if st.session_state.get("target_picture", 0) > len(pictures):
+            st.session_state.target_picture = len(pictures)
+        target = st.selectbox(
+            "🎯 Target picture in main file:",
+            list(range(len(pictures) + 1)),
+            format_func=lambda i: (pictures.label(i) if i < len(pictures)
+                                   else "➕ New figure at end of document"),
+            key="target_picture"
+        )
+        
+        col3_t1, col3_t2 = st.columns([1, 1])
+        with col3_t1:
+            load_picture_button = st.button("📥 Load Picture", key="load_picture",
+                                            disabled=target >= len(pictures))
+        with col3_t2:
+            compile_picture_button = st.button("🎯 Compile Picture", key="compile_picture",
+                                               disabled=target >= len(pictures),
+                                               help="Compile only this picture with the main file's preamble")
+        
+        if load_picture_button:
+            st.session_state.clipboard_content = pictures[target]
+            st.rerun()
+        
+        if compile_picture_button:
+            preamble, _ = split_preamble(st.session_state.latex_content)
+            picture = pictures[target]
+            with st.spinner(f"🔄 Compiling picture {target + 1}..."):
+                pdf_data, error = compile_latex_to_pdf(
+                    picture_document(preamble, picture) if preamble else make_tikz_document(picture),
+                    precompile_preamble=True, on_wait=queue_feedback())
+            if pdf_data:
+                st.session_state.quick_test_error = ""
+                st.session_state.quick_result = {
+                    "caption": f"Picture {target + 1} of Main File",
+                    "pdf": store_pdf(pdf_data),
+                    "code": picture,
+                }
+            else:
+                st.session_state.quick_test_error = error if error else "Unknown error"
+            st.rerun()
+        
         # Display clipboard content input box
         clipboard_input = st.text_area(
             "Or directly input TikZ code here:",
@@ -713,7 +985,8 @@ E = mc^2
                 
                 # Use safe replace function to update main LaTeX code
                 current_latex = st.session_state.latex_content
-                new_latex = safe_replace_tikz(current_latex, tikz_content)
+                new_latex = safe_replace_tikz(current_latex, tikz_content,
+                                              st.session_state.get("target_picture", 0))
                 st.session_state.latex_content = new_latex
                 st.session_state.clipboard_content = ""  # Clear input box
                 
@@ -726,33 +999,7 @@ E = mc^2
         # Quick TikZ templates
         st.markdown("**Quick TikZ Templates**")
         
-        template_options = {
-            "Basic Nodes": r"""\begin{tikzpicture}
-  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
-  \node[rectangle,draw,fill=red!20] (B) at (2,0) {B};
-  \draw[->] (A) -- (B);
-\end{tikzpicture}""",
-            "Flowchart (positioning)": r"""\begin{tikzpicture}
-  \node[draw,rounded corners] (start) {Start};
-  \node[draw,below=of start] (process) {Process};
-  \node[draw,diamond,below=of process] (decision) {Decision?};
-  \node[draw,rounded corners,below=of decision] (end) {End};
-  \draw[->] (start) -- (process);
-  \draw[->] (process) -- (decision);
-  \draw[->] (decision) -- (end);
-\end{tikzpicture}""",
-            "Math Function": r"""\begin{tikzpicture}
-  \draw[->] (-2,0) -- (2,0) node[right] {$x$};
-  \draw[->] (0,-1) -- (0,2) node[above] {$y$};
-  \draw[domain=-1.5:1.5,blue,thick] plot (\x,{\x*\x});
-  \node at (1,1.5) {$y=x^2$};
-\end{tikzpicture}""",
-            "Your Example": r"""\begin{tikzpicture}
-  \node[circle,draw,fill=blue!20] (A) at (0,0) {A};
-  \node[rectangle,draw,fill=green!20] (B) at (2,1.5) {B};
-  \draw[->,thick] (A) -- (B) node[midway,above] {arrow};
-\end{tikzpicture}"""
-        }
+        template_options = TIKZ_TEMPLATES
         
         selected_template = st.selectbox("Select template:", list(template_options.keys()))
         
@@ -760,6 +1007,9 @@ E = mc^2
             st.session_state.clipboard_content = template_options[selected_template]
             st.success(f"✅ {selected_template} template loaded to input box")
             st.rerun()
+    
+    # Last, so it shows the profiles recorded while this run drew the previews
+    show_profile_panel()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,248 @@
+# pdf_preview.py
+# In-memory PDF page rasterization for the LaTeX editors.
+# Requires: pdf2image (poppler-utils). pypdf is used, when installed, to
+# fingerprint individual pages so unchanged pages are never re-rendered.
+
+import os, hashlib, tempfile, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import pdf2image
+
+# Page dictionary entries that do not affect how the page looks
+_IGNORED_KEYS = {"/Parent", "/FontFile", "/FontFile2", "/FontFile3", "/Annots"}
+
+def _hash_object(h, obj, seen, depth=0):
+    """Feed a pypdf object tree into h, following indirect references once"""
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in seen:
+            h.update(b"<ref>")
+            return
+        seen.add(ref)
+        obj = obj.get_object()
+    if depth > 10:
+        return
+    if isinstance(obj, StreamObject):
+        h.update(obj.get_data())
+    if isinstance(obj, DictionaryObject):
+        for key in sorted(obj.keys()):
+            if key in _IGNORED_KEYS:
+                continue
+            h.update(key.encode("latin-1", "replace"))
+            _hash_object(h, obj.raw_get(key), seen, depth + 1)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            _hash_object(h, item, seen, depth + 1)
+    elif not isinstance(obj, StreamObject):
+        h.update(repr(obj).encode("utf-8", "replace"))
+
+def page_fingerprints(pdf_data: bytes):
+    """One hash per page over its content stream and resources.
+
+    Without pypdf the hashes fall back to (whole file, page number), which
+    still lets an identical PDF reuse every rendered page.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        digest = hashlib.sha256(pdf_data).hexdigest()
+        pages = pdf2image.pdfinfo_from_bytes(pdf_data)["Pages"]
+        return [f"{digest}:{i}" for i in range(pages)]
+
+    fingerprints = []
+    for page in PdfReader(BytesIO(pdf_data)).pages:
+        h = hashlib.sha256()
+        _hash_object(h, page.get("/Contents"), set())
+        _hash_object(h, page.get("/Resources"), set())
+        h.update(repr([float(v) for v in page.mediabox]).encode())
+        fingerprints.append(h.hexdigest())
+    return fingerprints
+
+def changed_pages(old_fingerprints, new_fingerprints):
+    """Indices of new pages whose content does not occur in the old PDF.
+
+    Pages are matched by fingerprint rather than position, so inserting a
+    page only marks the inserted page as changed.
+    """
+    old = set(old_fingerprints or ())
+    return [i for i, fp in enumerate(new_fingerprints) if fp not in old]
+
+def render_page(pdf_data: bytes, index: int, dpi=150):
+    """Rasterize page index (0-based) of an in-memory PDF to a PIL image"""
+    images = pdf2image.convert_from_bytes(
+        pdf_data, dpi=dpi, first_page=index + 1, last_page=index + 1)
+    return images[0]
+
+# Parallel poppler processes used by render_pages()
+RENDER_WORKERS = int(os.environ.get("LATEX_PREVIEW_WORKERS", "0")) or min(8, os.cpu_count() or 2)
+
+def _chunks(indices, workers):
+    """Split page indices into runs of consecutive pages, first page alone"""
+    if not indices:
+        return []
+    first, rest = indices[:1], indices[1:]
+    size = max(1, -(-len(rest) // (2 * workers)))   # ~2 chunks per worker
+    runs = []
+    for index in rest:
+        if runs and index == runs[-1][-1] + 1 and len(runs[-1]) < size:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return [first] + runs
+
+def render_pages(pdf_data: bytes, indices, dpi=150, workers=RENDER_WORKERS):
+    """Yield (index, PNG bytes) for the given pages as soon as each is ready.
+
+    Page ranges are rasterized by several pdftoppm processes at once. The
+    first requested page is rendered on its own, so it is shown first
+    instead of waiting for a whole range; the rest come in completion order.
+    """
+    indices = list(indices)
+    if not indices:
+        return
+    with tempfile.TemporaryDirectory(prefix="preview-") as tmp:
+        path = os.path.join(tmp, "document.pdf")
+        with open(path, "wb") as f:
+            f.write(pdf_data)       # written once, read by every worker
+
+        def render(run):
+            images = pdf2image.convert_from_path(
+                path, dpi=dpi, first_page=run[0] + 1, last_page=run[-1] + 1)
+            return [(index, to_png(image)) for index, image in zip(run, images)]
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(render, run) for run in _chunks(indices, workers)]
+            # The first page's chunk was submitted first; wait for it first
+            yield from futures[0].result()
+            for future in as_completed(futures[1:]):
+                yield from future.result()
+
+def to_png(image) -> bytes:
+    buf = BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+class PageImageCache:
+    """LRU of rendered pages as PNG bytes keyed by (page fingerprint, dpi).
+
+    Keeping the encoded PNG means an unchanged page is handed to the UI as
+    the very same bytes, so it is neither re-rendered nor re-encoded.
+    """
+
+    def __init__(self, max_bytes=200 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._images = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self._lock:
+            if key in self._images:
+                return
+            self._images[key] = image
+            self._size += len(image)
+            while self._size > self.max_bytes and len(self._images) > 1:
+                _, old = self._images.popitem(last=False)
+                self._size -= len(old)
+
+PAGE_CACHE = PageImageCache()
+
+class BlobStore(PageImageCache):
+    """Process-wide LRU of PDFs and other large results, keyed by content hash.
+
+    Streamlit sessions keep only the hash, so a PDF shown in many sessions
+    is held once and per-session state stays small. get() returns None
+    once an entry has been evicted.
+    """
+
+    def add(self, data: bytes) -> str:
+        ref = hashlib.sha256(data).hexdigest()
+        self.put(ref, data)
+        return ref
+
+BLOBS = BlobStore(int(os.environ.get("LATEX_EDITOR_BLOB_MB", "256")) * 1024 * 1024)
+
+class PdfPreview:
+    """Pages of one PDF, rasterized lazily and shared through PAGE_CACHE"""
+
+    def __init__(self, pdf_data: bytes, dpi=150, cache=PAGE_CACHE):
+        self.pdf_data = pdf_data
+        self.dpi = dpi
+        self.cache = cache
+        self.fingerprints = page_fingerprints(pdf_data)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def changed_since(self, previous_fingerprints):
+        return changed_pages(previous_fingerprints, self.fingerprints)
+
+    def pages(self, indices, thumbnail_dpi=None, workers=RENDER_WORKERS):
+        """Yield (index, PNG bytes, final, render_ms) for pages, cached ones first.
+
+        Missing pages are rendered in parallel with render_pages(). With
+        thumbnail_dpi every missing page is first yielded at that low
+        resolution (final=False) and then again at self.dpi (final=True).
+        render_ms is the time until a page rendered by this call was ready,
+        None for cached pages and thumbnails. The preview is shared by
+        every session, so these numbers belong to the call, not to it.
+        """
+        missing = []
+        for index in indices:
+            image = self.cache.get((self.fingerprints[index], self.dpi))
+            if image is None:
+                missing.append(index)
+            else:
+                yield index, image, True, None
+        if not missing:
+            return
+        if thumbnail_dpi and thumbnail_dpi < self.dpi:
+            for index, image in render_pages(self.pdf_data, missing, thumbnail_dpi, workers):
+                yield index, image, False, None
+        start = time.perf_counter()
+        for index, image in render_pages(self.pdf_data, missing, self.dpi, workers):
+            # Wall time until the page was ready, parallel renders overlap
+            render_ms = (time.perf_counter() - start) * 1000
+            self.cache.put((self.fingerprints[index], self.dpi), image)
+            yield index, image, True, render_ms
+
+    def page(self, index: int) -> bytes:
+        """Return page index as PNG bytes, rendering it only on a cache miss"""
+        key = (self.fingerprints[index], self.dpi)
+        image = self.cache.get(key)
+        if image is None:
+            image = to_png(render_page(self.pdf_data, index, self.dpi))
+            self.cache.put(key, image)
+        return image
+
+_previews = OrderedDict()
+_previews_lock = threading.Lock()
+
+def get_preview(pdf_data: bytes, dpi=150, ref=None) -> PdfPreview:
+    """PdfPreview for pdf_data, reused across reruns so pages are parsed once.
+
+    ref is the BLOBS hash of pdf_data, if known, which saves rehashing it.
+    """
+    key = (ref or hashlib.sha256(pdf_data).hexdigest(), dpi)
+    with _previews_lock:
+        preview = _previews.get(key)
+        if preview is not None:
+            _previews.move_to_end(key)
+            return preview
+    preview = PdfPreview(pdf_data, dpi)
+    with _previews_lock:
+        _previews[key] = preview
+        while len(_previews) > 16:
+            _previews.popitem(last=False)
+    return preview
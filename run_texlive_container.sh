@@ -1,6 +1,11 @@
 #!/bin/bash
 # This script runs a Docker container with TeX Live Full, mounting the current directory
 # to allow working on LaTeX files within the container.
+#
+# By default it opens a shell in the long-lived TeX Live session container
+# (texlive_session.py), which keeps its font and format caches between uses
+# and is the one the editors compile in when TeX is not installed locally.
+# Use --fresh for a throwaway container as before.
 
 # Ensure the user is in the docker group or use sudo
 if groups | grep -q docker; then
@@ -9,5 +14,12 @@ else
     DOCKER_CMD="sudo docker"
 fi
 
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+if [ "$1" != "--fresh" ] && command -v python3 >/dev/null 2>&1 \
+        && [ -f "$SCRIPT_DIR/texlive_session.py" ]; then
+    DOCKER="$DOCKER_CMD" PYTHONPATH="$SCRIPT_DIR" \
+        exec python3 "$SCRIPT_DIR/texlive_session.py" shell
+fi
+
 # Run the container with the current directory mounted
 $DOCKER_CMD run -it --rm -v "$(pwd)":/workdir -w /workdir texlive/texlive:latest bash
@@ -0,0 +1,154 @@
+# synctex_index.py
+# In-memory index of a SyncTeX file for click-to-source (preview position ->
+# source line) and source-to-preview (line -> page and box) lookups.
+# The .synctex(.gz) is parsed once; lookups are bisections in sorted tables.
+
+import re, gzip
+from bisect import bisect_left, bisect_right
+from pathlib import PurePath
+
+SP_PER_BP = 65781.76        # TeX scaled points per PDF point
+# Boxes taller than this (pictures, whole paragraphs) are kept apart and
+# checked one by one; everything else is found by its baseline
+TALL_BOX_BP = 40.0
+NEAR_BP = 20.0              # how far from a click a baseline is looked for
+
+# "(1,10:4736286,4736286:25137152,40009000,0": kind, tag, line, optional
+# column, h, v and, for boxes and kerns, width, height, depth
+RECORD_RE = re.compile(
+    rb"^([\[\(vhxkg$])(\d+),(\d+)(?:,-?\d+)?:(-?\d+),(-?\d+)(?::(-?\d+)(?:,(-?\d+),(-?\d+))?)?")
+INPUT_RE = re.compile(rb"^Input:(\d+):(.*)$")
+
+class _Page:
+    """Records of one page: (baseline, left, right, top, bottom, line)"""
+
+    def __init__(self, records):
+        short = sorted(r for r in records if r[4] - r[3] <= TALL_BOX_BP)
+        self.baselines = [r[0] for r in short]
+        self.records = short
+        self.tall = [r for r in records if r[4] - r[3] > TALL_BOX_BP]
+
+def _distance(record, x, y):
+    """Distance from (x, y) to a record's box; vertical misses count double"""
+    _, left, right, top, bottom, _ = record
+    dx = max(left - x, 0.0, x - right)
+    dy = max(top - y, 0.0, y - bottom)
+    return dx + 2 * dy
+
+def _closest(records, x, y):
+    """Record closest to (x, y); among those containing it, the smallest"""
+    if not records:
+        return None
+    return min(records, key=lambda r: (_distance(r, x, y), (r[2] - r[1]) * (r[4] - r[3])))
+
+class SyncTexIndex:
+    """Source lines of the boxes TeX put on each page, in PDF points.
+
+    inputs maps source file names (basename) to the offset added to their
+    line numbers, e.g. {"body.tex": 12} when body.tex starts at line 13 of
+    the edited document; records of other files are dropped. Coordinates
+    are measured from the top-left corner of the page.
+    """
+
+    def __init__(self, data: bytes, inputs=None):
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+        inputs = inputs or {"document.tex": 0}
+        unit, magnification, x_offset, y_offset = 1, 1000, 0, 0
+        offsets = {}                    # tag -> line offset, kept inputs only
+        pages = {}
+        records = None
+        for raw in data.split(b"\n"):
+            if not raw:
+                continue
+            match = RECORD_RE.match(raw)
+            if match:
+                # vboxes span whole paragraphs or pages; their lines and
+                # glyphs have records of their own
+                if records is None or match.group(1) == b"[":
+                    continue
+                offset = offsets.get(int(match.group(2)))
+                line = int(match.group(3))
+                if offset is None or line <= 0:
+                    continue
+                h, v = int(match.group(4)), int(match.group(5))
+                width = int(match.group(6) or 0)
+                height = int(match.group(7) or 0)
+                depth = int(match.group(8) or 0)
+                records.append((v, h, h + width, v - height, v + depth, line + offset))
+                continue
+            head = raw[:1]
+            if head == b"{":
+                records = pages.setdefault(int(raw[1:] or 0), [])
+            elif head == b"}":
+                records = None
+            elif raw.startswith(b"Input:"):
+                match = INPUT_RE.match(raw)
+                if match:
+                    name = PurePath(match.group(2).decode("utf-8", "replace")).name
+                    if name in inputs:
+                        offsets[int(match.group(1))] = inputs[name]
+            elif raw.startswith(b"Unit:"):
+                unit = int(raw[5:])
+            elif raw.startswith(b"Magnification:"):
+                magnification = int(raw[14:])
+            elif raw.startswith(b"X Offset:"):
+                x_offset = int(raw[9:])
+            elif raw.startswith(b"Y Offset:"):
+                y_offset = int(raw[9:])
+
+        scale = unit * magnification / 1000 / SP_PER_BP
+        dx, dy = x_offset * scale, y_offset * scale
+        self.pages = {}
+        by_line = {}
+        for number, page_records in pages.items():
+            converted = []
+            for v, left, right, top, bottom, line in page_records:
+                record = (v * scale + dy, left * scale + dx, right * scale + dx,
+                          top * scale + dy, bottom * scale + dy, line)
+                converted.append(record)
+                by_line.setdefault(line, []).append((number, record))
+            self.pages[number] = _Page(converted)
+        self.lines = sorted(by_line)
+        self._by_line = by_line
+
+    def __len__(self):
+        return len(self.pages)
+
+    def edit(self, page: int, x: float, y: float):
+        """Source line of what is drawn at (x, y) on page (1-based), or None"""
+        index = self.pages.get(page)
+        if index is None:
+            return None
+        lo = bisect_left(index.baselines, y - NEAR_BP)
+        hi = bisect_right(index.baselines, y + NEAR_BP)
+        best = _closest(index.records[lo:hi], x, y)
+        if best and _distance(best, x, y) <= NEAR_BP:
+            return best[5]
+        # Not on a line of text: a picture or other tall box around the
+        # point, else whatever is closest
+        tall = [r for r in index.tall if _distance(r, x, y) == 0]
+        if tall:
+            return _closest(tall, x, y)[5]
+        pos = bisect_left(index.baselines, y)
+        best = _closest(index.records[max(0, pos - 1):pos + 1] + index.tall, x, y)
+        return best[5] if best else None
+
+    def view(self, line: int):
+        """(page, (left, top, right, bottom)) of the boxes from line, or None.
+
+        A line without boxes (a comment, a blank line) uses the next line
+        that has some.
+        """
+        if not self.lines:
+            return None
+        pos = bisect_left(self.lines, line)
+        line = self.lines[min(pos, len(self.lines) - 1)]
+        hits = self._by_line[line]
+        page = min(number for number, _ in hits)
+        boxes = [r for number, r in hits if number == page]
+        top = min(min(r[3], r[0] - 8.0) for r in boxes)   # points get a line's height
+        bottom = max(r[4] for r in boxes)
+        left = min(r[1] for r in boxes)
+        right = max(max(r[2], r[1] + 2.0) for r in boxes)
+        return page, (left, top, right, bottom)
@@ -0,0 +1,49 @@
+# test_latex_compile.py
+# Warm workers must typeset the body against their preamble, whether it was
+# loaded from a mylatexformat format or read the ordinary way. Needs TeX.
+#
+#   python -m pytest test_latex_compile.py
+
+import shutil, subprocess
+
+import pytest
+
+import latex_compile
+from latex_compile import FormatCache, TexWorker, format_failed
+
+PREAMBLE = ("\\documentclass{standalone}\n\\usepackage{tikz}\n"
+            "\\newcommand\\fromthepreamble{\\draw (0,0) -- (1,1);}\n")
+DOCUMENT = PREAMBLE + ("\\begin{document}\n\\begin{tikzpicture}\\fromthepreamble"
+                       "\\end{tikzpicture}\n\\end{document}\n")
+
+def have_mylatexformat():
+    if not shutil.which("pdflatex") or not shutil.which("kpsewhich"):
+        return False
+    found = subprocess.run(["kpsewhich", "mylatexformat.ltx"], stdout=subprocess.PIPE)
+    return bool(found.stdout.strip())
+
+pytestmark = pytest.mark.skipif(not have_mylatexformat(),
+                                reason="needs pdflatex with mylatexformat")
+
+def run_worker(fmt):
+    worker = TexWorker(PREAMBLE, fmt, engine="pdflatex")
+    try:
+        returncode, output = worker.run(DOCUMENT, timeout=60)
+        pdf = worker.output("figure.pdf")
+        return returncode, output.decode("utf-8", errors="ignore"), \
+            pdf.exists() and pdf.stat().st_size > 0
+    finally:
+        worker.close()
+
+def test_warm_worker_with_format(tmp_path, monkeypatch):
+    cache = FormatCache(tmp_path)
+    monkeypatch.setattr(latex_compile, "FORMAT_CACHE", cache)
+    fmt = cache.ensure(PREAMBLE, "pdflatex")
+    assert fmt is not None
+    returncode, output, made_pdf = run_worker(fmt)
+    assert not format_failed(output)
+    assert returncode == 0 and made_pdf, output[-1500:]
+
+def test_warm_worker_without_format():
+    returncode, output, made_pdf = run_worker(None)
+    assert returncode == 0 and made_pdf, output[-1500:]
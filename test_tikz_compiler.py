@@ -0,0 +1,69 @@
+# test_tikz_compiler.py
+# The TikZ GUI must report every compile job, even one whose worker
+# cannot be started, and only skip edits TeX would not notice.
+#
+#   python -m pytest test_tikz_compiler.py
+
+import os, time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtCore = pytest.importorskip("PySide6.QtCore")
+
+import tikzEditor
+
+DOCUMENT = ("\\documentclass{standalone}\n\\usepackage{tikz}\n\\begin{document}\n"
+            "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}\n\\end{document}\n")
+
+class MissingEnginePool:
+    """WorkerPool whose engine is not installed"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def acquire(self, document, engine=None):
+        self.calls += 1
+        raise FileNotFoundError(2, "No such file or directory", "pdflatex")
+
+    def shutdown(self):
+        pass
+
+def wait_for(results, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        QtCore.QCoreApplication.processEvents()
+        time.sleep(0.01)
+    return results
+
+def test_failing_acquire_reports_error_and_next_job_runs(monkeypatch):
+    monkeypatch.delenv("LATEX_COMPILE_DAEMON", raising=False)
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    compiler = tikzEditor.Compiler(pool_size=1)
+    compiler._pool = MissingEnginePool()
+    results = []
+    compiler.done.connect(lambda generation, pdf, png, log, index, profile:
+                          results.append((generation, pdf, log)))
+    try:
+        first = compiler.compile_async(DOCUMENT, "pdflatex")
+        wait_for(results, 1)
+        second = compiler.compile_async(DOCUMENT, "pdflatex")
+        wait_for(results, 2)
+    finally:
+        compiler.shutdown()
+    assert [generation for generation, _, _ in results] == [first, second]
+    for _, pdf, log in results:
+        assert pdf == b""
+        assert log.startswith("Compilation error:") and "pdflatex" in log
+    assert compiler._pool.calls == 2
+
+@pytest.mark.parametrize("verbatim", ["\\verb|a  b|", "\\verb*|a  b|", "\\lstinline{a  b}",
+                                      "\\url{a  b}", "{\\obeyspaces a  b}"])
+def test_fingerprint_keeps_verbatim_spacing(verbatim):
+    fingerprint = tikzEditor.document_fingerprint
+    assert fingerprint(verbatim) != fingerprint(verbatim.replace("  ", " "))
+
+def test_fingerprint_ignores_layout():
+    fingerprint = tikzEditor.document_fingerprint
+    assert fingerprint("\\draw (0,0)  --  (1,1); % a\n") == \
+        fingerprint("  \\draw (0,0) -- (1,1); % b\n")
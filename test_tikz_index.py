@@ -0,0 +1,54 @@
+# test_tikz_index.py
+# The index must describe the edited text exactly, whatever was put in it.
+#
+#   python -m pytest test_tikz_index.py
+
+from tikz_index import TikzIndex
+
+PICTURE = "\\begin{tikzpicture}\n  \\draw (0,0) -- (%d,1);\n\\end{tikzpicture}"
+DOCUMENT = ("\\documentclass{article}\n\\usepackage{tikz}\n\\begin{document}\n"
+            f"Text.\n{PICTURE % 1}\nMore text.\n{PICTURE % 2}\n\\end{{document}}\n")
+
+def assert_matches_text(pictures):
+    fresh = TikzIndex(pictures.text)
+    assert pictures.segments == fresh.segments
+    assert len(pictures) == len(fresh)
+
+def test_replace_with_two_pictures():
+    pictures = TikzIndex(DOCUMENT)
+    pictures.replace(0, PICTURE % 3 + "\n" + PICTURE % 4)
+    assert len(pictures) == 3
+    assert_matches_text(pictures)
+    # Picture 1 is now the second inserted one, not the document's second
+    pictures.replace(1, PICTURE % 5)
+    assert "(4,1)" not in pictures.text
+    assert "(3,1)" in pictures.text and "(2,1)" in pictures.text
+    assert_matches_text(pictures)
+
+def test_replace_with_bare_code():
+    pictures = TikzIndex(DOCUMENT)
+    pictures.replace(0, "\\draw (0,0) -- (1,1);")
+    assert len(pictures) == 1
+    assert pictures[0] == PICTURE % 2
+    assert_matches_text(pictures)
+
+def test_append_without_picture():
+    pictures = TikzIndex(DOCUMENT)
+    pictures.append("\\draw (0,0) -- (1,1);")
+    assert len(pictures) == 2
+    assert_matches_text(pictures)
+
+def test_replace_with_unclosed_code():
+    pictures = TikzIndex(DOCUMENT)
+    pictures.replace(0, "\\begin{tikzpicture}\n% unfinished")
+    assert_matches_text(pictures)
+    assert pictures.text == TikzIndex(pictures.text).text
+
+def test_copy_leaves_original_alone():
+    pictures = TikzIndex(DOCUMENT)
+    edited = pictures.copy()
+    edited.replace(0, PICTURE % 3)
+    assert pictures.text == DOCUMENT
+    assert_matches_text(pictures)
+    assert "(3,1)" in edited.text
+    assert_matches_text(edited)
@@ -0,0 +1,369 @@
+# texlive_session.py
+# A long-lived TeX Live container the editors compile in when TeX is not
+# installed on the host (see run_texlive_container.sh for the one-off shell).
+#
+#   python texlive_session.py start     # start (or reuse) the container
+#   python texlive_session.py status
+#   python texlive_session.py shell     # interactive bash in the container
+#   python texlive_session.py bench     # docker run --rm vs. the session
+#   python texlive_session.py stop
+#
+# The container runs `sleep infinity` and keeps its caches between compiles:
+# TEXMFVAR (font maps, luaotfload and generated fonts) lives in a host
+# directory under the editor cache, so it also survives container restarts.
+# Jobs are sent as shell commands over `docker exec -i ... bash` channels
+# that stay open, so a compile costs one pipe write instead of a container
+# start. Host directories are mounted at the same path inside the container
+# (the temp directory, the editor cache, the working directory and
+# TEXLIVE_SESSION_MOUNTS), so file names need no translation.
+#
+# latex_compile uses the session automatically for TeX programs missing from
+# PATH when docker is available; TEXLIVE_SESSION=0 turns that off.
+
+import os, sys, shlex, shutil, tempfile, threading, subprocess, time, uuid
+from pathlib import Path
+
+IMAGE = os.environ.get("TEXLIVE_IMAGE", "texlive/texlive:latest")
+CONTAINER = os.environ.get("TEXLIVE_CONTAINER", "latex-editor-texlive")
+DOCKER = shlex.split(os.environ.get("DOCKER", "docker"))
+
+# Programs the texlive/texlive image provides
+CONTAINER_PROGRAMS = {
+    "pdflatex", "xelatex", "lualatex", "pdflatex-dev", "xelatex-dev", "lualatex-dev",
+    "pdftex", "xetex", "luatex", "bibtex", "biber", "makeindex", "latexmk",
+}
+
+class SessionProcess:
+    """Popen-like handle on one command running over a session channel.
+
+    Enough of the Popen interface for stream_tex() and communicate():
+    iterate stdout, wait(), poll(), kill(). The command runs in its own
+    process group inside the container, so kill() also takes the children
+    of -shell-escape with it.
+    """
+
+    def __init__(self, session, channel, args, token, dedicated=False):
+        self.session = session
+        self.args = args
+        self.pid = None                 # inside the container
+        self.returncode = None
+        # A dedicated channel runs this command only and passes its stdin on
+        self.stdin = channel.stdin if dedicated else None
+        self._dedicated = dedicated
+        self._channel = channel
+        self._marker = b"@@" + token.encode()
+        self._kill_pending = False
+        self._drain = None              # thread reading the output for wait()
+        self._drain_lock = threading.Lock()
+        self.stdout = self._lines()
+
+    def _lines(self):
+        channel = self._channel
+        try:
+            while True:
+                line = channel.stdout.readline()
+                if not line:            # channel died (container stopped?)
+                    channel.kill()
+                    channel = None
+                    self.returncode = -9
+                    self.session._lost()
+                    return
+                pos = line.find(self._marker)
+                if pos == -1:
+                    yield line
+                    continue
+                if pos:                 # output without a final newline
+                    yield line[:pos]
+                kind, value = line[pos + len(self._marker):].split()
+                if kind == b"pid":
+                    self.pid = int(value)
+                    if self._kill_pending:
+                        self.kill()
+                else:
+                    self.returncode = int(value)
+                    return
+        finally:
+            self._channel = None
+            if channel is None:
+                pass
+            elif self.returncode is None:
+                # Closed before the exit marker: the rest of this job's output
+                # is still due on the channel, so it cannot take another job
+                self.kill()
+                self.returncode = -9
+                channel.kill()
+                channel.wait()
+            elif self._dedicated:
+                channel.wait()
+            else:
+                self.session._release(channel)
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """Read the rest of the output and return the exit status.
+
+        Like Popen.wait(), raises subprocess.TimeoutExpired if the command
+        is still running after timeout seconds, and leaves it running.
+        """
+        if self.returncode is not None:
+            return self.returncode
+        with self._drain_lock:
+            if self._drain is None:
+                self._drain = threading.Thread(target=self._drain_output, daemon=True)
+                self._drain.start()
+        self._drain.join(timeout)
+        if self._drain.is_alive():
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def _drain_output(self):
+        for _ in self.stdout:
+            pass
+
+    def communicate(self, input=None, timeout=None):
+        expired = threading.Event()
+
+        def on_timeout():
+            expired.set()
+            self.kill()
+
+        timer = threading.Timer(timeout, on_timeout) if timeout else None
+        if timer:
+            timer.daemon = True
+            timer.start()
+        try:
+            output = b"".join(self.stdout)
+        finally:
+            if timer:
+                timer.cancel()
+        if expired.is_set():
+            raise subprocess.TimeoutExpired(self.args, timeout, output=output)
+        return output, None
+
+    def kill(self):
+        if self.returncode is not None:
+            return
+        if self.pid is None:
+            self._kill_pending = True   # pid line not read yet
+            return
+        subprocess.run([*DOCKER, "exec", self.session.name, "kill", "-KILL", "--",
+                        f"-{self.pid}"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class TexLiveSession:
+    """The long-lived TeX Live container and its pool of shell channels"""
+
+    def __init__(self, name=CONTAINER, image=IMAGE, mounts=(), var_dir=None):
+        self.name = name
+        self.image = image
+        extra = [m for m in os.environ.get("TEXLIVE_SESSION_MOUNTS", "").split(os.pathsep) if m]
+        self.mounts = [Path(m).resolve() for m in
+                       (tempfile.gettempdir(), Path.cwd(), *mounts, *extra)]
+        self.var_dir = Path(var_dir) if var_dir else None
+        self._lock = threading.Lock()
+        self._idle = []                 # open channels waiting for a job
+        self._mounted = None            # container mount points, once started
+
+    @property
+    def enabled(self):
+        return (os.environ.get("TEXLIVE_SESSION", "auto") != "0"
+                and shutil.which(DOCKER[0]) is not None)
+
+    def provides(self, program: str) -> bool:
+        """True if program should run in the container (not installed here)"""
+        return program in CONTAINER_PROGRAMS and self.enabled
+
+    # -- container -------------------------------------------------------------
+    def _docker(self, *args, **kwargs):
+        return subprocess.run([*DOCKER, *args], stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, text=True, **kwargs)
+
+    def state(self):
+        """Container status ("running", "exited", ...), None if it does not exist"""
+        result = self._docker("inspect", "-f", "{{.State.Status}}", self.name)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def mounted(self):
+        result = self._docker("inspect", "-f", "{{range .Mounts}}{{.Destination}}\n{{end}}",
+                              self.name)
+        return [Path(line) for line in result.stdout.split()] if result.returncode == 0 else []
+
+    def start(self):
+        """Start the container unless it is already running"""
+        with self._lock:
+            if self._mounted is not None:
+                return
+            state = self.state()
+            if state is None:
+                self._create()
+            elif state != "running":
+                print(f"Restarting TeX Live session container {self.name}")
+                result = self._docker("start", self.name)
+                if result.returncode != 0:
+                    raise OSError(f"docker start {self.name} failed: {result.stdout.strip()}")
+            self._mounted = self.mounted()
+
+    def _create(self):
+        print(f"Starting TeX Live session container {self.name} ({self.image})")
+        args = ["run", "-d", "--name", self.name, "--init"]
+        if hasattr(os, "getuid"):
+            # Files written into the mounted directories stay the user's
+            args += ["--user", f"{os.getuid()}:{os.getgid()}", "-e", "HOME=/tmp"]
+        if self.var_dir:
+            self.var_dir.mkdir(parents=True, exist_ok=True)
+            args += ["-e", f"TEXMFVAR={self.var_dir}"]
+        mounts = list(dict.fromkeys(self.mounts + ([self.var_dir] if self.var_dir else [])))
+        for path in mounts:
+            path.mkdir(parents=True, exist_ok=True)
+            args += ["-v", f"{path}:{path}"]
+        result = self._docker(*args, self.image, "sleep", "infinity", timeout=1800)
+        if result.returncode != 0:
+            raise OSError(f"Could not start the TeX Live container: {result.stdout.strip()}")
+
+    def stop(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._mounted = None
+        for channel in idle:
+            channel.kill()
+        self._docker("rm", "-f", self.name)
+
+    def check_mounted(self, path):
+        path = Path(path).resolve()
+        if not any(path == m or m in path.parents for m in self._mounted or ()):
+            raise OSError(f"{path} is not mounted in the TeX Live container {self.name}; "
+                          f"add it to TEXLIVE_SESSION_MOUNTS and run "
+                          f"`python texlive_session.py stop`")
+
+    # -- channels --------------------------------------------------------------
+    def _channel(self):
+        stale = False
+        with self._lock:
+            while self._idle:
+                channel = self._idle.pop()
+                if channel.poll() is None:
+                    return channel
+                stale = True
+        if stale:
+            # Idle channels only die with the container: check it again
+            self._lost()
+            self.start()
+        # Job output is redirected into stdout by the job itself; the shell's
+        # own stderr only carries job-control notices such as "Killed"
+        return subprocess.Popen([*DOCKER, "exec", "-i", self.name, "bash"],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+
+    def _release(self, channel):
+        with self._lock:
+            self._idle.append(channel)
+
+    def _lost(self):
+        """A channel died: the container may be gone (texlive_session.py stop),
+        so the next job checks it again and restarts it if needed"""
+        with self._lock:
+            self._mounted = None
+            idle, self._idle = self._idle, []
+        for channel in idle:
+            channel.kill()
+
+    def popen(self, args, cwd, env=None, stdin=False):
+        """Start args in the container; Popen-like, output on stdout.
+
+        env entries that differ from os.environ are passed on. With stdin
+        the command gets its own `docker exec -i` so it can be written to
+        (warm TexWorkers); otherwise it runs over a pooled channel. Either
+        way it runs under setsid, so kill() reaches its process group.
+        """
+        self.start()
+        self.check_mounted(cwd)
+        changed = {k: v for k, v in (env or {}).items() if os.environ.get(k) != v}
+        token = uuid.uuid4().hex
+        if stdin:
+            env_args = [arg for k, v in changed.items() for arg in ("-e", f"{k}={v}")]
+            # <&0: a background job would otherwise read /dev/null
+            script = (f'setsid "$@" <&0 2>&1 &\n'
+                      f"echo @@{token} pid $!\n"
+                      f"wait $!\n"
+                      f"echo @@{token} exit $?\n")
+            channel = subprocess.Popen(
+                [*DOCKER, "exec", "-i", "-w", str(cwd), *env_args, self.name,
+                 "bash", "-c", script, "bash", *map(str, args)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                start_new_session=(os.name == "posix"))
+            return SessionProcess(self, channel, list(args), token, dedicated=True)
+
+        command = " ".join(shlex.quote(str(a)) for a in
+                           ["env", *(f"{k}={v}" for k, v in changed.items()), *args])
+        # setsid: own process group, so kill() reaches -shell-escape children
+        script = (f"( cd {shlex.quote(str(cwd))} && exec setsid {command} ) </dev/null 2>&1 &\n"
+                  f"echo @@{token} pid $!\n"
+                  f"wait $!\n"
+                  f"echo @@{token} exit $?\n")
+        for attempt in range(2):
+            channel = self._channel()
+            try:
+                channel.stdin.write(script.encode())
+                channel.stdin.flush()
+                return SessionProcess(self, channel, list(args), token)
+            except OSError:             # stale channel
+                channel.kill()
+                self._lost()
+                if attempt:
+                    raise
+                self.start()
+
+# ---------------------------------------------------------------------------
+def bench(session, repeat=3):
+    """Time a small document with docker run --rm and with the session"""
+    with tempfile.TemporaryDirectory(prefix="texlive-bench-") as tmp:
+        tex = Path(tmp) / "bench.tex"
+        tex.write_text("\\documentclass{article}\\begin{document}Hello\\end{document}\n")
+        command = ["pdflatex", "-interaction=nonstopmode", tex.name]
+        fresh = [*DOCKER, "run", "--rm", "-v", f"{tmp}:/workdir", "-w", "/workdir",
+                 session.image, *command]
+        session.popen(command, tmp).wait()          # warm up
+        for label, run in (
+            ("docker run --rm", lambda: subprocess.run(fresh, stdout=subprocess.DEVNULL,
+                                                       stderr=subprocess.DEVNULL)),
+            ("session", lambda: session.popen(command, tmp).wait()),
+        ):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+            print(f"{label:<16} {min(times):6.2f} s best of {repeat}")
+
+def main():
+    from latex_compile import TEXLIVE_SESSION as session
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "status"
+    if command not in ("start", "stop", "status", "shell", "bench"):
+        sys.exit(f"usage: {sys.argv[0]} start|stop|status|shell|bench")
+    if shutil.which(DOCKER[0]) is None:
+        sys.exit(f"{DOCKER[0]} not found")
+    if command == "start":
+        session.start()
+        print(f"{session.name} running; mounted: {', '.join(map(str, session.mounted()))}")
+    elif command == "stop":
+        session.stop()
+        print(f"{session.name} removed")
+    elif command == "status":
+        print(f"{session.name}: {session.state() or 'not created'}")
+        for path in session.mounted():
+            print(f"  {path}")
+    elif command == "shell":
+        session.start()
+        try:
+            session.check_mounted(Path.cwd())
+        except OSError as e:
+            sys.exit(str(e))
+        os.execvp(DOCKER[0], [*DOCKER, "exec", "-it", "-w", str(Path.cwd()),
+                              session.name, "bash"])
+    elif command == "bench":
+        bench(session)
+
+if __name__ == "__main__":
+    main()
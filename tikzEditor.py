@@ -1,19 +1,58 @@
 # tikz_gui.py
 # Complete TikZ GUI editor with text preview window
-# Requires: Python 3.8+, PySide-6, a working LaTeX installation with pdflatex,
-# and the command-line tool pdftocairo (poppler-utils).
+# Requires: Python 3.8+, PySide-6, a working LaTeX installation with pdflatex
+# (xelatex, lualatex and tectonic can be picked in the engine box),
+# and the command-line tool pdftocairo (poppler-utils). The mylatexformat
+# package is used, when installed, to precompile the document preamble.
 
-import os, sys, subprocess, tempfile, shutil, threading
+import os, re, sys, time, hashlib, subprocess, tempfile, threading
+from collections import OrderedDict
 from pathlib import Path
 
-from PySide6.QtCore import Qt, QTimer, Signal, QObject
-from PySide6.QtGui import QPixmap, QFontDatabase, QTextCursor
+from latex_compile import (DEFAULT_ENGINE, FORMAT_CACHE, TexWorker, WorkerPool, available_engines,
+                           document_engine, format_failed, synctex_for)
+from latex_log import parse_log, parse_log_file
+from synctex_index import SyncTexIndex
+from compile_profile import TRACE_FILE, Profile, aggregate, format_aggregate, format_record
+from compile_daemon import DaemonError, daemon_address, daemon_compile
+
+from PySide6.QtCore import Qt, QTimer, Signal, QObject, QSize, QRect, QRectF, QBuffer, QByteArray
+from PySide6.QtGui import QPixmap, QImage, QPainter, QColor, QFontDatabase, QTextCursor
 from PySide6.QtWidgets import (
-    QApplication, QWidget, QHBoxLayout, QVBoxLayout, QTextEdit,
+    QApplication, QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QPlainTextEdit,
     QLabel, QPushButton, QFileDialog, QMessageBox, QTabWidget,
-    QScrollArea, QSplitter, QDialog
+    QScrollArea, QSplitter, QDialog, QCheckBox, QComboBox
 )
 
+try:  # QtPdf renders PDF pages directly; pdftocairo is the fallback
+    from PySide6.QtPdf import QPdfDocument, QPdfDocumentRenderOptions
+except ImportError:
+    QPdfDocument = None
+
+PREVIEW_DPI = 150       # resolution of the bitmap preview at 100% zoom
+TILE_SIZE = 256         # edge of a preview tile in screen pixels
+
+# Comment after an unescaped % (\\% is a line break followed by a comment)
+COMMENT_RE = re.compile(r"(?<!\\)((?:\\\\)*)%.*")
+# Environments and commands whose spacing (and %) are printed as typed
+VERBATIM_RE = re.compile(r"\\begin\{(?:verbatim|Verbatim|lstlisting|minted|alltt)"
+                         r"|\\(?:verb|Verb|lstinline|mintinline|url|href|nolinkurl"
+                         r"|obeyspaces|obeylines|catcode)(?![a-zA-Z])")
+# Text just typed that completes a statement: a TikZ path, an environment
+STRUCTURAL_EDIT_RE = re.compile(r"(?:;|\\end\{[^}]*\})\s*$")
+
+def document_fingerprint(source: str, *options) -> str:
+    """Hash of source as TeX reads it: comments, indentation and repeated
+    spaces or blank lines do not change it. Sources with verbatim text
+    (VERBATIM_RE) are hashed as they are."""
+    if not VERBATIM_RE.search(source):
+        lines = (" ".join(COMMENT_RE.sub(r"\1%", line).split()) for line in source.split("\n"))
+        source = re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+    h = hashlib.sha256(source.encode("utf-8"))
+    for opt in options:
+        h.update(b"\0" + str(opt).encode("utf-8"))
+    return h.hexdigest()
+
 class PreviewDialog(QDialog):
     """Dialog to show the exact LaTeX code before compilation"""
     def __init__(self, content, parent=None):
@@ -47,61 +86,302 @@ class PreviewDialog(QDialog):
         button_layout.addWidget(cancel_btn)
         layout.addLayout(button_layout)
 
-class RawTextEdit(QTextEdit):
-    """Custom QTextEdit that preserves exact text formatting"""
+class RawTextEdit(QPlainTextEdit):
+    """Plain-text editor that keeps an exact copy of its text.
+
+    The copy is patched from every contentsChange, so reading it never
+    walks the document, and text set with setRawText() is returned
+    byte for byte (Windows line endings included) until it is edited.
+    QPlainTextEdit stores the text in blocks and pastes only plain text,
+    so loading or pasting a 10k-line document involves no HTML.
+    """
     
     def __init__(self):
         super().__init__()
-        self._raw_content = ""
+        self.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self._raw_content = ""          # text as loaded, until the first edit
+        self._buffer = ""               # document text, "\n" line breaks
+        self._newline = "\n"
+        self._loading = False
+        self.document().contentsChange.connect(self._contents_change)
     
     def setRawText(self, text):
         """Set text while preserving exact formatting"""
+        crlf = text.count("\r\n")
+        self._newline = "\r\n" if crlf and crlf == text.count("\n") else "\n"
+        self._buffer = text.replace("\r\n", "\n") if crlf else text
+        self._loading = True
+        try:
+            self.setPlainText(self._buffer)
+        finally:
+            self._loading = False
         self._raw_content = text
-        # Use setHtml with <pre> to preserve exact whitespace
-        escaped_text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-        self.setHtml(f'<pre style="font-family: monospace;">{escaped_text}</pre>')
     
     def getRawText(self):
         """Get the exact raw text content"""
+        if self._raw_content is None:
+            text = self._buffer
+            self._raw_content = text if self._newline == "\n" else text.replace("\n", self._newline)
         return self._raw_content
     
-    def insertFromMimeData(self, source):
-        """Override to handle paste operations with exact formatting"""
-        if source.hasText():
-            text = source.text()
-            cursor = self.textCursor()
-            cursor.insertText(text)
-            # Update raw content
-            self._raw_content = self.toPlainText()
+    def _contents_change(self, pos, removed, added):
+        if self._loading:
+            return
+        self._raw_content = None
+        doc = self.document()
+        end = min(pos + added, doc.characterCount() - 1)
+        cursor = QTextCursor(doc)
+        cursor.setPosition(pos)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        self._buffer = (self._buffer[:pos] + _plain(cursor.selectedText())
+                        + self._buffer[pos + removed:])
+        if len(self._buffer) != doc.characterCount() - 1:
+            # Qt counts the final block separator in some changes; resync
+            print("Raw text buffer out of step with the editor, rebuilding it")
+            self._buffer = _plain(doc.toRawText())
+
+def _plain(text):
+    """Qt's paragraph and line separators as newlines"""
+    return text.replace("\u2029", "\n").replace("\u2028", "\n")
+
+class TileJob:
+    """Everything a worker thread needs to render one tile"""
+
+    def __init__(self, key, rect, full_size, zoom, base_image, pdf_data):
+        self.key = key                  # (document id, vector?, zoom, column, row)
+        self.rect = rect                # tile rectangle in the zoomed page
+        self.full_size = full_size      # size of the whole zoomed page
+        self.zoom = zoom
+        self.base_image = base_image    # QImage rendered at PREVIEW_DPI
+        self.pdf_data = pdf_data        # set for vector tiles
+
+_pdf_docs = threading.local()
+
+def _load_pdf(doc_id, pdf_data):
+    """QPdfDocument for doc_id, loaded once per worker thread"""
+    cached = getattr(_pdf_docs, "entry", None)
+    if cached and cached[0] == doc_id:
+        return cached[1]
+    buffer = QBuffer()
+    buffer.setData(QByteArray(pdf_data))
+    buffer.open(QBuffer.ReadOnly)
+    doc = QPdfDocument()
+    doc.load(buffer)
+    _pdf_docs.entry = (doc_id, doc, buffer)     # the buffer must outlive doc
+    return doc
+
+def render_tile(job: TileJob) -> QImage:
+    """Render one tile; safe to call off the GUI thread"""
+    rect = job.rect
+    if job.pdf_data is None:
+        # Bitmap mode: smooth-scale just the matching part of the base image
+        source = QRectF(rect.x() / job.zoom, rect.y() / job.zoom,
+                        rect.width() / job.zoom, rect.height() / job.zoom).toAlignedRect()
+        return job.base_image.copy(source).scaled(
+            rect.size(), Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+
+    if QPdfDocument is not None:
+        doc = _load_pdf(job.key[0], job.pdf_data)
+        if doc.pageCount() > 0:
+            options = QPdfDocumentRenderOptions()
+            options.setScaledSize(job.full_size)
+            options.setScaledClipRect(rect)
+            return doc.render(0, rect.size(), options)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "page.pdf"
+        pdf.write_bytes(job.pdf_data)
+        subprocess.run(
+            ["pdftocairo", "-singlefile", "-png", "-r", f"{PREVIEW_DPI * job.zoom:.2f}",
+             "-x", str(rect.x()), "-y", str(rect.y()),
+             "-W", str(rect.width()), "-H", str(rect.height()), pdf.name, "tile"],
+            cwd=tmp, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60
+        )
+        png = Path(tmp) / "tile.png"
+        return QImage(str(png)) if png.exists() else QImage()
+
+class TileRenderer(QObject):
+    """Renders preview tiles on worker threads.
+
+    request() replaces the queue with the tiles currently in view, so
+    tiles that were scrolled or zoomed away are never rendered.
+    """
+    tile_ready = Signal(object, QImage)     # key, image
+
+    def __init__(self, threads=2):
+        super().__init__()
+        self._cond = threading.Condition()
+        self._queue = []
+        self._busy = set()              # keys being rendered right now
+        for _ in range(threads):
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def request(self, jobs):
+        with self._cond:
+            self._queue = [job for job in jobs if job.key not in self._busy]
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.pop(0)
+                self._busy.add(job.key)
+            try:
+                image = render_tile(job)
+            except Exception as e:
+                print(f"Tile render failed: {e}")
+                image = QImage()
+            finally:
+                with self._cond:
+                    self._busy.discard(job.key)
+            if not image.isNull():
+                self.tile_ready.emit(job.key, image)
+
+class TileCache:
+    """LRU of rendered tiles across zoom levels, bounded in bytes"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._tiles = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        old = self._tiles.pop(key, None)
+        if old is not None:
+            self._size -= old.width() * old.height() * 4
+        self._tiles[key] = pixmap
+        self._size += pixmap.width() * pixmap.height() * 4
+        while self._size > self.max_bytes and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self._size -= evicted.width() * evicted.height() * 4
+
+    def clear(self):
+        self._tiles.clear()
+        self._size = 0
+
+class TileCanvas(QWidget):
+    """Paints the zoomed page from tiles, only where it is visible"""
+
+    def __init__(self, preview):
+        super().__init__()
+        self._preview = preview
+        self.text = "Compile to preview"
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), Qt.white)
+        preview = self._preview
+        if preview._pixmap is None:
+            painter.drawText(self.rect(), Qt.AlignCenter, self.text)
+            return
+
+        missing = []
+        for rect, key in preview._tiles_in(self.visibleRegion().boundingRect()):
+            tile = preview._cache.get(key)
+            if tile is not None:
+                if rect.intersects(event.rect()):
+                    painter.drawPixmap(rect.topLeft(), tile)
+                continue
+            if rect.intersects(event.rect()):
+                # Quick placeholder scaled from the base bitmap
+                zoom = preview.zoom_factor
+                source = QRectF(rect.x() / zoom, rect.y() / zoom,
+                                rect.width() / zoom, rect.height() / zoom)
+                painter.drawPixmap(QRectF(rect), preview._pixmap, source)
+            missing.append(preview._job(rect, key))
+        if missing:
+            preview._renderer.request(missing)
+        if preview._highlight is not None:
+            # Source-to-preview: boxes of the line under the editor cursor
+            scale = PREVIEW_DPI / 72 * preview.zoom_factor
+            left, top, right, bottom = preview._highlight
+            painter.fillRect(QRectF(left * scale - 2, top * scale - 2,
+                                    (right - left) * scale + 4, (bottom - top) * scale + 4),
+                             QColor(255, 200, 0, 90))
+
+    def mousePressEvent(self, event):
+        preview = self._preview
+        if preview._pixmap is None or event.button() != Qt.LeftButton:
+            return super().mousePressEvent(event)
+        # Canvas pixels -> PDF points from the top-left corner of the page
+        scale = PREVIEW_DPI / 72 * preview.zoom_factor
+        pos = event.position()
+        preview.clicked.emit(pos.x() / scale, pos.y() / scale)
 
 class ZoomablePreview(QScrollArea):
+    """Zoomable preview that renders only the tiles intersecting the viewport"""
+    clicked = Signal(float, float)      # x, y in PDF points on the page
+
     def __init__(self):
         super().__init__()
         self.zoom_factor = 1.0
         self._pixmap = None
+        self._highlight = None          # (left, top, right, bottom) in PDF points
+        self._base_image = None
+        self._pdf_data = None
+        self._doc_id = 0
+        self.vector_mode = False
+        self._cache = TileCache()
+        self._renderer = TileRenderer()
+        self._renderer.tile_ready.connect(self._tile_ready)
         
-        # Create the image label
-        self.image_label = QLabel("Compile to preview")
-        self.image_label.setAlignment(Qt.AlignCenter)
-        self.image_label.setStyleSheet("QLabel{background:#ffffff;border:1px solid #aaa;}")
+        # Create the tile canvas
+        self.canvas = TileCanvas(self)
+        self.canvas.resize(400, 300)
         
         # Set up scroll area
-        self.setWidget(self.image_label)
+        self.setWidget(self.canvas)
         self.setWidgetResizable(False)
         self.setAlignment(Qt.AlignCenter)
         
         # Enable mouse wheel zooming
         self.setFocusPolicy(Qt.WheelFocus)
     
-    def setPixmap(self, pixmap):
-        """Set the pixmap and apply current zoom"""
+    def setPixmap(self, pixmap, pdf_data=None):
+        """Set the pixmap (and the PDF it came from) and apply current zoom"""
         self._pixmap = pixmap
+        self._base_image = pixmap.toImage()
+        self._pdf_data = pdf_data
+        self._highlight = None
+        self._doc_id += 1
+        self._cache.clear()
         self._update_display()
     
     def setText(self, text):
         """Set text when no image is available"""
-        self.image_label.setText(text)
+        self.canvas.text = text
         self._pixmap = None
+        self._base_image = None
+        self._pdf_data = None
+        self._highlight = None
+        self._cache.clear()
+        self.canvas.resize(self.viewport().size())
+        self.canvas.update()
+    
+    def setHighlight(self, rect):
+        """Mark rect (PDF points) on the page, None to clear"""
+        if rect == self._highlight:
+            return
+        self._highlight = rect
+        self.canvas.update()
+        if rect is not None:
+            scale = PREVIEW_DPI / 72 * self.zoom_factor
+            self.ensureVisible(int((rect[0] + rect[2]) / 2 * scale),
+                               int((rect[1] + rect[3]) / 2 * scale))
+
+    def setVectorMode(self, enabled):
+        """Render tiles from the PDF at each zoom level instead of scaling the bitmap"""
+        self.vector_mode = enabled
+        self._update_display()
     
     def zoom_in(self):
         """Zoom in by 25%"""
@@ -131,16 +411,44 @@ class ZoomablePreview(QScrollArea):
             self.zoom_factor = min(scale_x, scale_y)
             self._update_display()
     
+    def _zoomed_size(self):
+        return QSize(max(1, round(self._pixmap.width() * self.zoom_factor)),
+                     max(1, round(self._pixmap.height() * self.zoom_factor)))
+    
     def _update_display(self):
-        """Update the displayed image with current zoom"""
+        """Resize the canvas for the current zoom; tiles follow on repaint"""
         if self._pixmap:
-            scaled_pixmap = self._pixmap.scaled(
-                self._pixmap.size() * self.zoom_factor,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.image_label.setPixmap(scaled_pixmap)
-            self.image_label.resize(scaled_pixmap.size())
+            self.canvas.resize(self._zoomed_size())
+            self.canvas.update()
+    
+    def _tiles_in(self, area):
+        """Yield (tile rect, cache key) for every tile intersecting area"""
+        full = QRect(0, 0, self.canvas.width(), self.canvas.height())
+        area = area.intersected(full)
+        if area.isEmpty():
+            return
+        vector = bool(self.vector_mode and self._pdf_data)
+        zoom = round(self.zoom_factor, 4)
+        for row in range(area.top() // TILE_SIZE, area.bottom() // TILE_SIZE + 1):
+            for col in range(area.left() // TILE_SIZE, area.right() // TILE_SIZE + 1):
+                rect = QRect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE).intersected(full)
+                yield rect, (self._doc_id, vector, zoom, col, row)
+    
+    def _job(self, rect, key):
+        return TileJob(key, rect, self._zoomed_size(), self.zoom_factor,
+                       self._base_image, self._pdf_data if key[1] else None)
+    
+    def _tile_ready(self, key, image):
+        if key[0] != self._doc_id:
+            return                      # tile of a previous document
+        self._cache.put(key, QPixmap.fromImage(image))
+        if key[2] == round(self.zoom_factor, 4):
+            col, row = key[3], key[4]
+            self.canvas.update(QRect(col * TILE_SIZE, row * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+    
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.canvas.update()            # newly exposed tiles get requested
     
     def wheelEvent(self, event):
         """Handle mouse wheel for zooming"""
@@ -150,99 +458,212 @@ class ZoomablePreview(QScrollArea):
             self.zoom_out()
         event.accept()
 
+def load_synctex(data, inputs=None):
+    """SyncTexIndex of SyncTeX data, or None if there is none or it is unreadable"""
+    if not data:
+        return None
+    try:
+        return SyncTexIndex(data, inputs)
+    except Exception as e:
+        print(f"Cannot read SyncTeX data: {e}")
+        return None
+
 class Compiler(QObject):
-    done = Signal(Path, str)          # image_path, log
+    """Latest-wins compile queue in front of a pool of warm TeX workers.
 
-    def __init__(self):
-        super().__init__()
-        self._thread = None
+    Every request gets a generation number. A new request kills the TeX
+    process of the one still running, replaces any request that has not
+    started yet, and results are emitted with their generation so stale
+    images can be dropped by the receiver.
+    """
+    # generation, pdf, png, log, SyncTexIndex, Profile (finished by the receiver)
+    done = Signal(int, bytes, bytes, str, object, object)
 
-    def compile_async(self, full_document: str):
-        if self._thread and self._thread.is_alive():
-            return                          # prevent overlapping runs
-        self._thread = threading.Thread(target=self._compile, args=(full_document,))
+    def __init__(self, pool_size=2):
+        super().__init__()
+        self._pool = WorkerPool(pool_size)
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._pending = None            # (generation, document) not yet started
+        self._running = None            # worker of the job in progress
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
         self._thread.start()
 
-    def _compile(self, full_document: str):
-        tmp = Path(tempfile.mkdtemp())
-        tex = tmp / "figure.tex"
-        
+    def compile_async(self, full_document: str, engine=None) -> int:
+        """Queue full_document, superseding older requests; returns its generation.
+
+        engine is used unless the document names one with "% !TEX program".
+        """
+        engine = document_engine(full_document, engine)
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, full_document, engine)
+            if self._running:
+                print("Cancelling superseded compilation")
+                self._running.kill()
+            self._cond.notify()
+            return self._generation
+
+    def shutdown(self):
+        with self._cond:
+            self._pending = None
+            if self._running:
+                self._running.kill()
+        self._pool.shutdown()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                generation, full_document, engine = self._pending
+                self._pending = None
+            profile = Profile("qt compile", engine=engine, chars=len(full_document))
+            with profile:
+                self._compile(generation, full_document, engine, profile)
+
+    def _run_worker(self, generation, worker, full_document):
+        with self._cond:
+            if generation != self._generation:
+                worker.kill()           # superseded before it started
+            self._running = worker
         try:
-            # Write file as raw bytes with no text processing whatsoever
-            with open(tex, 'wb') as f:
-                f.write(full_document.encode('utf-8'))
+            return worker.run(full_document, timeout=120)  # 2 minutes
+        finally:
+            with self._cond:
+                self._running = None
 
-            print(f"Starting compilation in {tmp}")
+    def _compile_on_daemon(self, generation: int, full_document: str, engine: str,
+                           profile) -> bool:
+        """Send the job to the shared compile daemon; False if it is unreachable"""
+        try:
+            with profile.stage("compile daemon"):
+                result = daemon_compile(full_document, precompile_preamble=True, png=True,
+                                        dpi=PREVIEW_DPI, timeout=120, engine=engine)
+        except DaemonError as e:
+            print(f"Compile daemon unavailable, compiling locally: {e}")
+            return False
+        print(f"Daemon compilation #{generation}: queued {result['queue_ms']} ms, "
+              f"compiled {result['compile_ms']} ms")
+        if result["png"]:
+            with profile.stage("synctex index"):
+                index = load_synctex(synctex_for(result["pdf"]))
+            self.done.emit(generation, result["pdf"], result["png"], result["log"], index,
+                           profile)
+        else:
+            report = parse_log(result["log"])
+            print(f"LaTeX log: {report.summary()}")
+            message = str(report.first_error or "PDF compilation failed on the compile daemon")
+            self.done.emit(generation, b"", b"", message, None, profile)
+        return True
+
+    def _compile(self, generation: int, full_document: str, engine: str, profile):
+        if daemon_address() and self._compile_on_daemon(generation, full_document, engine,
+                                                        profile):
+            return
+        worker = None
+        try:
+            # Raises when the engine is missing or the container session is down
+            with profile.stage("worker"):
+                worker = self._pool.acquire(full_document, engine)
+            print(f"Starting compilation #{generation} with {engine} in {worker.dir}")
             
             # Debug: Show exact content being written
             print(f"Exact content (first 300 characters): {repr(full_document[:300])}")
             
-            # First pass: pdflatex with increased timeout and non-interactive mode
-            result = subprocess.run(
-                ["pdflatex", "-halt-on-error", "-interaction=nonstopmode", 
-                 "-file-line-error", "-shell-escape", tex.name],
-                cwd=tmp, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.STDOUT, 
-                timeout=120,  # Increased timeout to 2 minutes
-                input=b'',    # Send empty input to prevent hanging
-            )
+            with profile.stage(engine):
+                returncode, output = self._run_worker(generation, worker, full_document)
+            if worker.fmt and format_failed(output.decode('utf-8', errors='ignore')):
+                print(f"Format {worker.fmt} is unusable, compiling without it")
+                FORMAT_CACHE.discard(worker.fmt)
+                worker.close()
+                worker = TexWorker(engine=engine)
+                with profile.stage(f"{engine} without format"):
+                    returncode, output = self._run_worker(generation, worker, full_document)
+            if worker.killed:
+                print(f"Compilation #{generation} superseded")
+                return
             
-            print(f"pdflatex return code: {result.returncode}")
+            print(f"{engine} return code: {returncode}")
             
-            if result.stdout:
-                stdout_text = result.stdout.decode('utf-8', errors='ignore')
+            if output:
+                stdout_text = output.decode('utf-8', errors='ignore')
                 print("LaTeX stdout:", stdout_text[-1500:])  # Show last 1500 chars
             
-            pdf = tmp / "figure.pdf"
+            pdf = worker.output("figure.pdf")
+            log_file = worker.output("figure.log")
             
             if pdf.exists() and pdf.stat().st_size > 0:
                 print(f"PDF created successfully: {pdf.stat().st_size} bytes")
                 
                 # Convert PDF to PNG with higher timeout
-                png = tmp / "figure.png"
-                png_result = subprocess.run(
-                    ["pdftocairo", "-singlefile", "-png", "-r", "150", pdf, png.stem],
-                    cwd=tmp, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.STDOUT, 
-                    timeout=60  # 1 minute for PDF conversion
-                )
+                png = worker.output("figure.png")
+                with profile.stage("pdftocairo"):
+                    png_result = subprocess.run(
+                        ["pdftocairo", "-singlefile", "-png", "-r", "150", pdf, png.stem],
+                        cwd=worker.dir, 
+                        stdout=subprocess.PIPE, 
+                        stderr=subprocess.STDOUT, 
+                        timeout=60  # 1 minute for PDF conversion
+                    )
                 
                 if png.exists():
                     print(f"PNG created successfully: {png.stat().st_size} bytes")
                     log_content = ""
-                    if (tmp / "figure.log").exists():
-                        log_content = (tmp / "figure.log").read_text(encoding="utf8", errors='ignore')
-                    self.done.emit(png, log_content)
+                    if log_file.exists():
+                        log_content = log_file.read_text(encoding="utf8", errors='ignore')
+                    # The body of a warm worker is body.tex, after the preamble
+                    if worker.preamble is not None:
+                        inputs = {"body.tex": worker.preamble.count("\n")}
+                    else:
+                        inputs = {"figure.tex": 0}
+                    synctex = worker.output("figure.synctex.gz")
+                    with profile.stage("synctex index"):
+                        index = load_synctex(synctex.read_bytes() if synctex.exists() else None,
+                                             inputs)
+                    self.done.emit(generation, pdf.read_bytes(), png.read_bytes(), log_content,
+                                   index, profile)
                 else:
                     print("PNG conversion failed")
                     if png_result.stdout:
                         print("pdftocairo output:", png_result.stdout.decode('utf-8', errors='ignore'))
-                    self.done.emit(Path(), "PNG conversion failed")
+                    self.done.emit(generation, b"", b"", "PNG conversion failed", None, profile)
             else:
                 print("PDF not created or is empty")
-                log_content = ""
-                if (tmp / "figure.log").exists():
-                    log_content = (tmp / "figure.log").read_text(encoding="utf8", errors='ignore')
-                    print("LaTeX log content:", log_content[-1500:])  # Show last 1500 chars
-                self.done.emit(Path(), f"PDF compilation failed. Return code: {result.returncode}")
+                message = f"PDF compilation failed. Return code: {returncode}"
+                report = None
+                if worker.aborted:
+                    # Killed at the first error(s), so the .log is incomplete
+                    report = worker.report
+                    print(f"Stopped compilation #{generation} after {len(report.errors)} error(s)")
+                elif log_file.exists():
+                    report = parse_log_file(log_file)
+                if report:
+                    print(f"LaTeX log: {report.summary()}")
+                    for diagnostic in report.errors[:5]:
+                        print(f"  {diagnostic}")
+                    if report.first_error:
+                        message = str(report.first_error)
+                self.done.emit(generation, b"", b"", message, None, profile)
                 
         except subprocess.TimeoutExpired:
             print("Compilation timed out - document too complex or has infinite loop")
-            self.done.emit(Path(), "Compilation timed out (>2 minutes). Document may be too complex.")
+            self.done.emit(generation, b"", b"", "Compilation timed out (>2 minutes). Document may be too complex.", None, profile)
         except Exception as e:
             print(f"Compilation error: {e}")
-            self.done.emit(Path(), f"Compilation error: {str(e)}")
+            self.done.emit(generation, b"", b"", f"Compilation error: {str(e)}", None, profile)
         finally:
             # Clean up - comment out for debugging
-            try:
-                shutil.rmtree(tmp)
-            except:
-                pass
+            if worker is not None:
+                worker.close()
 
 class TikzGUI(QWidget):
-    DEBOUNCE_MS = 1500  # Increased debounce for large documents
+    # The pause before a compile follows the recent compile time: fast
+    # documents refresh quickly, slow ones are not restarted on every word
+    DEBOUNCE_MS = 1500      # until the first compile has been timed
+    MIN_DEBOUNCE_MS = 250
+    MAX_DEBOUNCE_MS = 3000
+    COMPILE_EMA_ALPHA = 0.3
 
     def __init__(self):
         super().__init__()
@@ -293,6 +714,15 @@ class TikzGUI(QWidget):
         fit_window_btn = QPushButton("Fit to Window")
         zoom_label = QLabel("Zoom: 100%")
         self.zoom_label = zoom_label
+        vector_box = QCheckBox("Vector")
+        vector_box.setToolTip("Re-render the PDF at every zoom level instead of scaling the bitmap")
+        vector_box.toggled.connect(self.preview.setVectorMode)
+        # TeX engine for documents without a "% !TEX program" line
+        self.engine_box = QComboBox()
+        self.engine_box.addItems(available_engines() or [DEFAULT_ENGINE])
+        self.engine_box.setCurrentText(DEFAULT_ENGINE)
+        self.engine_box.setToolTip("TeX engine; a '% !TEX program = ...' line in the document wins")
+        self.engine_box.currentTextChanged.connect(lambda _: self._kick_compile())
 
         # Connect zoom button events
         zoom_in_btn.clicked.connect(self._zoom_in)
@@ -307,11 +737,24 @@ class TikzGUI(QWidget):
         zoom_controls.addWidget(reset_zoom_btn)
         zoom_controls.addWidget(fit_window_btn)
         zoom_controls.addWidget(zoom_label)
+        zoom_controls.addWidget(vector_box)
+
+        # Stage timings of the last compiles, hidden until "Profile" is ticked
+        self.profile_view = QPlainTextEdit()
+        self.profile_view.setReadOnly(True)
+        self.profile_view.setMaximumHeight(220)
+        self.profile_view.setVisible(False)
+        profile_box = QCheckBox("Profile")
+        profile_box.setToolTip("Show where the time of the last compiles went")
+        profile_box.toggled.connect(self.profile_view.setVisible)
+        zoom_controls.addWidget(profile_box)
+        self._profiles = []             # records of this session's recent compiles
 
         # Right panel layout (preview + zoom controls)
         right_panel = QVBoxLayout()
         right_panel.addWidget(self.preview, 1)
         right_panel.addLayout(zoom_controls)
+        right_panel.addWidget(self.profile_view)
 
         # Main editor buttons
         open_btn         = QPushButton("Open")
@@ -327,6 +770,7 @@ class TikzGUI(QWidget):
         bar.addWidget(paste_btn)
         bar.addWidget(paste_to_code_btn)
         bar.addWidget(preview_code_btn)  # ADD NEW BUTTON
+        bar.addWidget(self.engine_box)
         bar.addWidget(compile_btn)
         
         left = QVBoxLayout()
@@ -340,18 +784,34 @@ class TikzGUI(QWidget):
 
         self.compiler = Compiler()
         self.compiler.done.connect(self._update_preview)
+        self._latest_generation = 0
+        QApplication.instance().aboutToQuit.connect(self.compiler.shutdown)
 
         # reactive compile after idle typing (for all editors)
         self.timer = QTimer(self)
         self.timer.setSingleShot(True)
         self.timer.timeout.connect(self._kick_compile)
-        
+        self._compile_ema_ms = None     # moving average of recent compile times
+        self._compile_started = None    # (generation, start time)
+        self._compiled_key = None       # fingerprint of the last document sent
+        self._prepared = None           # (tab index, document) until the next edit
+        self.tabs.currentChanged.connect(lambda _: self._invalidate_document())
+
+        # SyncTeX: click in the preview -> source line, cursor -> preview box
+        self._synctex = None            # SyncTexIndex of the document shown
+        self._compiled_layout = None    # where the tikz code sat in that document
+        self._shown_layout = None
+        self.preview.clicked.connect(self._preview_clicked)
+        for editor in (self.tikz_editor, self.document_editor, self.code_editor):
+            editor.cursorPositionChanged.connect(
+                lambda editor=editor: self._cursor_moved(editor))
+
         # Connect text changes from all editors to trigger compilation
-        self.tikz_editor.textChanged.connect(lambda: self.timer.start(self.DEBOUNCE_MS))
-        self.document_editor.textChanged.connect(lambda: self.timer.start(self.DEBOUNCE_MS))
-        self.code_editor.textChanged.connect(lambda: self.timer.start(self.DEBOUNCE_MS))
-        
-        compile_btn.clicked.connect(self._kick_compile)
+        for editor in (self.tikz_editor, self.document_editor, self.code_editor):
+            editor.document().contentsChange.connect(
+                lambda pos, removed, added, editor=editor: self._text_edited(editor, pos, added))
+
+        compile_btn.clicked.connect(lambda: self._compile_document(self._prepare_document()))
         preview_code_btn.clicked.connect(self._preview_code)  # CONNECT NEW BUTTON
         open_btn.clicked.connect(self._open)
         save_btn.clicked.connect(self._save)
@@ -379,14 +839,48 @@ class TikzGUI(QWidget):
         zoom_percent = int(self.preview.zoom_factor * 100)
         self.zoom_label.setText(f"Zoom: {zoom_percent}%")
 
+    # -------------- compile scheduling ---------------------------------------
+    def _debounce_ms(self):
+        if self._compile_ema_ms is None:
+            return self.DEBOUNCE_MS
+        return int(min(self.MAX_DEBOUNCE_MS, max(self.MIN_DEBOUNCE_MS, self._compile_ema_ms)))
+
+    def _record_compile_time(self, generation):
+        if not self._compile_started or self._compile_started[0] != generation:
+            return
+        elapsed_ms = (time.perf_counter() - self._compile_started[1]) * 1000
+        self._compile_started = None
+        if self._compile_ema_ms is None:
+            self._compile_ema_ms = elapsed_ms
+        else:
+            a = self.COMPILE_EMA_ALPHA
+            self._compile_ema_ms = a * elapsed_ms + (1 - a) * self._compile_ema_ms
+        print(f"Compiled in {elapsed_ms:.0f} ms, debounce now {self._debounce_ms()} ms")
+
+    def _invalidate_document(self):
+        self._prepared = None
+
+    def _text_edited(self, editor, pos, added):
+        """Schedule a compile; at once when the edit completes a statement"""
+        self._invalidate_document()
+        delay = self._debounce_ms()
+        if 0 < added < 100:             # typed rather than pasted or loaded
+            block = editor.document().findBlock(pos + added)
+            typed = block.text()[:pos + added - block.position()]
+            if STRUCTURAL_EDIT_RE.search(typed):
+                delay = 0
+        self.timer.start(delay)
+
     # -------------- compilation helpers -------------------------------------- 
     def _prepare_document(self):
         """Prepare the document for compilation/preview"""
         current_tab_index = self.tabs.currentIndex()
+        if self._prepared and self._prepared[0] == current_tab_index:
+            return self._prepared[1]       # no edit since it was built
         
         if current_tab_index == 2:  # code tab
             # Use complete code directly from RawTextEdit
-            full_document = self.code_editor.getRawText() or self.code_editor.toPlainText()
+            full_document = self.code_editor.getRawText()
         else:
             # Combine document template and tikzpicture code
             doc_template = self.document_editor.toPlainText()
@@ -399,6 +893,7 @@ class TikzGUI(QWidget):
                 # Fallback: direct concatenation
                 full_document = doc_template + "\n" + tikz_code
         
+        self._prepared = (current_tab_index, full_document)
         return full_document
 
     def _preview_code(self):
@@ -413,8 +908,12 @@ class TikzGUI(QWidget):
             self._compile_document(full_document)
 
     def _kick_compile(self):
-        """Compile based on the active tab"""
+        """Compile based on the active tab, unless only whitespace or comments changed"""
         full_document = self._prepare_document()
+        key = document_fingerprint(full_document, self.engine_box.currentText())
+        if key == self._compiled_key:
+            print("Skipping compilation: no change TeX would see")
+            return
         self._compile_document(full_document)
 
     def _compile_document(self, full_document):
@@ -426,18 +925,112 @@ class TikzGUI(QWidget):
         print(f"Compiling document ({len(full_document)} characters)")
         print(f"First 300 characters: {repr(full_document[:300])}")
         
-        self.compiler.compile_async(full_document)
+        self.timer.stop()
+        engine = self.engine_box.currentText()
+        self._compiled_key = document_fingerprint(full_document, engine)
+        self._compiled_layout = self._document_layout()
+        self._latest_generation = self.compiler.compile_async(full_document, engine)
+        self._compile_started = (self._latest_generation, time.perf_counter())
 
-    def _update_preview(self, img_path: Path, log: str):
-        if img_path and img_path.exists():
-            pixmap = QPixmap(str(img_path))
-            self.preview.setPixmap(pixmap)
+    def _update_preview(self, generation: int, pdf_data: bytes, png_data: bytes, log: str,
+                        synctex=None, profile=None):
+        if generation != self._latest_generation:
+            print(f"Dropping result of superseded compilation #{generation}")
+            return
+        self._record_compile_time(generation)
+        profile = profile or Profile("qt compile")
+        pixmap = QPixmap()
+        with profile.stage("png decode"):
+            loaded = bool(png_data) and pixmap.loadFromData(png_data, "PNG")
+        if loaded:
+            with profile.stage("qt repaint"):
+                self.preview.setPixmap(pixmap, pdf_data)
+                self.preview.canvas.repaint()   # paint now, so it is timed
             self._update_zoom_label()
+            self._synctex = synctex
+            self._shown_layout = self._compiled_layout
             print("Preview updated successfully")
         else:
             # Print to console instead of showing popup
             print(f"Compilation failed:\n{log}")
-            self.preview.setText("Compilation failed (see console for details)")
+            self.preview.setText(f"Compilation failed:\n{log}")
+            self._synctex = None
+        self._show_profile(profile.finish(ok=loaded))
+
+    def _show_profile(self, record):
+        """Print the stage timings and refresh the profile panel"""
+        self._profiles = (self._profiles + [record])[-50:]
+        print("Compile profile:\n" + format_record(record))
+        text = "Last compile\n" + format_record(record)
+        if len(self._profiles) > 1:
+            text += "\n\nThis session\n" + format_aggregate(aggregate(self._profiles))
+        if TRACE_FILE:
+            text += f"\n\nTrace: {TRACE_FILE}"
+        self.profile_view.setPlainText(text)
+
+    # -------------- SyncTeX ----------------------------------------------------
+    def _document_layout(self):
+        """(first document line of the tikz code, its line count); None for the code tab"""
+        if self.tabs.currentIndex() == 2:
+            return None
+        template = self.document_editor.toPlainText()
+        tikz_lines = self.tikz_editor.toPlainText().count("\n") + 1
+        pos = template.find("{code}")
+        if pos == -1:                   # appended after the template
+            return template.count("\n") + 2, tikz_lines
+        return template[:pos].count("\n") + 1, tikz_lines
+
+    def _source_line(self, line):
+        """(editor, line) a line of the compiled document came from"""
+        layout = self._shown_layout
+        if layout is None:
+            return self.code_editor, line
+        start, count = layout
+        if line < start:
+            return self.document_editor, line
+        if line < start + count:
+            return self.tikz_editor, line - start + 1
+        return self.document_editor, line - count + 1
+
+    def _document_line(self, editor, line):
+        """Line of the compiled document for a line of editor, None if not in it"""
+        layout = self._shown_layout
+        if (layout is None) != (editor is self.code_editor):
+            return None
+        if layout is None:
+            return line
+        start, count = layout
+        if editor is self.tikz_editor:
+            return start + line - 1
+        return line if line <= start else line + count - 1
+
+    def _preview_clicked(self, x, y):
+        """Move the cursor to the source of what was clicked"""
+        if self._synctex is None:
+            print("No SyncTeX data for this preview")
+            return
+        line = self._synctex.edit(1, x, y)
+        if line is None:
+            return
+        editor, source_line = self._source_line(line)
+        print(f"Preview ({x:.0f}, {y:.0f}) pt -> line {source_line}")
+        block = editor.document().findBlockByNumber(source_line - 1)
+        if not block.isValid():
+            return
+        self.tabs.setCurrentWidget(editor)
+        cursor = editor.textCursor()
+        cursor.setPosition(block.position())
+        editor.setTextCursor(cursor)
+        editor.ensureCursorVisible()
+        editor.setFocus()
+
+    def _cursor_moved(self, editor):
+        """Highlight the preview boxes of the line under the cursor"""
+        if self._synctex is None or editor is not self.tabs.currentWidget():
+            return
+        line = self._document_line(editor, editor.textCursor().blockNumber() + 1)
+        found = self._synctex.view(line) if line is not None else None
+        self.preview.setHighlight(found[1] if found and found[0] == 1 else None)
 
     def _open(self):
         """Open file into the currently active tab"""
@@ -487,7 +1080,7 @@ class TikzGUI(QWidget):
             elif current_tab_index == 1:
                 content = self.document_editor.toPlainText()
             else:  # current_tab_index == 2
-                content = self.code_editor.getRawText() or self.code_editor.toPlainText()
+                content = self.code_editor.getRawText()
             
             # Write file as raw bytes
             with open(path, 'wb') as f:
@@ -6,6 +6,8 @@
 import os, sys, subprocess, tempfile, shutil, threading
 from pathlib import Path
 
+from compile_daemon import DaemonError, daemon_address, daemon_compile
+
 from PySide6.QtCore import Qt, QTimer, Signal, QObject
 from PySide6.QtGui  import QPixmap, QFontDatabase
 from PySide6.QtWidgets import (
@@ -39,6 +41,17 @@ class Compiler(QObject):
         tex = tmp / "figure.tex"
         tex.write_text(create_latex_document(tikz_code), encoding="utf8")
 
+        if daemon_address():
+            try:
+                result = daemon_compile(create_latex_document(tikz_code), png=True)
+                png = tmp / "figure.png"
+                if result["png"]:
+                    png.write_bytes(result["png"])
+                self.done.emit(png, result["log"])
+                return
+            except DaemonError as e:
+                print(f"Compile daemon unavailable, compiling locally: {e}")
+
         try:
             subprocess.run(
                 ["pdflatex", "-halt-on-error", "-interaction=batchmode", tex.name],
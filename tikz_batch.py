@@ -0,0 +1,216 @@
+# tikz_batch.py
+# Compiles many TikZ snippets in parallel with the editors' compile pipeline
+# (latex_compile: compile cache, precompiled preamble, engine selection) and
+# rasterizes them to PNG and/or SVG.
+#
+#   python tikz_batch.py figures/ -o out/              # *.tikz and *.tex files
+#   python tikz_batch.py snippets.jsonl -o out/ --svg --jobs 8
+#
+# JSONL lines look like {"id": "fig1", "code": "\\begin{tikzpicture}...}".
+# Snippets without \documentclass are wrapped in the standalone TikZ
+# preamble, or in --template (a document with a {code} placeholder, as in
+# tikzEditor's document tab).
+#
+# out/manifest.jsonl gets one line per finished snippet with its timings and
+# first error. A rerun skips snippets whose code has not changed since they
+# were recorded, so an interrupted batch resumes where it stopped;
+# --retry-failed compiles the failed ones again. Snippet ids (file stems or
+# "id" fields) must be unique; the exit status is 1 if any snippet failed.
+
+import os, sys, json, time, argparse, subprocess
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from latex_compile import (FORMAT_CACHE, cache_key, compile_document, document_engine,
+                           get_engine, pdf_to_png, pdf_to_svg, split_preamble)
+from latex_log import parse_log
+from latex_templates import make_tikz_document
+
+SNIPPET_SUFFIXES = (".tikz", ".tex")
+
+def load_snippets(source: Path):
+    """[(id, code)] from a directory of .tikz/.tex files or a JSONL file.
+
+    Raises ValueError if two snippets have the same id, since they would
+    write the same output files and manifest entry.
+    """
+    snippets, origins = [], {}
+
+    def add(snippet_id, code, origin):
+        if snippet_id in origins:
+            raise ValueError(f"{origin}: snippet id {snippet_id!r} is already used by "
+                             f"{origins[snippet_id]}")
+        origins[snippet_id] = origin
+        snippets.append((snippet_id, code))
+
+    if source.is_dir():
+        for path in sorted(source.iterdir()):
+            if path.suffix in SNIPPET_SUFFIXES:
+                add(path.stem, path.read_text(encoding="utf-8"), path)
+        return snippets
+    with open(source, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            code = item.get("code") or item.get("tikz") or item.get("source")
+            if code is None:
+                raise ValueError(f"{source}:{number}: expected a 'code' field")
+            add(str(item.get("id", number)), code, f"{source}:{number}")
+    return snippets
+
+def id_error(snippet_id: str):
+    """Why snippet_id cannot name output files, or None if it can"""
+    if not snippet_id.strip():
+        return "empty snippet id"
+    if any(c in snippet_id for c in "/\\\0") or ".." in snippet_id or ":" in snippet_id:
+        return f"snippet id {snippet_id!r} contains a path separator or '..'"
+    return None
+
+def make_document(code: str, template=None) -> str:
+    if "\\documentclass" in code:
+        return code
+    if template:
+        return template.replace("{code}", code)
+    return make_tikz_document(code)
+
+def read_manifest(path: Path):
+    """Latest manifest entry per snippet id"""
+    entries = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue            # line cut short by an interrupted run
+                entries[entry["id"]] = entry
+    return entries
+
+def new_entry(job, error=None):
+    """Manifest entry of a job, failed with error if given"""
+    snippet_id, document, _, formats, dpi, engine, _ = job
+    return {"id": snippet_id, "hash": cache_key(document, engine, formats, dpi),
+            "ok": False, "error": error, "outputs": [], "compile_ms": 0.0}
+
+def compile_snippet(job):
+    """Compile one snippet and write its outputs; runs in a pool process.
+
+    Never raises: whatever goes wrong ends up in the entry's error.
+    """
+    snippet_id, document, out_dir, formats, dpi, engine, timeout = job
+    entry = new_entry(job, id_error(snippet_id))
+    if entry["error"]:
+        return entry                    # outputs are named after the id
+    start = time.perf_counter()
+    try:
+        pdf_data, log = compile_document(document, passes=1, precompile_preamble=True,
+                                         timeout=timeout, engine=engine)
+    except subprocess.TimeoutExpired:
+        pdf_data, log = None, f"Compilation timed out (>{timeout:.0f} s)"
+    except Exception as e:              # engine missing, container session failed...
+        pdf_data, log = None, f"Compilation failed: {type(e).__name__}: {e}"
+    entry["compile_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    if pdf_data is None:
+        first = parse_log(log).first_error
+        entry["error"] = str(first) if first else log[-500:].strip() or "Compilation failed, no log"
+        return entry
+
+    start = time.perf_counter()
+    out_dir = Path(out_dir)
+    outputs = {"pdf": pdf_data}
+    try:
+        if "png" in formats:
+            outputs["png"] = pdf_to_png(pdf_data, dpi)
+        if "svg" in formats:
+            outputs["svg"] = pdf_to_svg(pdf_data)
+    except Exception as e:
+        entry["error"] = f"Rasterization failed: {e}"
+    entry["raster_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    for suffix, data in outputs.items():
+        if data is None:
+            entry["error"] = f"{suffix.upper()} conversion failed"
+            continue
+        path = out_dir / f"{snippet_id}.{suffix}"
+        try:
+            path.write_bytes(data)
+        except OSError as e:
+            entry["error"] = f"Cannot write {path}: {e}"
+            continue
+        entry["outputs"].append(path.name)
+    entry["ok"] = entry["error"] is None
+    return entry
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile TikZ snippets in parallel")
+    parser.add_argument("source", type=Path, help="directory of .tikz/.tex files or a JSONL file")
+    parser.add_argument("-o", "--output", type=Path, default=Path("tikz_out"))
+    parser.add_argument("--template", type=Path, help="document template with a {code} placeholder")
+    parser.add_argument("--svg", action="store_true", help="also write SVG")
+    parser.add_argument("--no-png", action="store_true", help="do not write PNG")
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--engine", default=None, help="TeX engine (default: pdflatex)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="parallel compiles")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds per snippet")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="compile snippets that failed in an earlier run again")
+    args = parser.parse_args()
+
+    engine = get_engine(args.engine).name
+    formats = [f for f, on in (("png", not args.no_png), ("svg", args.svg)) if on]
+    template = args.template.read_text(encoding="utf-8") if args.template else None
+    args.output.mkdir(parents=True, exist_ok=True)
+    manifest_path = args.output / "manifest.jsonl"
+    done = read_manifest(manifest_path)
+
+    try:
+        snippets = load_snippets(args.source)
+    except ValueError as e:
+        parser.error(str(e))
+
+    jobs = []
+    skipped = 0
+    for snippet_id, code in snippets:
+        document = make_document(code, template)
+        doc_engine = document_engine(document, engine)
+        previous = done.get(snippet_id)
+        if previous and previous["hash"] == cache_key(document, doc_engine, formats, args.dpi) \
+                and (previous["ok"] or not args.retry_failed):
+            skipped += 1
+            continue
+        jobs.append((snippet_id, document, str(args.output), formats, args.dpi, doc_engine,
+                     args.timeout))
+    print(f"{len(jobs)} snippet(s) to compile, {skipped} already in {manifest_path}")
+    if not jobs:
+        return
+
+    # Build each shared format once here instead of racing in every worker
+    for preamble, name in {(split_preamble(job[1])[0], job[5]) for job in jobs}:
+        if preamble is not None and get_engine(name).formats:
+            FORMAT_CACHE.ensure(preamble, get_engine(name).binary)
+
+    start = time.perf_counter()
+    failed = 0
+    with open(manifest_path, "a", encoding="utf-8") as manifest, \
+            ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(compile_snippet, job): job for job in jobs}
+        for count, future in enumerate(as_completed(futures), 1):
+            try:
+                entry = future.result()
+            except Exception as e:      # worker process died
+                entry = new_entry(futures[future], f"Worker failed: {type(e).__name__}: {e}")
+            # One line per snippet, flushed at once, so an interrupted run
+            # loses at most the snippets still in flight
+            manifest.write(json.dumps(entry) + "\n")
+            manifest.flush()
+            error = (entry["error"] or "").strip().splitlines() or ["unknown error"]
+            status = "ok" if entry["ok"] else f"FAILED: {error[0]}"
+            failed += not entry["ok"]
+            print(f"[{count}/{len(jobs)}] {entry['id']} {entry['compile_ms']:.0f} ms {status}",
+                  flush=True)
+    print(f"Done in {time.perf_counter() - start:.1f} s: {len(jobs) - failed} ok, {failed} failed")
+    if failed:
+        sys.exit(1)                     # so scripts and CI notice
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# tikz_external.py
+# Automatic externalization of the tikzpicture environments of a document:
+# every picture is compiled once on its own (through the compile cache) and
+# the document then includes the resulting PDF instead of recomputing it.
+
+import re
+
+from latex_compile import cache_key, compile_document, document_engine, split_preamble
+from tikz_index import tikz_spans
+
+# Appended to the document preamble to typeset one picture on a page of
+# exactly its size, with the document's own class, fonts and macros
+PICTURE_SETUP = (
+    "\\usepackage[active,tightpage]{preview}\n"
+    "\\PreviewEnvironment{tikzpicture}\n"
+    "\\setlength\\PreviewBorder{0pt}\n"
+)
+
+# Pictures that depend on where they are placed in the document cannot be
+# typeset separately
+KEEP_INLINE_RE = re.compile(
+    r"remember picture|overlay|baseline|#"
+    r"|\\(?:ref|pageref|eqref|autoref|label|cite\w*|the(?!ta\b)[a-zA-Z]+)\b")
+
+def picture_document(preamble: str, picture: str) -> str:
+    return preamble + PICTURE_SETUP + "\\begin{document}\n" + picture + "\n\\end{document}\n"
+
+def externalize(source: str, engine=None, precompile_preamble=True, timeout=30,
+                deadline=None):
+    """Replace the tikzpictures of source with \\includegraphics of their own PDF.
+
+    Pictures are compiled with compile_document(), so one is only typeset
+    again when it or the preamble changes. A picture that cannot be
+    compiled alone stays inline, where the main compile reports its error.
+    The replacement keeps the picture's line count so error lines still
+    match the source. timeout bounds each TeX run, deadline
+    (time.monotonic()) all pictures together.
+    Returns (new source, {file name: pdf bytes}, stats dict).
+    """
+    stats = {"pictures": 0, "externalized": 0, "inline": 0}
+    preamble, body = split_preamble(source)
+    if preamble is None:
+        return source, {}, stats
+    engine = document_engine(source, engine)
+
+    files = {}
+    parts = []
+    pos = 0
+    for start, end in tikz_spans(body):
+        picture = body[start:end]
+        stats["pictures"] += 1
+        if KEEP_INLINE_RE.search(picture):
+            stats["inline"] += 1
+            continue
+        document = picture_document(preamble, picture)
+        pdf_data, _ = compile_document(document, passes=1, engine=engine, timeout=timeout,
+                                       precompile_preamble=precompile_preamble,
+                                       deadline=deadline)
+        if pdf_data is None:
+            stats["inline"] += 1
+            continue
+        name = f"tikzext-{cache_key(document, engine)[:16]}.pdf"
+        files[name] = pdf_data
+        stats["externalized"] += 1
+        parts.append(body[pos:start])
+        parts.append(f"\\includegraphics{{{name}}}" + "%\n" * picture.count("\n"))
+        pos = end
+    if not files:
+        return source, {}, stats
+    parts.append(body[pos:])
+    # graphicx is already loaded by tikz; loading it again is harmless. No
+    # newline, so the body keeps its line numbers
+    new_source = preamble + "\\usepackage{graphicx}" + "".join(parts)
+    return new_source, files, stats
+
+def compile_externalized(source: str, passes="auto", precompile_preamble=False, timeout=30,
+                         engine=None, deadline=None):
+    """compile_document() with the tikzpictures externalized.
+
+    Falls back to compiling the original source if the externalized one
+    fails, so the error is reported against the code the user wrote.
+    deadline (time.monotonic()) bounds the pictures and the document
+    together, where timeout only bounds each TeX run.
+    Returns (pdf_data, log, stats).
+    """
+    engine = document_engine(source, engine)
+    new_source, files, stats = externalize(source, engine, precompile_preamble=precompile_preamble,
+                                         timeout=timeout, deadline=deadline)
+    if files:
+        pdf_data, log = compile_document(new_source, passes=passes, timeout=timeout,
+                                         precompile_preamble=precompile_preamble,
+                                         engine=engine, files=files, deadline=deadline)
+        if pdf_data is not None:
+            return pdf_data, log, stats
+    pdf_data, log = compile_document(source, passes=passes, timeout=timeout,
+                                     precompile_preamble=precompile_preamble, engine=engine,
+                                     deadline=deadline)
+    return pdf_data, log, stats
@@ -0,0 +1,152 @@
+# tikz_index.py
+# Index of the tikzpicture environments of a LaTeX document, built by one
+# tokenizer pass that understands comments, nesting and verbatim blocks.
+
+import re
+
+# Order matters: an escaped backslash or percent sign must be consumed
+# before "%" can start a comment
+TOKEN_RE = re.compile(
+    r"\\\\|\\%"
+    r"|%[^\n]*"
+    r"|\\begin\{(verbatim\*?|Verbatim|lstlisting|minted|comment)\}"
+    r"|\\(begin|end)\{tikzpicture\}"
+)
+
+BEGIN_PICTURE = "\\begin{tikzpicture}"
+END_DOCUMENT = "\\end{document}"
+
+def _scan(text: str):
+    """(spans, closed) of text.
+
+    closed is False when text ends inside a picture, a verbatim block or a
+    comment, which changes how whatever follows it reads.
+    """
+    spans = []
+    depth = 0
+    start = 0
+    pos = 0
+    closed = True
+    while True:
+        match = TOKEN_RE.search(text, pos)
+        if match is None:
+            break
+        pos = match.end()
+        if match.group(1):
+            # Skip to the end of the verbatim-like environment
+            end = text.find(f"\\end{{{match.group(1)}}}", pos)
+            if end == -1:
+                closed = False
+            pos = len(text) if end == -1 else end
+        elif match.group(2) == "begin":
+            if depth == 0:
+                start = match.start()
+            depth += 1
+        elif match.group(2) == "end" and depth:
+            depth -= 1
+            if depth == 0:
+                spans.append((start, match.end()))
+        elif match.group(0).startswith("%") and match.end() == len(text):
+            closed = False              # comment runs on into the next text
+    return spans, closed and depth == 0
+
+def tikz_spans(text: str):
+    """(start, end) of every outermost tikzpicture environment in text"""
+    return _scan(text)[0]
+
+def _split(text: str, spans):
+    """text as alternating text and picture segments, text first and last"""
+    segments = []
+    pos = 0
+    for start, end in spans:
+        segments.append(text[pos:start])
+        segments.append(text[start:end])
+        pos = end
+    segments.append(text[pos:])
+    return segments
+
+class TikzIndex:
+    """The document as alternating text and picture segments.
+
+    segments[0], segments[2], ... are the text between pictures and
+    segments[1], segments[3], ... the pictures themselves, so looking up or
+    replacing the Nth picture touches one list slot instead of rescanning or
+    copying the document; the text is joined again only when asked for.
+    """
+
+    def __init__(self, text: str):
+        self.segments = _split(text, tikz_spans(text))
+        self._text = text
+
+    def __len__(self):
+        return len(self.segments) // 2
+
+    def copy(self):
+        """Independent index of the same text; the segment strings are shared"""
+        other = TikzIndex.__new__(TikzIndex)
+        other.segments = list(self.segments)
+        other._text = self._text
+        return other
+
+    def __getitem__(self, n: int) -> str:
+        return self.segments[self._slot(n)]
+
+    def _slot(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(f"picture {n} out of range, document has {len(self)}")
+        return 2 * n + 1
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self.segments)
+        return self._text
+
+    def _splice(self, first, last, before, inserted, after):
+        """Put before + inserted + after in place of segments[first:last + 1].
+
+        Only inserted is tokenized: it may hold no picture (a bare \\draw)
+        or several. Text that does not close what it opens changes how the
+        rest of the document reads, so then the whole index is rebuilt.
+        """
+        spans, closed = _scan(inserted)
+        if not closed:
+            self.__init__("".join(self.segments[:first]) + before + inserted + after
+                          + "".join(self.segments[last + 1:]))
+            return
+        parts = _split(inserted, spans)
+        parts[0] = before + parts[0]
+        parts[-1] += after
+        self.segments[first:last + 1] = parts
+        self._text = None
+
+    def replace(self, n: int, picture: str):
+        """Replace the Nth picture with picture"""
+        slot = self._slot(n)
+        self._splice(slot - 1, slot + 1, self.segments[slot - 1], picture,
+                     self.segments[slot + 1])
+
+    def append(self, picture: str):
+        """Add picture as a new figure before \\end{document} (or at the end)"""
+        last = len(self.segments) - 1
+        tail = self.segments[last]
+        pos = tail.rfind(END_DOCUMENT)
+        if pos == -1:
+            self._splice(last, last, tail + "\n\n", picture, "")
+        else:
+            self._splice(last, last, tail[:pos] + "\n\\section{New Figure}\n", picture,
+                         "\n\n" + tail[pos:])
+
+    def line_of(self, n: int) -> int:
+        """1-based line on which the Nth picture starts"""
+        slot = self._slot(n)
+        return 1 + sum(segment.count("\n") for segment in self.segments[:slot])
+
+    def label(self, n: int, width=50) -> str:
+        """Short description of the Nth picture for selection lists"""
+        code = " ".join(self[n][len(BEGIN_PICTURE):].split())
+        if len(code) > width:
+            code = code[:width - 3] + "..."
+        return f"Picture {n + 1} (line {self.line_of(n)}): {code}"